@@ -0,0 +1,217 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+import http_client
+import image_dedup
+import manifest
+import metrics
+import tracing
+from download_method import (download_pic, download_video, image_target, expected_length, reuse_indexed,
+                             new_hasher, index_download, IncompleteDownloadError, CHUNK_SIZE,
+                             video_connections, print, cprint)
+
+try:
+    import aiohttp  # 可选依赖，未安装时退化为有界线程池
+except ImportError:
+    aiohttp = None
+
+try:
+    import aiofiles  # 可选依赖，未安装时在默认线程池中写文件
+except ImportError:
+    aiofiles = None
+
+"""
+异步下载引擎
+
+使用单个asyncio事件循环并发下载图片和视频，替代每个文件创建一个线程的方式。
+
+主要功能:
+- 单个事件循环线程，可配置的并发上限(config.async_concurrency)
+- 线程安全的submit接口，Selenium生产者/消费者线程可直接提交任务
+- 流式分块写入临时文件(.part)，校验Content-Length后原子重命名，异步写文件(安装aiofiles时)
+- 未安装aiohttp时自动退化为有界线程池执行同步下载方法
+- 视频交给download_method.download_video执行，共用断点续传和video_connections限制
+
+主要类:
+- AsyncDownloadEngine: 异步下载引擎
+"""
+
+
+class AsyncDownloadEngine:
+    def __init__(self, concurrency=None, log_print=print, log_cprint=cprint):
+        self.concurrency = concurrency or config.async_concurrency
+        self.log_print = log_print
+        self.log_cprint = log_cprint
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.semaphore = None
+        self.executor = None  # 未安装aiohttp时用于执行同步下载方法
+        self.video_executor = None  # 视频下载线程池，并发受download_method.video_sema限制
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def start(self):
+        """启动事件循环线程，返回引擎自身"""
+        self.thread = threading.Thread(target=self._run_loop, name="AsyncDownloadEngine", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._setup())
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self._teardown())
+        self.loop.close()
+
+    async def _setup(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.video_executor = ThreadPoolExecutor(max_workers=video_connections)
+        if aiohttp is None:
+            self.log_print("未安装aiohttp库，异步下载引擎将使用有界线程池执行下载")
+        elif http_client.get_hook() is not None:
+            # 录制或回放会话时所有请求都需要经过http_client的钩子
+            self.log_print("正在录制或回放会话，异步下载引擎将使用有界线程池执行下载")
+        else:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=config.http_pool_size)
+            self.session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': http_client.USER_AGENT})
+        if self.session is None:
+            self.executor = ThreadPoolExecutor(max_workers=min(self.concurrency, config.http_pool_size))
+
+    async def _teardown(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.video_executor.shutdown(wait=False)
+
+    @property
+    def in_flight(self):
+        """已提交但尚未完成的下载数量"""
+        return self._in_flight
+
+    def submit(self, post_link, url, folder, kind='image'):
+        """
+        线程安全地提交一个下载任务
+
+        Args:
+            post_link: 帖子链接，可为None
+            url: 媒体URL
+            folder: 保存文件夹
+            kind: 'image'或'video'
+
+        Returns:
+            concurrent.futures.Future
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._idle.clear()
+        future = asyncio.run_coroutine_threadsafe(self._download(post_link, url, folder, kind), self.loop)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.set()
+
+    def join(self, timeout=None):
+        """等待所有已提交的下载完成，返回是否在超时前全部完成"""
+        return self._idle.wait(timeout)
+
+    def stop(self):
+        """停止事件循环并关闭连接"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+
+    async def _download(self, post_link, url, folder, kind):
+        if kind != 'image':
+            # 视频需要断点续传和分段下载，使用同步方法
+            await self.loop.run_in_executor(self.video_executor, download_video, url, folder, post_link)
+            return
+        async with self.semaphore:
+            if self.session is None:
+                await self.loop.run_in_executor(self.executor, download_pic, post_link, url, folder)
+            else:
+                await self._download_image(post_link, url, folder)
+
+    async def _download_image(self, post_link, url, folder):
+        started = time.time()
+        filename, filepath = image_target(url, folder)
+        if os.path.exists(filepath):
+            manifest.record(post_link, url, filepath, 'exists', os.path.getsize(filepath), started)
+            return
+        if reuse_indexed(url, filepath):
+            self.log_print(f"{filename} 已在之前的爬取中下载，复用本地文件")
+            manifest.record(post_link, url, filepath, 'reused', os.path.getsize(filepath), started)
+            return
+        if post_link:
+            self.log_print(f"帖子链接{post_link}")
+        self.log_cprint(f"开始下载{url}", "yellow")
+        try:
+            hasher = new_hasher()
+            with tracing.async_span("http_download", "download", url=url):
+                size = await self._fetch_to_file(url, filepath, timeout=10, hasher=hasher)
+            if size is not None:
+                index_download(url, filepath, size, hasher, post_link)
+                manifest.record(post_link, url, filepath, 'downloaded', size, started)
+                self.log_cprint(f"{filename} 下载完成\n", "green")
+                image_dedup.schedule(filepath)
+            else:
+                manifest.record(post_link, url, filepath, 'failed', started=started)
+        except asyncio.TimeoutError:
+            self.log_print(f"下载超时: {url}")
+            manifest.record(post_link, url, filepath, 'timeout', started=started)
+        except Exception as e:
+            self.log_print(f"下载图片时发生错误: {str(e)}")
+            manifest.record(post_link, url, filepath, 'failed', started=started)
+
+    async def _fetch_to_file(self, url, filepath, timeout, hasher=None):
+        """流式下载到临时文件后原子重命名，返回文件大小，状态码不为200时返回None"""
+        with metrics.ACTIVE_DOWNLOADS.track('image'):
+            return await self._fetch(url, filepath, timeout, hasher)
+
+    async def _fetch(self, url, filepath, timeout, hasher):
+        part_path = filepath + '.part'
+        async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                return None
+            expected = expected_length(response.headers)
+            written = 0
+            try:
+                if aiofiles is not None:
+                    async with aiofiles.open(part_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            await f.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            written += len(chunk)
+                            metrics.DOWNLOADED_BYTES.inc('image', amount=len(chunk))
+                else:
+                    with open(part_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            await self.loop.run_in_executor(None, f.write, chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            written += len(chunk)
+                            metrics.DOWNLOADED_BYTES.inc('image', amount=len(chunk))
+                if expected is not None and written != expected:
+                    raise IncompleteDownloadError(f"文件不完整: 已下载 {written} 字节，应为 {expected} 字节")
+            except BaseException:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+        os.replace(part_path, filepath)
+        return written
@@ -0,0 +1,252 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from termcolor import cprint
+import config
+import tracing
+
+"""
+多标签批量爬取模块
+
+将多个标签（或搜索词）分配给多个工作进程并行爬取，每个工作进程拥有自己的浏览器
+（浏览器池在进程内复用，同一进程处理的多个任务之间不重复启动Chrome和登录）。
+所有工作进程共用同一个跨运行媒体索引(config.media_index，SQLite WAL模式支持多进程)，
+同一媒体在不同标签下只下载一次。
+
+指定--shard day/hour时，按时间爬取的部分会将start_time..end_time切分成按天或按小时的分片，
+每个分片使用since:/until:搜索，作为单独的任务并行爬取，结果写入该标签的同一个结果文件夹
+（每个分片使用单独的日志文件和下载清单），全部分片完成后合并下载清单并重新生成image.txt。
+
+任务分发使用按标签的公平调度器：每次有空闲的工作进程时，优先分配给当前正在运行任务数最少
+的标签，相同时轮流分配，一个任务较多的热门标签不会占满所有工作进程导致其他标签一直等待。
+
+主要类:
+- FairScheduler: 按标签公平分配任务
+
+主要函数:
+- run_batch: 并行爬取多个标签
+
+命令行用法:
+    python batch_runner.py [标签 ...] [--workers 4] [--mode all|latest|hot] [--shard day|hour]
+    不指定标签时使用config.tags，config.tags为空时使用config.tag
+"""
+
+MODES = ('all', 'latest', 'hot')
+
+
+class FairScheduler:
+    """按标签公平分配任务：优先分配正在运行任务最少的标签，相同时按轮询顺序"""
+
+    def __init__(self):
+        self.queues = {}  # 标签 -> 待执行任务列表
+        self.running = {}  # 标签 -> 正在运行的任务数
+        self.order = []  # 标签的轮询顺序
+        self.turn = 0
+
+    def add(self, tag, job):
+        if tag not in self.queues:
+            self.queues[tag] = []
+            self.running[tag] = 0
+            self.order.append(tag)
+        self.queues[tag].append(job)
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self.queues.values())
+
+    def next_job(self):
+        """取出下一个任务，返回(标签, 任务)，没有待执行任务时返回(None, None)"""
+        candidates = []
+        for offset in range(len(self.order)):
+            tag = self.order[(self.turn + offset) % len(self.order)]
+            if self.queues[tag]:
+                candidates.append(tag)
+        if not candidates:
+            return None, None
+        # min按轮询顺序遍历，运行任务数相同时取轮询顺序中最靠前的标签
+        tag = min(candidates, key=lambda t: self.running[t])
+        self.turn = (self.order.index(tag) + 1) % len(self.order)
+        self.running[tag] += 1
+        return tag, self.queues[tag].pop(0)
+
+    def done(self, tag):
+        """标记该标签的一个任务已结束"""
+        self.running[tag] -= 1
+
+    def finished(self, tag):
+        """该标签的所有任务是否都已结束"""
+        return not self.queues[tag] and self.running[tag] == 0
+
+
+def _worker_init(media_index_path):
+    """工作进程初始化：所有进程使用同一个媒体索引，进程退出时关闭本进程的浏览器"""
+    from multiprocessing import util
+    import browser_pool
+    config.media_index = media_index_path
+    # 进程池的工作进程退出时不会执行atexit，使用multiprocessing的Finalize关闭浏览器
+    util.Finalize(None, browser_pool.shutdown, exitpriority=10)
+
+
+def _apply_tag(tag):
+    """各模块通过`from config import tag`读取标签，需要同时修改这些模块中的全局变量"""
+    import main
+    import twitter_Crawler
+    config.tag = tag
+    main.tag = tag
+    twitter_Crawler.tag = tag
+
+
+def run_tag_job(tag, mode):
+    """
+    在工作进程中爬取一个标签
+
+    Returns:
+        (标签, 结果文件夹, 耗时秒数)
+    """
+    import main
+    import twitter_Crawler
+    started = time.time()
+    _apply_tag(tag)
+    main.running = True
+    twitter_Crawler.running = True
+
+    result_folder = main.create_result_folder()
+    cprint(f"[{tag}] 开始爬取，结果文件夹: {result_folder}", "blue")
+    if mode in ('all', 'latest'):
+        main.run_twitter_crawler(result_folder)
+    if mode in ('all', 'hot') and main.running:
+        main.run_dz_crawler(result_folder)
+    return tag, result_folder, time.time() - started
+
+
+def run_shard_job(tag, result_folder, since, until):
+    """
+    在工作进程中按时间分片爬取一个标签的[since, until)，结果写入result_folder
+
+    Returns:
+        (标签, 结果文件夹, 耗时秒数)
+    """
+    import main
+    import twitter_Crawler
+    started = time.time()
+    _apply_tag(tag)
+    main.running = True
+    twitter_Crawler.running = True
+
+    log_name = f"download_log_{since.strftime('%Y%m%d_%H%M')}.txt"
+    main.run_twitter_crawler(result_folder, since, until, log_name)
+    return tag, result_folder, time.time() - started
+
+
+def run_hot_job(tag, result_folder):
+    """在工作进程中按热度爬取一个标签，结果写入result_folder"""
+    import main
+    started = time.time()
+    _apply_tag(tag)
+    main.running = True
+    main.run_dz_crawler(result_folder)
+    return tag, result_folder, time.time() - started
+
+
+def _add_sharded_jobs(scheduler, tag, mode, shard):
+    """将标签按时间分片加入调度器，返回该标签的结果文件夹"""
+    import main
+    from search_query import date_range, shard_time_range, format_search_time
+    _apply_tag(tag)
+    result_folder = main.create_result_folder()
+    shards = shard_time_range(*date_range(config.start_time, config.end_time), shard)
+    for since, until in shards:
+        label = f"{tag} {format_search_time(since)}"
+        scheduler.add(tag, (label, run_shard_job, (tag, result_folder, since, until)))
+    if mode == 'all':
+        scheduler.add(tag, (f"{tag} 热度", run_hot_job, (tag, result_folder)))
+    cprint(f"[{tag}] 时间范围切分为 {len(shards)} 个分片，结果文件夹: {result_folder}", "yellow")
+    return result_folder
+
+
+def _merge_shard_results(tag, result_folder):
+    """标签的全部分片完成后，合并各分片的下载清单并重新生成image.txt"""
+    import manifest
+    from save_image_urls import main as save_image_urls
+    folder = os.path.join(result_folder, "time_crawler_result")
+    manifest_file = manifest.merge(folder) if os.path.isdir(folder) else None
+    if manifest_file:
+        save_image_urls(None, folder)
+        cprint(f"[{tag}] 全部分片完成，共下载 {manifest.count_downloaded(manifest_file, 'image')} 张图片", "green")
+
+
+def run_batch(tags, workers=None, mode='all', shard=None):
+    """
+    使用多个进程并行爬取多个标签
+
+    Args:
+        tags: 标签列表
+        workers: 工作进程数，默认config.batch_workers
+        mode: all为时间+热度爬取，latest只按时间爬取，hot只按热度爬取
+        shard: 按时间爬取时的分片单位，'day'或'hour'，默认config.shard_unit，为空时不分片
+
+    Returns:
+        [(标签, 结果文件夹, 耗时秒数)]
+    """
+    tags = list(dict.fromkeys(tags))  # 去重并保持顺序
+    shard = config.shard_unit if shard is None else shard
+    scheduler = FairScheduler()
+    sharded_folders = {}
+    for tag in tags:
+        if shard and mode != 'hot':
+            sharded_folders[tag] = _add_sharded_jobs(scheduler, tag, mode, shard)
+        else:
+            scheduler.add(tag, (tag, run_tag_job, (tag, mode)))
+    workers = max(1, min(workers or config.batch_workers, len(scheduler)))
+
+    media_index_path = os.path.abspath(config.media_index) if config.media_index else config.media_index
+    cprint(f"共 {len(tags)} 个标签 {len(scheduler)} 个任务，使用 {workers} 个工作进程并行爬取", "yellow")
+
+    results = []
+    # 使用spawn启动工作进程，避免fork时复制父进程中的线程和浏览器连接
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_worker_init, initargs=(media_index_path,)) as executor:
+        pending = {}
+        while len(scheduler) or pending:
+            # 保持每个工作进程都有任务，多提交的任务会在进程池中排队，破坏公平调度
+            while len(scheduler) and len(pending) < workers:
+                tag, (label, func, args) = scheduler.next_job()
+                pending[executor.submit(func, *args)] = (tag, label)
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                tag, label = pending.pop(future)
+                scheduler.done(tag)
+                try:
+                    results.append(future.result())
+                    cprint(f"[{label}] 爬取完成，用时 {results[-1][2]:.0f} 秒", "green")
+                except Exception as e:
+                    cprint(f"[{label}] 爬取出错: {str(e)}", "red")
+                if tag in sharded_folders and scheduler.finished(tag):
+                    _merge_shard_results(tag, sharded_folders[tag])
+    # 每个工作进程写入单独的trace文件，全部结束后合并为config.trace_path
+    if tracing.merge():
+        cprint(f"追踪文件已合并: {config.trace_path}（可在https://ui.perfetto.dev中打开）", "green")
+    return results
+
+
+def configured_tags():
+    """config.tags不为空时使用config.tags，否则使用config.tag"""
+    return list(config.tags) or [config.tag]
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="多进程并行爬取多个标签")
+    parser.add_argument("tags", nargs="*", help="要爬取的标签，不指定时使用config.tags")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认config.batch_workers")
+    parser.add_argument("--mode", choices=MODES, default="all", help="all为时间+热度爬取，latest只按时间爬取，hot只按热度爬取")
+    parser.add_argument("--shard", choices=["day", "hour"], default=None, help="按天或按小时切分时间范围并行爬取，默认config.shard_unit")
+    args = parser.parse_args()
+
+    started = time.time()
+    results = run_batch(args.tags or configured_tags(), args.workers, args.mode, args.shard)
+    cprint(f"\n批量爬取完成，共完成 {len(results)} 个任务，总用时 {time.time() - started:.0f} 秒", "green")
+    for folder in dict.fromkeys(folder for _, folder, _ in results):
+        print(folder)
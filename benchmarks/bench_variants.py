@@ -0,0 +1,159 @@
+import io
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_process import iter_tweet_results, parse_tweet, get_max_bitrate_url
+from manga_downloader import queue_tweet_videos
+from seen_set import SeenSet
+
+"""
+视频码率列表提取的微基准测试
+
+对比旧的media_video做法（json_value_find在每一层创建并合并列表、在列表的列表中判断
+variants是否已处理、每个候选链接扫描一遍整个下载队列）和爬虫实际使用的做法
+（GraphQLCapture.poll_tweets：iter_tweet_results + parse_tweet按推文结构读取媒体、
+推文ID用SeenSet去重，再由queue_tweet_videos将最高码率的链接用SeenSet去重后加入队列）。
+新的做法同时解析了推文中的图片和互动数据，做的工作比旧的做法多。
+
+默认使用按SearchTimeline结构生成的响应，也可以传入录制的接口响应JSON文件。
+
+命令行用法:
+    python benchmarks/bench_variants.py [响应.json ...] [--pages 200] [--repeat 3]
+"""
+
+
+def legacy_json_value_find(json_obj, key):
+    # 旧实现：每一层创建新列表并extend
+    results = []
+    if isinstance(json_obj, dict):
+        for k, v in json_obj.items():
+            if k == key:
+                results.append(v)
+            results.extend(legacy_json_value_find(v, key))
+    elif isinstance(json_obj, list):
+        for item in json_obj:
+            results.extend(legacy_json_value_find(item, key))
+    return results
+
+
+def legacy_extract(payloads):
+    """旧的media_video：列表的列表去重，每个候选链接扫描整个队列"""
+    q = queue.Queue()
+    variants_lists = []
+    for res in payloads:
+        for variants in legacy_json_value_find(res, "variants"):
+            if variants not in variants_lists:
+                variants_lists.append(variants)
+                temp = get_max_bitrate_url(variants)
+                if not any(isinstance(item, tuple) and item[1] == temp or item == temp for item in list(q.queue)):
+                    q.put((None, temp))
+    return q.qsize()
+
+
+def shipped_extract(payloads):
+    """爬虫实际使用的做法：与GraphQLCapture.poll_tweets和stream_videos相同"""
+    q = queue.Queue()
+    seen = SeenSet()
+    queued_videos = SeenSet()
+    with redirect_stdout(io.StringIO()):  # queue_tweet_videos会打印每个视频链接
+        for res in payloads:
+            for result in iter_tweet_results(res):
+                tweet = parse_tweet(result)
+                if tweet and seen.add(tweet["tweet_id"]):
+                    queue_tweet_videos(tweet, q, "23", queued_videos)
+    return q.qsize()
+
+
+def make_tweet(tweet_id, with_video):
+    media = [{
+        "type": "photo",
+        "media_url_https": f"https://pbs.twimg.com/media/P{tweet_id}.jpg",
+        "sizes": {size: {"w": 1200, "h": 900, "resize": "fit"} for size in ("large", "medium", "small", "thumb")},
+    }]
+    if with_video:
+        media.append({
+            "type": "video",
+            "media_url_https": f"https://pbs.twimg.com/ext_tw_video_thumb/{tweet_id}/pu/img/x.jpg",
+            "video_info": {
+                "aspect_ratio": [16, 9],
+                "duration_millis": 15000,
+                "variants": [
+                    {"content_type": "application/x-mpegURL",
+                     "url": f"https://video.twimg.com/ext_tw_video/{tweet_id}/pu/pl/x.m3u8"},
+                ] + [
+                    {"bitrate": bitrate, "content_type": "video/mp4",
+                     "url": f"https://video.twimg.com/ext_tw_video/{tweet_id}/pu/vid/{bitrate}/x.mp4"}
+                    for bitrate in (256000, 832000, 2176000)
+                ],
+            },
+        })
+    return {
+        "entryId": f"tweet-{tweet_id}",
+        "content": {"itemContent": {"tweet_results": {"result": {
+            "rest_id": str(tweet_id),
+            "core": {"user_results": {"result": {"legacy": {"screen_name": "user", "description": "x" * 200}}}},
+            "legacy": {
+                "id_str": str(tweet_id),
+                "created_at": "Wed Jun 11 09:00:07 +0000 2025",
+                "full_text": "text " * 40,
+                "entities": {"hashtags": [{"text": "tag"}], "media": media},
+                "extended_entities": {"media": media},
+                "favorite_count": 10,
+            },
+            "views": {"count": "1000"},
+        }}}},
+    }
+
+
+def make_payloads(pages, tweets_per_page=20, video_ratio=0.3):
+    """生成SearchTimeline结构的响应，相邻两页有部分推文重复（模拟滚动时的重复响应）"""
+    payloads = []
+    for page in range(pages):
+        entries = []
+        for i in range(tweets_per_page):
+            tweet_id = 1900000000000000000 + page * (tweets_per_page - 2) + i
+            entries.append(make_tweet(tweet_id, (tweet_id % 10) < video_ratio * 10))
+        payloads.append({"data": {"search_by_raw_query": {"search_timeline": {"timeline": {
+            "instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}}}})
+    return payloads
+
+
+def bench(func, payloads, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = func(payloads)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="视频码率列表提取的微基准测试")
+    parser.add_argument("files", nargs="*", help="录制的接口响应JSON文件，不指定时使用生成的响应")
+    parser.add_argument("--pages", type=int, default=200, help="生成的响应页数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快的一次")
+    args = parser.parse_args()
+
+    if args.files:
+        payloads = []
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8') as f:
+                payloads.append(json.load(f))
+    else:
+        payloads = make_payloads(args.pages)
+    size = sum(len(json.dumps(p)) for p in payloads)
+    print(f"响应数: {len(payloads)}，共 {size / 1024 / 1024:.1f} MB")
+
+    legacy_time, legacy_count = bench(legacy_extract, payloads, args.repeat)
+    shipped_time, shipped_count = bench(shipped_extract, payloads, args.repeat)
+    print(f"旧实现: {legacy_time * 1000:.1f} ms，加入队列 {legacy_count} 个")
+    print(f"当前实现: {shipped_time * 1000:.1f} ms，加入队列 {shipped_count} 个")
+    print(f"加速: {legacy_time / shipped_time:.1f}x")
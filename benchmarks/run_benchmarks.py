@@ -0,0 +1,227 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import timeit
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from json_process import json_value_find, iter_tweet_results, parse_tweet, get_max_bitrate_url
+from manga_downloader import is_post_in_timerange, is_system_continue
+from seen_set import SeenSet
+from save_image_urls import extract_media_urls, get_filename_from_url, save_urls_to_file
+
+"""
+离线微基准测试
+
+使用benchmarks/fixtures中录制的接口响应和下载日志，测量解析、时间过滤和链接处理等热点函数的耗时，
+不需要浏览器和网络。结果可以保存为JSON，与之前版本的结果比较，跟踪性能回退。
+
+每个基准测试重复运行repeat轮，每轮调用number次，取最快的一轮计算单次调用耗时；
+per_item_us为按处理的条目数（推文、链接、日志行等）平均后的耗时。
+
+命令行用法:
+    python benchmarks/run_benchmarks.py [-k 名称关键字] [--repeat 5] [--output 结果.json] [--compare 旧结果.json]
+"""
+
+FIXTURES = os.path.join(BENCH_DIR, "fixtures")
+BENCHMARKS = []  # [(名称, 准备函数)]
+
+
+def benchmark(name):
+    """注册基准测试，准备函数返回(被测函数, 每轮调用次数, 每次调用处理的条目数)"""
+    def decorator(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return decorator
+
+
+def load_timeline():
+    """读取录制的SearchTimeline响应（一页20条推文）"""
+    with open(os.path.join(FIXTURES, "search_timeline_sample.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def sample_media_urls(count):
+    """生成count个不重复的图片下载链接"""
+    return [f"https://pbs.twimg.com/media/Gt{i:013d}?format=png&name=large" for i in range(count)]
+
+
+def sample_post_times(count):
+    return [f"2025-06-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:07.000Z" for i in range(count)]
+
+
+@benchmark("json_value_find")
+def bench_json_value_find():
+    payload = load_timeline()
+    return lambda: json_value_find(payload, "variants"), 50, 1
+
+
+@benchmark("parse_timeline")
+def bench_parse_timeline():
+    # 与GraphQLCapture.poll_tweets相同：遍历推文、解析媒体和互动数据、按推文ID去重
+    payload = load_timeline()
+
+    def run():
+        seen = SeenSet()
+        for result in iter_tweet_results(payload):
+            tweet = parse_tweet(result)
+            if tweet:
+                seen.add(tweet["tweet_id"])
+    return run, 50, sum(1 for _ in iter_tweet_results(payload))
+
+
+@benchmark("get_max_bitrate_url")
+def bench_get_max_bitrate_url():
+    variants_lists = json_value_find(load_timeline(), "variants") * 100
+
+    def run():
+        for variants in variants_lists:
+            get_max_bitrate_url(variants)
+    return run, 20, len(variants_lists)
+
+
+@benchmark("is_post_in_timerange")
+def bench_is_post_in_timerange():
+    post_times = sample_post_times(2000)
+
+    def run():
+        for post_time in post_times:
+            is_post_in_timerange(post_time, "2025-06-05", "2025-06-20")
+    return run, 5, len(post_times)
+
+
+@benchmark("is_system_continue")
+def bench_is_system_continue():
+    post_times = sample_post_times(2000)
+
+    def run():
+        for post_time in post_times:
+            is_system_continue(post_time, "2025-06-05")
+    return run, 5, len(post_times)
+
+
+@benchmark("get_filename_from_url")
+def bench_get_filename_from_url():
+    urls = sample_media_urls(5000)
+
+    def run():
+        for url in urls:
+            get_filename_from_url(url)
+    return run, 5, len(urls)
+
+
+@benchmark("extract_media_urls")
+def bench_extract_media_urls(workdir):
+    # 将录制的日志复制多份，每份中的媒体ID不同，得到约10万行的日志
+    with open(os.path.join(FIXTURES, "download_log_sample.txt"), 'r', encoding='utf-8') as f:
+        sample = f.read()
+    log_path = os.path.join(workdir, "download_log.txt")
+    with open(log_path, 'w', encoding='utf-8') as f:
+        for i in range(3500):
+            f.write(re.sub(r'/media/', f'/media/B{i}_', sample))
+    with open(log_path, 'r', encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    return lambda: extract_media_urls(log_path), 3, lines
+
+
+@benchmark("save_urls_to_file")
+def bench_save_urls_to_file(workdir):
+    # 一半的链接在文件夹中有对应文件
+    urls = sample_media_urls(10000)
+    for url in urls[::2]:
+        open(os.path.join(workdir, get_filename_from_url(url)), 'w').close()
+    output_file = os.path.join(workdir, "image.txt")
+    return lambda: save_urls_to_file(urls, output_file), 3, len(urls)
+
+
+def run_benchmark(name, setup, repeat):
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        with redirect_stdout(io.StringIO()):
+            if setup.__code__.co_argcount:
+                func, number, items = setup(workdir)
+            else:
+                func, number, items = setup()
+            # 被测函数的输出不计入结果
+            timings = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    best = min(timings) / number
+    return {
+        "name": name,
+        "number": number,
+        "repeat": repeat,
+        "items": items,
+        "best_ms": round(best * 1000, 4),
+        "mean_ms": round(sum(timings) / len(timings) / number * 1000, 4),
+        "per_item_us": round(best / items * 1e6, 4),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(keyword=None, repeat=5):
+    """运行名称包含keyword的基准测试，返回可保存为JSON的结果"""
+    results = []
+    for name, setup in BENCHMARKS:
+        if keyword and keyword not in name:
+            continue
+        result = run_benchmark(name, setup, repeat)
+        print(f"{name:<24} {result['best_ms']:>10.3f} ms  {result['per_item_us']:>10.3f} us/条  ({result['items']} 条)")
+        results.append(result)
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "results": results,
+    }
+
+
+def compare(report, baseline_path):
+    """与之前保存的结果比较，ratio大于1表示变慢"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\n与 {baseline_path} 比较:")
+    for result in report["results"]:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        ratio = result["per_item_us"] / old["per_item_us"] if old["per_item_us"] else float("inf")
+        result["baseline_per_item_us"] = old["per_item_us"]
+        result["ratio"] = round(ratio, 3)
+        print(f"{result['name']:<24} {old['per_item_us']:>10.3f} -> {result['per_item_us']:>10.3f} us/条  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线微基准测试")
+    parser.add_argument("-k", dest="keyword", default=None, help="只运行名称包含该关键字的基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="重复轮数，取最快的一轮")
+    parser.add_argument("--output", default=None, help="将结果保存为JSON文件")
+    parser.add_argument("--compare", default=None, help="与之前保存的JSON结果比较")
+    args = parser.parse_args()
+
+    report = run_all(args.keyword, args.repeat)
+    if args.compare:
+        compare(report, args.compare)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
@@ -0,0 +1,262 @@
+import time
+import atexit
+import threading
+import config
+import metrics
+from selenium.common.exceptions import TimeoutException
+from driver_init import initialize_driver, cookies_web
+
+try:
+    import psutil  # 用于结束浏览器池自己启动的Chrome进程树
+except ImportError:
+    psutil = None
+
+"""
+浏览器池模块
+
+保持已登录（访问过登录页并注入cookie）的浏览器实例，按任务分配和回收，
+时间爬虫、点赞爬虫以及UI的多次运行之间复用同一个浏览器，省去每次冷启动Chrome、
+访问登录页和注入cookie的时间。任务之间只做轻量重置（关闭多余窗口、清空会话存储和
+performance日志、回到空白页），cookie保持不变。
+
+关闭时只结束浏览器池自己启动的chromedriver及其子进程，不影响本机其他Chrome。
+
+主要类:
+- BrowserPool: 浏览器池
+
+主要函数:
+- acquire: 从全局浏览器池获取一个已登录的浏览器
+- release: 任务结束后归还浏览器
+- discard: 关闭并丢弃一个浏览器（如浏览器已崩溃）
+- shutdown: 关闭全局浏览器池中的所有浏览器
+"""
+
+LOGIN_PATH = '/i/flow/login'
+
+
+class BrowserPool:
+    def __init__(self, size=None, cookie_path="X_cookie.json"):
+        """
+        Args:
+            size: 最多同时存在的浏览器数量，默认config.browser_pool_size
+            cookie_path: cookie文件路径
+        """
+        self.size = size or config.browser_pool_size
+        self.cookie_path = cookie_path
+        self.condition = threading.Condition()
+        self.idle = []  # [(driver, lean, capture_network)]
+        self.in_use = {}  # driver -> (lean, capture_network)
+        self.pids = {}  # driver -> chromedriver进程号
+        self.creating = 0
+
+    def _create(self, lean, capture_network):
+        """启动浏览器并完成登录（访问登录页、注入cookie）"""
+        print("浏览器池: 启动新的浏览器...")
+        driver = metrics.instrument_driver(initialize_driver(lean=lean, capture_network=capture_network))
+        try:
+            self.pids[driver] = driver.service.process.pid
+        except AttributeError:
+            pass
+        try:
+            try:
+                driver.get(config.x_base_url + LOGIN_PATH)
+            except TimeoutException:
+                driver.execute_script('window.stop()')
+            driver.set_page_load_timeout(60)
+            driver.get(config.x_base_url)  # 先访问一次目标域名
+            cookies_web(driver, self.cookie_path)
+        except Exception:
+            self._destroy(driver)
+            raise
+        return driver
+
+    @staticmethod
+    def _alive(driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _take_idle(self, lean, capture_network):
+        # 开启了performance日志的浏览器也可以用于不需要日志的任务
+        for i, (driver, idle_lean, idle_capture) in enumerate(self.idle):
+            if idle_lean == lean and (idle_capture or not capture_network):
+                del self.idle[i]
+                return driver, (idle_lean, idle_capture)
+        return None, None
+
+    def acquire(self, capture_network=True, lean=None, timeout=None):
+        """
+        获取一个已登录的浏览器，池中有空闲且配置相符的浏览器时直接复用
+
+        Args:
+            capture_network: 是否需要performance日志
+            lean: 是否使用精简模式，默认config.lean_crawl
+            timeout: 浏览器全部被占用时最多等待的秒数，None为一直等待
+
+        Raises:
+            TimeoutError: 超时仍没有可用的浏览器
+            WebDriverException等: 启动浏览器或登录失败
+        """
+        if lean is None:
+            lean = config.lean_crawl
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            stale = None
+            with self.condition:
+                driver, profile = self._take_idle(lean, capture_network)
+                if driver is None:
+                    total = len(self.idle) + len(self.in_use) + self.creating
+                    if total >= self.size and self.idle:
+                        # 池已满但有配置不符的空闲浏览器，关闭后按新配置启动
+                        stale = self.idle.pop(0)[0]
+                        total -= 1
+                    if total < self.size:
+                        self.creating += 1
+                    else:
+                        remaining = None if deadline is None else deadline - time.time()
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError("浏览器池中没有可用的浏览器")
+                        self.condition.wait(remaining)
+                        continue
+
+            if driver is not None:
+                if self._alive(driver):
+                    with self.condition:
+                        self.in_use[driver] = profile
+                    print("浏览器池: 复用已登录的浏览器")
+                    return driver
+                # 空闲期间浏览器已崩溃或被关闭，丢弃后重新获取
+                self._destroy(driver)
+                with self.condition:
+                    self.condition.notify()
+                continue
+
+            if stale is not None:
+                self._destroy(stale)
+            try:
+                driver = self._create(lean, capture_network)
+            except Exception:
+                with self.condition:
+                    self.creating -= 1
+                    self.condition.notify()
+                raise
+            with self.condition:
+                self.creating -= 1
+                self.in_use[driver] = (lean, capture_network)
+            return driver
+
+    def _reset(self, driver):
+        """任务之间的轻量重置，保留cookie（登录状态）"""
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.execute_script("window.sessionStorage.clear();")
+        try:
+            driver.get_log("performance")  # 清空上一个任务的网络日志
+        except Exception:
+            pass
+        driver.get("about:blank")
+
+    def release(self, driver):
+        """归还浏览器，重置失败（如浏览器已崩溃）时直接关闭"""
+        if driver is None:
+            return
+        with self.condition:
+            profile = self.in_use.pop(driver, None)
+        if profile is None:
+            return
+        try:
+            self._reset(driver)
+        except Exception as e:
+            print(f"浏览器池: 重置浏览器失败，关闭该浏览器: {str(e)}")
+            self._destroy(driver)
+            with self.condition:
+                self.condition.notify()
+            return
+        with self.condition:
+            self.idle.append((driver,) + profile)
+            self.condition.notify()
+
+    def discard(self, driver):
+        """关闭并丢弃一个浏览器"""
+        if driver is None:
+            return
+        with self.condition:
+            self.in_use.pop(driver, None)
+            self.idle = [item for item in self.idle if item[0] is not driver]
+        self._destroy(driver)
+        with self.condition:
+            self.condition.notify()
+
+    def _destroy(self, driver):
+        """退出浏览器，退出失败时结束该浏览器的chromedriver进程树"""
+        pid = self.pids.pop(driver, None)
+        try:
+            driver.quit()
+            return
+        except Exception:
+            pass
+        if pid is None or psutil is None:
+            return
+        try:
+            process = psutil.Process(pid)
+            for child in process.children(recursive=True):
+                child.kill()
+            process.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+    def shutdown(self):
+        """关闭池中所有浏览器（包括仍在使用中的）"""
+        with self.condition:
+            drivers = [item[0] for item in self.idle] + list(self.in_use)
+            self.idle = []
+            self.in_use = {}
+        if drivers:
+            print(f"浏览器池: 正在关闭 {len(drivers)} 个浏览器...")
+        for driver in drivers:
+            self._destroy(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取全局浏览器池，首次调用时创建"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BrowserPool()
+    return _pool
+
+
+def acquire(capture_network=True, lean=None, timeout=None):
+    """从全局浏览器池获取一个已登录的浏览器"""
+    return get_pool().acquire(capture_network, lean, timeout)
+
+
+def release(driver):
+    """将浏览器归还全局浏览器池"""
+    if _pool is not None:
+        _pool.release(driver)
+
+
+def discard(driver):
+    """关闭并丢弃一个浏览器"""
+    if _pool is not None:
+        _pool.discard(driver)
+
+
+def shutdown():
+    """关闭全局浏览器池中的所有浏览器"""
+    if _pool is not None:
+        _pool.shutdown()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,232 @@
+import os
+import glob
+import json
+import time
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import config
+import manifest
+from download_method import download_pic, download_video, set_target_folder, print, cprint
+
+"""
+爬取断点模块
+
+按时间爬取时定期（每config.checkpoint_interval秒）把进度写入结果文件夹中的checkpoint.json：
+已处理的最旧推文ID和时间、已加入下载队列但还没有下载结果的媒体(pending)，以及下载失败的媒体
+(failed，来自下载清单)。浏览器崩溃、Ctrl+C或在UI中停止后，使用`python main.py --resume`
+从断点继续：先下载pending和failed中的媒体，再用until:运算符只搜索断点之前的帖子，不再从头滚动。
+
+爬取正常结束且没有未完成的下载时删除断点文件。
+
+主要类:
+- Checkpoint: 定期保存爬取断点
+- PendingQueue: 记录加入下载队列的媒体的队列
+
+主要函数:
+- checkpoint_name: 日志文件名对应的断点文件名
+- find_checkpoint: 查找要继续的断点文件
+- load: 读取断点文件
+- resume_until: 继续爬取时的until时间
+- drain_pending: 下载断点中未完成和失败的媒体
+"""
+
+CHECKPOINT_NAME = "checkpoint.json"
+TWITTER_EPOCH_MS = 1288834974657  # 推文ID(snowflake)中时间戳的起点
+
+
+def checkpoint_name(log_name="download_log.txt"):
+    """断点文件名，按时间分片并行爬取时与日志文件一样每个分片单独一个文件"""
+    return os.path.splitext(log_name.replace("download_log", "checkpoint", 1))[0] + ".json"
+
+
+def manifest_name_for(checkpoint_path):
+    """断点对应的下载清单文件名（checkpoint_<分片>.json对应manifest_<分片>.jsonl）"""
+    name = os.path.splitext(os.path.basename(checkpoint_path))[0]
+    return name.replace("checkpoint", "manifest", 1) + ".jsonl"
+
+
+def tweet_id_time(tweet_id):
+    """从推文ID中解析发布时间(UTC)"""
+    return datetime.fromtimestamp(((int(tweet_id) >> 22) + TWITTER_EPOCH_MS) / 1000, tz=timezone.utc)
+
+
+class PendingQueue(queue.Queue):
+    """下载队列，加入队列的媒体同时记录到断点的pending中"""
+
+    def __init__(self, checkpoint):
+        super().__init__()
+        self.checkpoint = checkpoint
+
+    def put(self, item, block=True, timeout=None):
+        if isinstance(item, tuple):
+            self.checkpoint.track(*item)
+        super().put(item, block, timeout)
+
+
+class Checkpoint:
+    def __init__(self, path, meta, progress, interval=None):
+        """
+        Args:
+            path: 断点文件路径，位于结果文件夹中（与对应的下载清单同一文件夹）
+            meta: 继续爬取所需的搜索条件，如tag、user_choice、since、until
+            progress: crawl_state.CrawlProgress，提供已处理的最旧推文
+            interval: 保存间隔(秒)，默认config.checkpoint_interval
+        """
+        self.path = path
+        self.manifest_path = os.path.join(os.path.dirname(path), manifest_name_for(path))
+        self.meta = meta
+        self.progress = progress
+        self.interval = interval or config.checkpoint_interval
+        self.pending = {}  # 媒体链接 -> 帖子链接，按加入队列的顺序
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def track(self, post_link, media_url):
+        """记录加入下载队列的媒体"""
+        with self.lock:
+            self.pending.setdefault(media_url, post_link)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="Checkpoint", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"保存爬取断点时出错: {str(e)}")
+
+    def save(self, crawl_completed=False):
+        """
+        写入断点文件，已在下载清单中有结果的媒体从pending中移除
+
+        Returns:
+            写入的断点内容
+        """
+        summary = manifest.summarize(self.manifest_path)
+        with self.lock:
+            for media_url in [url for url in self.pending if url in summary]:
+                del self.pending[media_url]
+            pending = [{"tweet_link": link, "media_url": url} for url, link in self.pending.items()]
+        failed = [{"tweet_link": entry.get("tweet_link"), "media_url": url}
+                  for url, entry in summary.items() if entry["status"] not in manifest.SUCCESS_STATUSES]
+
+        progress = self.progress
+        data = dict(self.meta)
+        data.update({
+            "oldest_id": str(progress.oldest_id) if progress.oldest_id else None,
+            "oldest_time": progress.oldest_time,
+            "crawl_completed": crawl_completed,
+            "pending": pending,
+            "failed": failed,
+            "updated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+        return data
+
+    def close(self, crawl_completed=False):
+        """
+        停止定期保存并写入最后一次断点，爬取已完成且没有未完成的下载时删除断点文件
+
+        Args:
+            crawl_completed: 是否已经爬取完整个时间范围
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval)
+        data = self.save(crawl_completed)
+        if crawl_completed and not data["pending"] and not data["failed"]:
+            os.remove(self.path)
+            return None
+        cprint(f"爬取断点已保存到: {self.path}，可使用 python main.py --resume 继续", "yellow")
+        return data
+
+
+def find_checkpoint(path=None, tag=None):
+    """
+    查找要继续的断点文件
+
+    Args:
+        path: 断点文件或结果文件夹，为空时在当前目录下查找该标签最近修改的断点
+        tag: 标签
+
+    Returns:
+        断点文件路径，找不到时返回None
+    """
+    if path and os.path.isfile(path):
+        return path
+    if path:
+        patterns = [os.path.join(path, "checkpoint*.json"),
+                    os.path.join(path, "time_crawler_result", "checkpoint*.json")]
+    else:
+        patterns = [os.path.join(f"result_{tag}_*", "time_crawler_result", "checkpoint*.json")]
+    candidates = [file for pattern in patterns for file in glob.glob(pattern)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def load(path):
+    """读取断点文件，文件不存在或损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def resume_until(data):
+    """
+    继续爬取时的until时间：已处理的最旧推文的下一秒
+
+    最旧的推文可能在媒体加入队列前中断，until不包含该时刻，因此多包含一秒，已下载的文件会被跳过；
+    还没有处理任何推文就中断时使用原来的until
+
+    Returns:
+        datetime
+    """
+    until = datetime.fromisoformat(data["until"])
+    if not data.get("oldest_id"):
+        return until
+    return min(tweet_id_time(data["oldest_id"]).replace(microsecond=0) + timedelta(seconds=1), until)
+
+
+def drain_pending(data, folder, log_name="download_log.txt", manifest_name=None, workers=5):
+    """
+    下载断点中未完成(pending)和失败(failed)的媒体
+
+    Args:
+        data: 断点内容
+        folder: 结果文件夹（断点文件所在的文件夹）
+        log_name: 日志文件名
+        manifest_name: 下载清单文件名，默认与日志文件对应
+        workers: 同时下载的线程数
+
+    Returns:
+        下载的媒体数
+    """
+    items = {}
+    for item in data.get("pending", []) + data.get("failed", []):
+        items.setdefault(item["media_url"], item.get("tweet_link"))
+    if not items:
+        return 0
+
+    set_target_folder(folder, log_name, manifest_name)
+    video_folder = os.path.join(folder, "video & gif")
+    cprint(f"先下载断点中未完成的 {len(items)} 个媒体...", "blue")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for media_url, post_link in items.items():
+            if "mp4" not in media_url:
+                executor.submit(download_pic, post_link, media_url, folder)
+            else:
+                os.makedirs(video_folder, exist_ok=True)
+                executor.submit(download_video, media_url, video_folder, post_link)
+    return len(items)
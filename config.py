@@ -6,7 +6,7 @@
 
 tag = "宋雨琦" # 需要爬取的tag
 user_choice = '1' # 设置下载选项，1为图片，2为视频，3为GIF动图，123为全部，目前暂时只支持图片
-late_time = 5 # 设置延迟时间，每隔4s向下滑动，为保险可设置10-5之间最佳，建议默认
+late_time = 5 # 每次滚动后等待新推文加载的最长时间(秒)，新推文出现后立即继续滚动，建议默认
 
 date_flag = True # 设置是否根据日期进行爬取，true为获取全部，false为到指定时间
 
@@ -16,3 +16,55 @@ end_time = '2025-07-05' # 设置结束的获取日期，格式为2023-10-08
 
 # 按热度（点赞数）爬取时设置，爬取多少条带图片的推文
 urls_num = 100
+
+# 推文提取模式，batch为每次滚动只执行一次execute_script批量提取，element为逐元素提取（旧模式，较慢）
+extract_mode = "batch"
+
+# 获取推文的方式，dom为解析页面元素，graphql为拦截SearchTimeline等接口响应（可获取已被页面回收的推文及视频）
+crawl_backend = "dom"
+
+# 下载连接池设置，http_pool_size为每个主机保持的keep-alive连接数，建议不小于图片和视频下载线程数之和
+http_pool_size = 20
+http2 = False # 是否启用HTTP/2多路复用，需要先安装httpx[http2]
+
+# 下载引擎，thread为每个文件一个线程，async为单个事件循环的异步下载引擎（建议安装aiohttp和aiofiles）
+download_engine = "thread"
+async_concurrency = 64 # 异步下载引擎同时进行的最大下载数
+
+# 跨运行的媒体索引（SQLite）文件路径（如"media_index.db"），已下载过的媒体硬链接到新的结果文件夹，不再重复下载，为空时不启用
+media_index = ""
+
+# 感知哈希去重（需要安装Pillow），图片下载后检测与已有图片近似重复的转发图
+phash_dedup = False
+phash_threshold = 3 # 判定为近似重复的最大汉明距离（64位dHash）
+phash_action = "link" # link为替换为已有图片的硬链接，delete为直接删除
+phash_workers = 0 # 计算哈希的进程数，0为CPU核心数
+
+# 控制台输出设置
+console_color = True # 控制台是否输出彩色文字，False时输出纯文本（日志文件始终不含颜色信息）
+
+# 页面滚动设置，每次滚动的等待时间见late_time
+max_scroll_stalls = 5 # 连续多少次滚动都没有新内容时认为已到达时间线末尾，等待时间按指数退避
+
+# 浏览器设置
+lean_crawl = True # 精简模式：无头浏览器、屏蔽图片/视频/字体加载、较小窗口，调试时可设为False显示浏览器窗口
+browser_pool_size = 1 # 浏览器池中最多保持的已登录浏览器数量，多次爬取之间复用
+
+# 批量爬取设置(batch_runner.py)，多个标签或时间分片由多个工作进程并行爬取
+tags = [] # 批量爬取(batch_runner.py)的标签列表，如["标签1", "标签2"]，为空时只爬取tag
+batch_workers = 2 # 批量爬取时的工作进程数，每个进程启动一个浏览器
+shard_unit = "" # 批量爬取时按时间切分的单位，day为按天，hour为按小时，为空时不切分；分片使用since:/until:搜索并行爬取
+
+# 增量爬取和断点续爬设置
+incremental = False # 增量爬取：记录每个标签上次完整爬取时的最新推文，下次爬取到达该位置时停止，不再重复滚动旧内容
+crawl_state_path = "crawl_state.json" # 增量爬取的高水位记录文件
+checkpoint_interval = 30 # 按时间爬取时保存爬取断点的间隔(秒)，中断后可使用python main.py --resume继续
+
+# 推文去重设置
+seen_set_capacity = 100000 # 按推文ID去重时最多记住的推文数量，超出后丢弃最早的一半，限制长时间爬取的内存占用
+
+# 测试和性能分析设置
+x_base_url = "https://x.com" # X的网址，使用本地模拟服务器(mock_x_server.py)测试时改为如"http://127.0.0.1:8080"
+record_session = "" # 录制爬取会话的归档文件路径（如"session.jsonl.gz"），为空时不录制；使用python session_recorder.py 归档文件 离线回放
+metrics_port = 0 # 运行指标(Prometheus格式)接口的端口，如9100，爬取时可访问http://127.0.0.1:端口/metrics查看；为0时不启动
+trace_path = "" # 阶段耗时追踪文件路径（如"trace.json"），为空时不追踪；生成的Chrome trace JSON可在https://ui.perfetto.dev中打开
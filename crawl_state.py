@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+import config
+
+try:
+    import fcntl  # POSIX
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows
+
+"""
+增量爬取状态模块
+
+按搜索条件记录上一次完整爬取时见到的最新推文ID和时间（高水位），下一次爬取同样的条件时，
+生产者遇到不新于高水位的推文就停止，不再一直滚动到start_time。只有爬取正常结束（到达start_time
+或上次的高水位）时才更新高水位，中途停止、出错或时间线在到达start_time之前就不再加载新内容
+（可能被限流）时保持不变，保证高水位之前的内容都已经完整爬取过。
+
+状态保存在config.crawl_state_path指定的JSON文件中。批量爬取时多个进程会同时更新该文件，
+更新时持有旁边的.lock文件的进程间文件锁完成"读取-修改-写入"，并写入每个进程单独的临时文件后原子替换。
+
+主要类:
+- CrawlProgress: 单次爬取的进度，由生产者更新
+- CrawlState: 高水位存储
+
+主要函数:
+- query_key: 生成搜索条件的键
+- get_state: 获取全局状态存储
+"""
+
+# 连续多少条推文不新于高水位时才停止，避免夹在时间线中的广告等旧推文导致提前停止
+MARK_CONFIRMATIONS = 3
+
+
+def query_key(tag, since, user_choice):
+    """搜索条件的键：标签、搜索起始时间和下载类型相同时才能复用高水位"""
+    return f"{tag}|since={since}|choice={user_choice}"
+
+
+class CrawlProgress:
+    def __init__(self, stop_at_id=None):
+        """
+        Args:
+            stop_at_id: 上次爬取的高水位推文ID，为None时不提前停止
+        """
+        self.stop_at_id = int(stop_at_id) if stop_at_id else None
+        self.newest_id = None
+        self.newest_time = None
+        self.oldest_id = None  # 已处理的最旧推文，中断后从这里继续（见checkpoint.py）
+        self.oldest_time = None
+        self.completed = False  # 是否正常结束，只有正常结束时才更新高水位
+        self._old_streak = 0
+
+    def observe(self, tweet_id, post_time=None):
+        """记录见到的推文，保留最新和最旧的ID和时间"""
+        if not tweet_id:
+            return
+        tweet_id = int(tweet_id)
+        if self.newest_id is None or tweet_id > self.newest_id:
+            self.newest_id = tweet_id
+            self.newest_time = post_time
+        if self.oldest_id is None or tweet_id < self.oldest_id:
+            self.oldest_id = tweet_id
+            self.oldest_time = post_time
+
+    def reached_mark(self, tweet_id):
+        """是否已经到达上次爬取的高水位（连续多条推文不新于高水位）"""
+        if self.stop_at_id is None or not tweet_id:
+            return False
+        if int(tweet_id) <= self.stop_at_id:
+            self._old_streak += 1
+        else:
+            self._old_streak = 0
+        return self._old_streak >= MARK_CONFIRMATIONS
+
+    def finish(self):
+        """标记爬取正常结束"""
+        self.completed = True
+
+
+@contextmanager
+def file_lock(path):
+    """进程间的排他文件锁（阻塞等待），path为锁文件路径"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            # msvcrt.LK_LOCK最多重试10次（约10秒）后抛出OSError，继续等待
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CrawlState:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # 进程内的线程锁，进程间由file_lock保护
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key):
+        """返回该搜索条件的高水位记录，没有时返回None"""
+        with self.lock:
+            return self._load().get(key)
+
+    def high_water_id(self, key):
+        """返回该搜索条件上次完整爬取时的最新推文ID，没有时返回None"""
+        entry = self.get(key)
+        return int(entry['newest_id']) if entry and entry.get('newest_id') else None
+
+    def commit(self, key, progress):
+        """
+        爬取正常结束后更新高水位，只会前进不会后退
+
+        Returns:
+            是否更新了高水位
+        """
+        if not progress.completed or progress.newest_id is None:
+            return False
+        with self.lock, file_lock(self.path + '.lock'):
+            # 持有进程间文件锁后重新读取，批量爬取时其他进程可能更新了其他搜索条件
+            states = self._load()
+            previous = states.get(key)
+            if previous and int(previous['newest_id']) >= progress.newest_id:
+                return False
+            states[key] = {
+                'newest_id': str(progress.newest_id),
+                'newest_time': progress.newest_time,
+                'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            # 每个进程写入自己的临时文件，不会替换成其他进程写了一半的文件
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                             prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(states, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return True
+
+
+_state = None
+
+
+def get_state():
+    """获取全局状态存储，config.incremental为False时返回None"""
+    global _state
+    if not config.incremental:
+        return None
+    if _state is None or _state.path != config.crawl_state_path:
+        _state = CrawlState(config.crawl_state_path)
+    return _state
@@ -1,7 +1,19 @@
 import os
+import glob
+import json
 import time
-import requests
+import shutil
+import hashlib
 import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+import http_client
+import log_writer
+import manifest
+import metrics
+import tracing
+import media_index
+import image_dedup
 from urllib.parse import unquote
 from termcolor import cprint as termcolor_cprint
 import sys
@@ -11,9 +23,15 @@ import sys
 
 本模块提供了图片和视频下载的相关功能，包括：
 - 线程控制和信号量管理
-- 日志记录功能
+- 日志记录功能，由后台线程批量写入日志文件(log_writer)
 - 下载进度显示
 - 文件保存和错误处理
+- 流式分块下载，先写入临时文件(.part)，校验Content-Length后原子重命名
+- 视频断点续传(HTTP Range)，大视频可分段并行下载
+- 下载前查询跨运行的媒体索引，已下载过的媒体直接复用本地文件
+- 图片下载完成后可选计算感知哈希，检测近似重复图片(image_dedup)
+- 每个媒体下载结束后向结果文件夹的manifest.jsonl追加一条记录(manifest)
+- 记录正在传输的下载数量和实时下载字节数(metrics)，以及每个HTTP下载的耗时(tracing)
 
 主要函数:
 - download_pic: 下载图片文件
@@ -30,16 +48,28 @@ img_connections = 10  # 定义最大线程数最多10个图片下载线程，可
 img_sema = threading.BoundedSemaphore(img_connections)  # 或使用Semaphore方法
 video_connections = 3  # 定义最大线程数最多3个视频下载线程，可根据网速修改
 video_sema = threading.BoundedSemaphore(video_connections)  # 或使用Semaphore方法
+video_retries = 3  # 视频下载超时或中断后的重试次数，重试时从.part文件断点续传
+video_split_size = 20 * 1024 * 1024  # 超过该大小的视频尝试分段并行下载
+video_split_parts = 3  # 单个视频最多分几段并行下载，额外的连接从video_connections中空闲的名额获取
+
+# 流式下载时每次读取的块大小，内存占用与文件大小无关
+CHUNK_SIZE = 64 * 1024
 
 # 日志文件路径和目标文件夹
 log_file_path = None
 target_folder = None
 
-def set_target_folder(folder):
-    """设置目标文件夹和日志文件路径"""
+def set_target_folder(folder, log_name="download_log.txt", manifest_name=None):
+    """
+    设置目标文件夹和日志文件路径，按时间分片并行爬取时每个分片使用单独的日志文件和下载清单
+
+    manifest_name默认与日志文件对应（download_log_<分片>.txt对应manifest_<分片>.jsonl），
+    从断点继续时使用断点对应的清单
+    """
     global target_folder, log_file_path
     target_folder = folder
-    log_file_path = os.path.join(folder, "download_log.txt")
+    log_file_path = os.path.join(folder, log_name)
+    manifest.set_folder(folder, manifest_name or manifest.manifest_name(log_name))
 
 def log_print(*args, **kwargs):
     """打印到控制台并写入日志文件"""
@@ -48,28 +78,22 @@ def log_print(*args, **kwargs):
     sys.stdout.write(message + "\n")
     sys.stdout.flush()
     
-    # 写入日志文件
+    # 交给后台线程批量写入日志文件
     if log_file_path:
-        try:
-            with open(log_file_path, "a", encoding="utf-8") as log_file:
-                log_file.write(message + "\n")
-        except Exception as e:
-            sys.stderr.write(f"写入日志文件时发生错误: {str(e)}\n")
-            sys.stderr.flush()
+        log_writer.write(log_file_path, message + "\n")
 
 def log_cprint(text, color=None, **kwargs):
     """带颜色打印到控制台并写入日志文件"""
-    # 使用termcolor_cprint进行彩色输出
-    termcolor_cprint(text, color, **kwargs)
+    # config.console_color为False时输出纯文本，便于重定向到文件或不支持颜色的终端
+    if config.console_color:
+        termcolor_cprint(text, color, **kwargs)
+    else:
+        sys.stdout.write(str(text) + "\n")
+        sys.stdout.flush()
     
     # 写入日志文件(不含颜色信息)
     if log_file_path:
-        try:
-            with open(log_file_path, "a", encoding="utf-8") as log_file:
-                log_file.write(str(text) + "\n")
-        except Exception as e:
-            sys.stderr.write(f"写入日志文件时发生错误: {str(e)}\n")
-            sys.stderr.flush()
+        log_writer.write(log_file_path, str(text) + "\n")
 
 def move_log_file():
     """将日志文件移动到目标文件夹"""
@@ -77,10 +101,12 @@ def move_log_file():
     if target_folder and os.path.exists(log_file_path):
         try:
             # 构建新的日志文件路径
-            new_log_path = os.path.join(target_folder, "download_log.txt")
+            new_log_path = os.path.join(target_folder, os.path.basename(log_file_path))
             # 如果目标文件夹不存在，创建它
             if not os.path.exists(target_folder):
                 os.makedirs(target_folder)
+            # 移动前先写入所有缓冲的日志
+            log_writer.flush()
             # 移动文件
             if os.path.exists(new_log_path):
                 os.remove(new_log_path)
@@ -98,18 +124,300 @@ print = log_print
 cprint = log_cprint
 
 
+class IncompleteDownloadError(Exception):
+    """下载的字节数与Content-Length不一致"""
+
+
+class RangeNotSupportedError(IncompleteDownloadError):
+    """服务器没有按Range请求返回206，无法分段下载或续传分段"""
+
+
+def expected_length(headers):
+    """返回响应头中的Content-Length，经过压缩编码或缺失时返回None"""
+    length = headers.get('Content-Length')
+    if length is None or headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    return int(length)
+
+def stream_to_file(url, filepath, timeout, hasher=None):
+    """
+    流式下载到临时文件(filepath + '.part')，校验Content-Length后原子重命名为目标文件，
+    中途失败时删除临时文件，不会留下不完整的目标文件；传入hasher时边下载边计算哈希
+    
+    Returns:
+        写入的字节数，状态码不为200时返回None
+    """
+    part_path = filepath + '.part'
+    written = 0
+    with metrics.ACTIVE_DOWNLOADS.track('image'), http_client.stream(url, timeout=timeout) as response:
+        if response.status_code != 200:
+            return None
+        expected = expected_length(response.headers)
+        try:
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_chunks(CHUNK_SIZE):
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    written += len(chunk)
+                    metrics.DOWNLOADED_BYTES.inc('image', amount=len(chunk))
+            if expected is not None and written != expected:
+                raise IncompleteDownloadError(f"文件不完整: 已下载 {written} 字节，应为 {expected} 字节")
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    os.replace(part_path, filepath)
+    return written
+
+
+def _content_range_total(headers):
+    """从Content-Range(如bytes 0-0/12345)中解析文件总大小"""
+    total = headers.get('Content-Range', '').rsplit('/', 1)[-1]
+    return int(total) if total.isdigit() else None
+
+def _probe_total(url, timeout):
+    """通过Range请求获取文件总大小"""
+    with http_client.stream(url, timeout=timeout, headers={'Range': 'bytes=0-0'}) as response:
+        if response.status_code != 206:
+            raise RangeNotSupportedError(f"服务器不支持断点续传: HTTP {response.status_code}")
+        total = _content_range_total(response.headers)
+        if total is None:
+            raise RangeNotSupportedError("服务器没有返回文件总大小")
+        return total
+
+def _segment_bounds(total, parts):
+    """将[0, total)平均分成parts段，返回每段的闭区间[start, end]"""
+    size = total // parts
+    return [(i * size, total - 1 if i == parts - 1 else (i + 1) * size - 1) for i in range(parts)]
+
+def _stream_range(url, path, start, end, timeout):
+    """将文件的[start, end]字节下载到path，path中已有的内容视为已下载部分，从其后续传"""
+    done = os.path.getsize(path) if os.path.exists(path) else 0
+    if start + done > end:
+        return
+    with tracing.span("http_range", "download", url=url, start=start + done, end=end), \
+            http_client.stream(url, timeout=timeout, headers={'Range': f'bytes={start + done}-{end}'}) as response:
+        if response.status_code != 206:
+            raise RangeNotSupportedError(f"服务器不支持断点续传: HTTP {response.status_code}")
+        with open(path, 'ab') as f:
+            for chunk in response.iter_chunks(CHUNK_SIZE):
+                f.write(chunk)
+                metrics.DOWNLOADED_BYTES.inc('video', amount=len(chunk))
+    if os.path.getsize(path) != end - start + 1:
+        raise IncompleteDownloadError(f"分段不完整: {path}")
+
+def _acquire_extra_connections(limit):
+    """非阻塞地从video_sema中获取最多limit个空闲名额，返回获取到的数量"""
+    acquired = 0
+    while acquired < limit and video_sema.acquire(blocking=False):
+        acquired += 1
+    return acquired
+
+def _download_split(url, filepath, bounds, timeout):
+    """
+    分段并行下载，每段写入独立的filepath.part<i>文件以便分别续传，全部完成后合并并原子重命名
+    """
+    extra = _acquire_extra_connections(len(bounds) - 1)
+    try:
+        segment_paths = [f"{filepath}.part{i}" for i in range(len(bounds))]
+        with ThreadPoolExecutor(max_workers=1 + extra) as pool:
+            futures = [pool.submit(_stream_range, url, path, start, end, timeout)
+                       for path, (start, end) in zip(segment_paths, bounds)]
+            for future in futures:
+                future.result()
+    finally:
+        for _ in range(extra):
+            video_sema.release()
+
+    part_path = filepath + '.part'
+    with open(part_path, 'wb') as out:
+        for path in segment_paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+    _remove_segments(filepath)
+    os.replace(part_path, filepath)
+    return bounds[-1][1] + 1
+
+def download_resumable(url, filepath, timeout):
+    """
+    可断点续传的下载：中断时保留filepath.part，再次调用时通过HTTP Range从断点继续；
+    文件大于video_split_size且服务器支持Range时，分段并行下载
+    
+    Returns:
+        文件大小，状态码不为200/206时返回None
+    """
+    with metrics.ACTIVE_DOWNLOADS.track('video'):
+        return _download_resumable(url, filepath, timeout)
+
+def _segment_paths(part_path):
+    return glob.glob(glob.escape(part_path) + '[0-9]*')
+
+def _remove_segments(filepath):
+    """删除分段文件和分段记录"""
+    for path in _segment_paths(filepath + '.part') + [filepath + '.split']:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _read_split_layout(filepath):
+    """
+    读取上次分段下载记录的分段区间(filepath.split)
+
+    分段文件在收到206响应后才创建，只靠现有的.part<i>文件无法知道原来的分段数，
+    记录缺失、损坏或与现有分段文件不一致时返回None
+    """
+    try:
+        with open(filepath + '.split', 'r', encoding='utf-8') as f:
+            bounds = [(int(start), int(end)) for start, end in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return None
+    if not bounds or bounds[0][0] != 0 or any(a[1] + 1 != b[0] for a, b in zip(bounds, bounds[1:])):
+        return None
+    sizes = {f"{filepath}.part{i}": end - start + 1 for i, (start, end) in enumerate(bounds)}
+    for path in _segment_paths(filepath + '.part'):
+        if path not in sizes or os.path.getsize(path) > sizes[path]:
+            return None
+    return bounds
+
+def _split_or_fallback(url, filepath, timeout, total=None, parts=None):
+    """
+    分段下载；total为None时按filepath.split中记录的分段区间续传，记录缺失、与分段文件不一致或
+    服务器上的文件大小已变化时删除分段文件重新下载，不会按不同的分段边界拼接出内容错误的文件。
+    服务器不再支持Range（如CDN改为返回200）时删除分段文件并改为普通下载，
+    否则分段文件会一直留在文件夹中，之后每次重试都会失败
+    """
+    name = os.path.basename(filepath)
+    try:
+        if total is None:
+            bounds = _read_split_layout(filepath)
+            if bounds is None or _probe_total(url, timeout) != bounds[-1][1] + 1:
+                _remove_segments(filepath)
+                print(f"{name} 的分段记录缺失或与服务器上的文件不一致，已删除分段文件，重新下载")
+                return _download_resumable(url, filepath, timeout)
+        else:
+            bounds = _segment_bounds(total, parts)
+            with open(filepath + '.split', 'w', encoding='utf-8') as f:
+                json.dump(bounds, f)
+        return _download_split(url, filepath, bounds, timeout)
+    except RangeNotSupportedError as e:
+        _remove_segments(filepath)
+        print(f"{name} 无法分段下载({str(e)})，已删除分段文件，改为普通下载")
+        return _download_resumable(url, filepath, timeout, allow_split=False)
+
+def _download_resumable(url, filepath, timeout, allow_split=True):
+    part_path = filepath + '.part'
+
+    # 上次为分段下载，按记录的分段区间继续
+    if os.path.exists(filepath + '.split') or _segment_paths(part_path):
+        return _split_or_fallback(url, filepath, timeout)
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+    split = False
+    with http_client.stream(url, timeout=timeout, headers=headers) as response:
+        if response.status_code == 206:
+            total = _content_range_total(response.headers)
+            mode = 'ab'
+        elif response.status_code == 200:
+            total = expected_length(response.headers)
+            mode = 'wb'
+            split = (allow_split and video_split_parts > 1 and total is not None and total >= video_split_size
+                     and response.headers.get('Accept-Ranges') == 'bytes')
+        elif response.status_code == 416:
+            os.remove(part_path)
+            raise IncompleteDownloadError("断点位置无效，已删除临时文件，将重新下载")
+        else:
+            return None
+
+        if not split:
+            with open(part_path, mode) as f:
+                for chunk in response.iter_chunks(CHUNK_SIZE):
+                    f.write(chunk)
+                    metrics.DOWNLOADED_BYTES.inc('video', amount=len(chunk))
+
+    if split:
+        return _split_or_fallback(url, filepath, timeout, total, video_split_parts)
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise IncompleteDownloadError(f"文件不完整: 已下载 {size} 字节，应为 {total} 字节")
+    os.replace(part_path, filepath)
+    return size
+
+
+def reuse_indexed(url, filepath):
+    """
+    下载前查询跨运行的媒体索引，该媒体此前已下载且文件仍存在时直接链接到filepath，不发起HTTP请求
+    
+    Returns:
+        是否已从索引复用
+    """
+    index = media_index.get_index()
+    if index is None:
+        return False
+    existing = index.find_existing(url)
+    if existing is None:
+        return False
+    if os.path.abspath(existing) != os.path.abspath(filepath):
+        media_index.link_or_copy(existing, filepath)
+    return True
+
+def new_hasher():
+    """启用媒体索引时返回用于边下载边计算的SHA-256对象，否则返回None"""
+    return hashlib.sha256() if media_index.get_index() is not None else None
+
+def index_download(url, filepath, size, hasher=None, post_link=None):
+    """将下载完成的媒体记录到跨运行的媒体索引"""
+    index = media_index.get_index()
+    if index is None:
+        return
+    sha256 = hasher.hexdigest() if hasher is not None else media_index.file_sha256(filepath)
+    index.record(url, filepath, size, sha256, post_link)
+
+
+def image_target(url, folder):
+    """根据图片URL生成文件名和保存路径"""
+    filename = url.split('/')[-1].split('?')[0] + '.png'
+    filename = unquote(filename)  # URL解码
+    return filename, os.path.join(folder, filename)
+
+def video_target(url, folder):
+    """
+    根据视频URL生成文件名和保存路径
+    
+    GIF(animated_gif)由video.twimg.com/tweet_video/提供，保存为.gif；其余视频（ext_tw_video、
+    amplify_video等）保存为.mp4
+    """
+    filename = url.split('/')[-1].split('?')[0]
+    if filename.endswith('.mp4'):
+        filename = filename[:-len('.mp4')]
+    if '/tweet_video/' in url:
+        filename = filename + '.gif'
+    else:
+        filename = filename + '.mp4'
+    filename = unquote(filename)  # URL解码
+    return filename, os.path.join(folder, filename)
+
+
 def download_pic(post_link, url, folder):
 
+    started = time.time()
+    filepath = None
     try:
 
         # 从URL中提取文件名
-        filename = url.split('/')[-1].split('?')[0] + '.png'
-        filename = unquote(filename)  # URL解码
-        filepath = os.path.join(folder, filename)
+        filename, filepath = image_target(url, folder)
         
         # 检查文件是否已存在
         if os.path.exists(filepath):
             # 文件存在时不打印任何信息，静默跳过
+            manifest.record(post_link, url, filepath, 'exists', os.path.getsize(filepath), started)
+            return
+        
+        # 之前的运行中已下载过，直接复用本地文件
+        if reuse_indexed(url, filepath):
+            print(f"{filename} 已在之前的爬取中下载，复用本地文件")
+            manifest.record(post_link, url, filepath, 'reused', os.path.getsize(filepath), started)
             return
             
         # 打印帖子链接和下载URL（紧密关联在一起）
@@ -117,55 +425,76 @@ def download_pic(post_link, url, folder):
             print(f"帖子链接{post_link}")
         cprint(f"开始下载{url}", "yellow")
         
-        # 设置较短的超时时间
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+        # 设置较短的超时时间，使用共享连接池复用keep-alive连接，流式写入临时文件后重命名
+        hasher = new_hasher()
+        with img_sema, tracing.span("http_download", "download", url=url):
+            size = stream_to_file(url, filepath, timeout=10, hasher=hasher)
+        if size is not None:
+            index_download(url, filepath, size, hasher, post_link)
+            manifest.record(post_link, url, filepath, 'downloaded', size, started)
             cprint(f"{filename} 下载完成\n", "green")
+            image_dedup.schedule(filepath)
             
             # 添加下载间隔
             time.sleep(0.5)
+        else:
+            manifest.record(post_link, url, filepath, 'failed', started=started)
             
-    except requests.Timeout:
+    except http_client.TIMEOUT_ERRORS:
         print(f"下载超时: {url}")
+        manifest.record(post_link, url, filepath, 'timeout', started=started)
     except Exception as e:
         print(f"下载图片时发生错误: {str(e)}")
+        manifest.record(post_link, url, filepath, 'failed', started=started)
 
 # 下载视频，待完善
-def download_video(url, folder):
+def download_video(url, folder, post_link=None):
 
+    started = time.time()
+    filepath = None
     try:
-        # 设置较短的超时时间
-        response = requests.get(url, timeout=15)
-        if response.status_code == 200:
-            # 从URL中提取文件名
-            filename = url.split('/')[-1].split('?')[0]
-            if 'pu' in filename:
-                filename = filename + '.mp4'
-            else:
-                filename = filename + '.gif'
-            filename = unquote(filename)  # URL解码
-            filepath = os.path.join(folder, filename)
+        # 从URL中提取文件名
+        filename, filepath = video_target(url, folder)
+        
+        # 检查文件是否已存在
+        if os.path.exists(filepath):
+            print(f"{filename} 已存在，跳过下载")
+            manifest.record(post_link, url, filepath, 'exists', os.path.getsize(filepath), started, 'video')
+            return
+        
+        # 之前的运行中已下载过，直接复用本地文件
+        if reuse_indexed(url, filepath):
+            print(f"{filename} 已在之前的爬取中下载，复用本地文件")
+            manifest.record(post_link, url, filepath, 'reused', os.path.getsize(filepath), started, 'video')
+            return
             
-            # 检查文件是否已存在
-            if os.path.exists(filepath):
-                print(f"{filename} 已存在，跳过下载")
-                return
-                
-            print(f"{filename} 正在下载...")
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+        # 设置较短的超时时间，超时或中断时保留.part文件并断点续传
+        print(f"{filename} 正在下载...")
+        with video_sema:
+            for attempt in range(video_retries + 1):
+                try:
+                    with tracing.span("http_download", "download", url=url, attempt=attempt):
+                        size = download_resumable(url, filepath, timeout=15)
+                    break
+                except (http_client.NETWORK_ERRORS + (IncompleteDownloadError,)) as e:
+                    if attempt == video_retries:
+                        raise
+                    metrics.RETRIES.inc('video_download')
+                    print(f"{filename} 下载中断({str(e)})，正在断点续传 ({attempt + 1}/{video_retries})")
+                    time.sleep(2 ** attempt)
+        if size is not None:
+            index_download(url, filepath, size, post_link=post_link)
+            manifest.record(post_link, url, filepath, 'downloaded', size, started, 'video')
             print(f"{filename} 下载完成")
             
             # 添加下载间隔
             time.sleep(0.5)
+        else:
+            manifest.record(post_link, url, filepath, 'failed', started=started, kind='video')
             
-    except requests.Timeout:
+    except http_client.TIMEOUT_ERRORS:
         print(f"下载超时: {url}")
+        manifest.record(post_link, url, filepath, 'timeout', started=started, kind='video')
     except Exception as e:
         print(f"下载视频时发生错误: {str(e)}")
-
-
-
-
+        manifest.record(post_link, url, filepath, 'failed', started=started, kind='video')
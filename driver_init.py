@@ -8,6 +8,25 @@ from selenium.webdriver import ChromeOptions
 from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
+import config
+import metrics
+import tracing
+
+# 精简模式下屏蔽的请求：图片、视频、字体等只用于显示的资源。
+# 屏蔽后<img>的src属性仍然存在，提取媒体链接不受影响，时间线接口(GraphQL)也不受影响
+BLOCKED_URL_PATTERNS = [
+    "*pbs.twimg.com/media/*",
+    "*pbs.twimg.com/profile_images/*",
+    "*pbs.twimg.com/profile_banners/*",
+    "*pbs.twimg.com/card_img/*",
+    "*pbs.twimg.com/*_thumb/*",
+    "*video.twimg.com/*",
+    "*abs.twimg.com/emoji/*",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+]
+LEAN_WINDOW_SIZE = "1024,900"  # 精简模式的窗口大小，窗口越小每屏渲染的推文越少
 
 def get_resource_path(relative_path):
     """获取资源的绝对路径，适用于开发环境和PyInstaller打包后的环境"""
@@ -15,21 +34,37 @@ def get_resource_path(relative_path):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
-def initialize_driver():
-    # 初始化Chrome浏览器驱动
+def needs_network_capture(user_choice, backend=None):
+    """是否需要开启performance日志：下载视频/GIF或使用graphql方式获取推文时需要读取网络请求"""
+    backend = backend or config.crawl_backend
+    return "2" in user_choice or "3" in user_choice or backend == "graphql"
+
+@tracing.traced(cat="browser")
+def initialize_driver(lean=None, capture_network=True):
+    """
+    初始化Chrome浏览器驱动
+    
+    Args:
+        lean: 是否使用精简模式（无头、屏蔽图片/视频/字体、较小窗口），默认读取config.lean_crawl
+        capture_network: 是否开启performance日志，只有需要拦截网络请求（视频、graphql）时才开启
+    """
+    if lean is None:
+        lean = config.lean_crawl
     options = ChromeOptions()
     
-    # 设置性能日志
-    options.set_capability(
-        "goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"}
-    )
+    # 设置性能日志，记录所有网络事件开销较大，不需要时不开启
+    if capture_network:
+        options.set_capability(
+            "goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"}
+        )
+        # 只记录Network域的事件，不记录Page等其他域，减少浏览器缓存的日志量
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
 
     # 添加必要的参数来提高稳定性
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument('--disable-blink-features=AutomationControlled')
     options.add_argument('--disable-infobars')
-    options.add_argument('--start-maximized')
     options.add_argument('--disable-extensions')
     options.add_argument('--disable-gpu')
     options.add_argument('--ignore-certificate-errors')
@@ -40,13 +75,16 @@ def initialize_driver():
     # 设置更现代的用户代理
     options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
 
-    # # 启用无头浏览器模式
-    # options.add_argument("--headless")
-    # options.add_argument("--disable-gpu")  # 禁用GPU加速
-    # options.add_argument("--window-size=1920x1080")  # 设置窗口大小，防止某些元素不可见
-
-    # 不启用无头模式时开启，调式代码或者看报错的时候使用。
-    options.add_argument("window-position=660,0")
+    if lean:
+        # 精简模式：无头浏览器，不渲染窗口，不自动播放视频
+        options.add_argument("--headless=new")
+        options.add_argument(f"--window-size={LEAN_WINDOW_SIZE}")
+        options.add_argument("--mute-audio")
+        options.add_argument("--autoplay-policy=user-gesture-required")
+    else:
+        # 不启用无头模式时开启，调式代码或者看报错的时候使用。
+        options.add_argument('--start-maximized')
+        options.add_argument("window-position=660,0")
 
     # 设置页面加载策略
     options.page_load_strategy = 'eager'
@@ -72,15 +110,28 @@ def initialize_driver():
                 
             driver.set_page_load_timeout(30)  # 增加页面加载超时时间
             driver.set_script_timeout(30)     # 设置脚本执行超时时间
+            if lean:
+                block_media_requests(driver)
             return driver
         except WebDriverException as e:
             if attempt == max_retries - 1:
                 raise e
+            metrics.RETRIES.inc('browser_start')
             print(f"创建驱动失败，正在重试 ({attempt + 1}/{max_retries})")
             time.sleep(retry_delay)
             retry_delay *= 2  # 指数退避
 
 
+def block_media_requests(driver):
+    """通过CDP屏蔽图片、视频和字体请求，减少浏览器的CPU、内存和带宽占用"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        print(f"屏蔽媒体请求失败，将加载全部资源: {str(e)}")
+
+
+@tracing.traced(cat="browser")
 def cookies_web(driver, cookie_path):
     # 设置浏览器的cookie
     print("设置cookie中.....")
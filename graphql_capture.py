@@ -0,0 +1,79 @@
+import json
+from selenium.common.exceptions import WebDriverException
+from json_process import iter_tweet_results, parse_tweet
+from download_method import print
+from seen_set import SeenSet
+
+"""
+GraphQL响应拦截模块
+
+通过Chrome的performance日志实时捕获时间线相关的GraphQL响应(SearchTimeline等)，
+并直接从JSON中解析出推文ID、发布时间、图片、视频和互动数据，无需解析页面DOM。
+由于数据来自接口响应，虚拟列表已经从DOM中移除的推文同样可以获取。
+
+主要类:
+- GraphQLCapture: 增量读取performance日志并返回新捕获的推文
+
+依赖浏览器开启performance日志(goog:loggingPrefs)。
+"""
+
+# 需要捕获的GraphQL接口关键字，搜索页和标签页均为SearchTimeline
+TIMELINE_KEYWORDS = ('SearchTimeline', 'UserMedia', 'UserTweets')
+
+
+class GraphQLCapture:
+    def __init__(self, driver, url_keywords=TIMELINE_KEYWORDS):
+        self.driver = driver
+        self.url_keywords = url_keywords
+        self.pending_requests = {}  # requestId -> url，已收到响应头但body尚未加载完成
+        self.seen = SeenSet()  # 已返回的推文ID
+
+    def _match(self, response):
+        return "json" in response.get("mimeType", "") and any(k in response.get("url", "") for k in self.url_keywords)
+
+    def poll_bodies(self):
+        """读取上次调用以来的performance日志，返回新加载完成的响应JSON列表"""
+        try:
+            logs_raw = self.driver.get_log("performance")
+        except WebDriverException as e:
+            print(f"读取performance日志失败: {str(e)}")
+            return []
+
+        finished = []
+        for lr in logs_raw:
+            try:
+                log = json.loads(lr["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            method = log.get("method")
+            if method == "Network.responseReceived":
+                response = log["params"]["response"]
+                if self._match(response):
+                    self.pending_requests[log["params"]["requestId"]] = response["url"]
+            elif method == "Network.loadingFinished":
+                request_id = log["params"]["requestId"]
+                if request_id in self.pending_requests:
+                    finished.append(request_id)
+            elif method == "Network.loadingFailed":
+                # 被取消或屏蔽的请求不会再有loadingFinished，立即移除，避免在整个爬取过程中积累
+                self.pending_requests.pop(log["params"]["requestId"], None)
+
+        bodies = []
+        for request_id in finished:
+            resp_url = self.pending_requests.pop(request_id)
+            try:
+                body = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})['body']
+                bodies.append(json.loads(body))
+            except (WebDriverException, ValueError) as e:
+                print(f"获取响应内容失败: {resp_url} {str(e)}")
+        return bodies
+
+    def poll_tweets(self):
+        """返回新捕获的推文列表（按响应中的顺序，已去重），每条推文为json_process.parse_tweet的结果"""
+        tweets = []
+        for body in self.poll_bodies():
+            for result in iter_tweet_results(body):
+                tweet = parse_tweet(result)
+                if tweet and self.seen.add(tweet["tweet_id"]):
+                    tweets.append(tweet)
+        return tweets
@@ -0,0 +1,160 @@
+import threading
+from contextlib import contextmanager
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+import config
+
+try:
+    import httpx  # 可选依赖，启用HTTP/2时需要安装httpx[http2]
+except ImportError:
+    httpx = None
+
+"""
+HTTP客户端模块
+
+为所有下载器提供一个共享的、线程安全的HTTP客户端，避免每次下载都重新建立TCP+TLS连接。
+
+主要功能:
+- 按主机复用连接池，保持keep-alive
+- 可配置连接池大小(config.http_pool_size)
+- 可选HTTP/2多路复用(config.http2，需要安装httpx[http2])
+
+主要函数:
+- get_client: 获取共享客户端(requests.Session或httpx.Client)
+- get: 使用共享客户端发送GET请求
+- stream: 流式GET请求，按块读取响应内容，适合大文件下载
+- close_client: 关闭共享客户端，下次调用时按最新配置重新创建
+- set_hook: 安装录制/回放钩子（见session_recorder.py），所有请求经过钩子处理
+"""
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# 超时异常，兼容requests和httpx两种客户端，流式读取时urllib3的超时异常不会被requests包装
+TIMEOUT_ERRORS = (requests.Timeout, urllib3.exceptions.ReadTimeoutError) + ((httpx.TimeoutException,) if httpx else ())
+# 可重试的网络异常（超时、连接中断等）
+NETWORK_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError) + ((httpx.HTTPError,) if httpx else ())
+
+_client = None
+_client_lock = threading.Lock()
+_hook = None  # 录制/回放钩子，None时正常发送请求
+
+
+def _create_client():
+    pool_size = config.http_pool_size
+    if config.http2:
+        if httpx is not None:
+            try:
+                return httpx.Client(
+                    http2=True,
+                    follow_redirects=True,
+                    headers={'User-Agent': USER_AGENT},
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                )
+            except ImportError:
+                print("未安装h2库，无法启用HTTP/2，使用HTTP/1.1连接池")
+        else:
+            print("未安装httpx库，无法启用HTTP/2，使用HTTP/1.1连接池")
+
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    # pool_connections为缓存的主机数，pool_maxsize为每个主机保持的连接数
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size, pool_block=False)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_client():
+    """获取共享的HTTP客户端，首次调用时创建"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def set_hook(hook):
+    """
+    安装录制/回放钩子，hook为None时恢复正常请求
+
+    hook.get(send, url, **kwargs)和hook.stream(send, url, **kwargs)接收真正发送请求的函数send，
+    录制时调用send并记录响应，回放时直接返回录制的响应
+    """
+    global _hook
+    _hook = hook
+
+
+def get_hook():
+    return _hook
+
+
+def _client_get(url, timeout=10, **kwargs):
+    return get_client().get(url, timeout=timeout, **kwargs)
+
+
+def get(url, timeout=10, **kwargs):
+    """使用共享连接池发送GET请求，返回的响应对象支持status_code/content/headers"""
+    if _hook is not None:
+        return _hook.get(_client_get, url, timeout=timeout, **kwargs)
+    return _client_get(url, timeout=timeout, **kwargs)
+
+
+class _RequestsStream:
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.response = response
+
+    def iter_chunks(self, chunk_size):
+        # 不能直接读response.raw：会话发送了Accept-Encoding，raw中的gzip/deflate内容不会被解压
+        yield from self.response.iter_content(chunk_size)
+
+
+class _HttpxStream:
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.response = response
+
+    def iter_chunks(self, chunk_size):
+        yield from self.response.iter_bytes(chunk_size)
+
+
+def stream(url, timeout=10, headers=None):
+    """
+    使用共享连接池发送流式GET请求
+
+    返回的响应对象包含status_code、headers，以及iter_chunks(chunk_size)方法，
+    iter_chunks按chunk_size大小逐块返回解压后的响应内容
+    """
+    if _hook is not None:
+        return _hook.stream(_client_stream, url, timeout=timeout, headers=headers)
+    return _client_stream(url, timeout=timeout, headers=headers)
+
+
+@contextmanager
+def _client_stream(url, timeout=10, headers=None):
+    client = get_client()
+    if httpx is not None and isinstance(client, httpx.Client):
+        with client.stream('GET', url, timeout=timeout, headers=headers) as response:
+            yield _HttpxStream(response)
+    else:
+        response = client.get(url, timeout=timeout, headers=headers, stream=True)
+        try:
+            yield _RequestsStream(response)
+        finally:
+            response.close()
+
+
+def close_client():
+    """关闭共享客户端并释放连接"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception:
+                pass
+            _client = None
@@ -0,0 +1,219 @@
+import os
+import sys
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import config
+import media_index
+import download_method
+
+try:
+    from PIL import Image  # 可选依赖，未安装时不启用感知哈希去重
+except ImportError:
+    Image = None
+
+"""
+感知哈希近似重复图片检测模块
+
+同一张图片被不同账号重新上传后会得到不同的media ID，跨运行索引无法识别。本模块在图片下载
+完成后于进程池中计算dHash，与已下载图片比较汉明距离，发现近似重复时按配置将新文件替换为
+原文件的硬链接(link)或直接删除(delete)。哈希保存在媒体索引数据库中，跨运行有效。
+
+主要函数:
+- dhash: 计算图片的64位dHash
+- schedule: 下载完成后提交后台哈希计算（download_pic等调用）
+- wait: 等待所有已提交的哈希计算和去重完成
+- dedupe_folder: 批量对已有结果文件夹去重
+
+命令行用法:
+    python image_dedup.py <文件夹> [--threshold 3] [--action link|delete]
+"""
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+BANDS = 4  # 64位哈希分成4段，每段16位，汉明距离不超过3时至少有一段完全相同
+
+
+def dhash(filepath, hash_size=8):
+    """计算图片的dHash，返回64位整数"""
+    with Image.open(filepath) as img:
+        pixels = list(img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _hash_file(filepath):
+    # 在子进程中执行，无法解析的图片返回None
+    try:
+        return filepath, dhash(filepath)
+    except Exception:
+        return filepath, None
+
+
+def _bands(value):
+    return [(i, (value >> (16 * i)) & 0xFFFF) for i in range(BANDS)]
+
+
+class PHashIndex:
+    """按16位分段建立倒排索引，查找近似重复时只比较至少有一段相同的候选"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.entries = []
+        index = media_index.get_index()
+        if index is not None:
+            for file_path, value in index.all_phashes():
+                if os.path.exists(file_path):
+                    self._add(file_path, value)
+
+    def _add(self, file_path, value):
+        self.entries.append((file_path, value))
+        for band in _bands(value):
+            self.buckets.setdefault(band, []).append((file_path, value))
+
+    def _candidates(self, value):
+        if self.threshold >= BANDS:
+            return self.entries  # 阈值过大时分段索引不再保证完整，退化为全量比较
+        candidates = {}
+        for band in _bands(value):
+            for file_path, existing_value in self.buckets.get(band, []):
+                candidates[file_path] = existing_value
+        return candidates.items()
+
+    def match_or_add(self, file_path, value):
+        """查找近似重复的已有文件，找到时返回其路径，否则将该文件加入索引并返回None"""
+        with self.lock:
+            for existing_path, existing_value in self._candidates(value):
+                if existing_path != file_path and bin(existing_value ^ value).count('1') <= self.threshold:
+                    return existing_path
+            self._add(file_path, value)
+        index = media_index.get_index()
+        if index is not None:
+            index.record_phash(file_path, value)
+        return None
+
+
+_pool = None
+_phash_index = None
+_pending = set()
+_state_lock = threading.Lock()
+_idle = threading.Event()
+_idle.set()
+
+
+def enabled():
+    return bool(config.phash_dedup) and Image is not None
+
+
+def _get_phash_index():
+    global _phash_index
+    if _phash_index is None:
+        _phash_index = PHashIndex(config.phash_threshold)
+    return _phash_index
+
+
+def _resolve_duplicate(file_path, original_path, action):
+    """按action处理近似重复文件：link替换为原文件的硬链接，delete直接删除"""
+    try:
+        if not os.path.exists(original_path) or os.path.samefile(file_path, original_path):
+            return
+        if action == 'delete':
+            os.remove(file_path)
+        else:
+            temp_path = file_path + '.link'
+            media_index.link_or_copy(original_path, temp_path)
+            os.replace(temp_path, file_path)
+        download_method.log_print(f"{os.path.basename(file_path)} 与 {original_path} 近似重复，已{'删除' if action == 'delete' else '替换为硬链接'}")
+    except OSError as e:
+        download_method.log_print(f"处理近似重复图片时出错: {str(e)}")
+
+
+def _on_hashed(future):
+    try:
+        file_path, value = future.result()
+        if value is not None:
+            original_path = _get_phash_index().match_or_add(file_path, value)
+            if original_path:
+                _resolve_duplicate(file_path, original_path, config.phash_action)
+    except Exception as e:
+        download_method.log_print(f"计算图片感知哈希时出错: {str(e)}")
+    finally:
+        with _state_lock:
+            _pending.discard(future)
+            if not _pending:
+                _idle.set()
+
+
+def schedule(file_path):
+    """图片下载完成后调用，在进程池中计算感知哈希并处理近似重复，未启用时直接返回"""
+    global _pool
+    if not enabled():
+        return
+    with _state_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=config.phash_workers or None)
+        future = _pool.submit(_hash_file, file_path)
+        _pending.add(future)
+        _idle.clear()
+    future.add_done_callback(_on_hashed)
+
+
+def wait(timeout=None):
+    """等待所有已提交的哈希计算完成，返回是否在超时前全部完成"""
+    return _idle.wait(timeout)
+
+
+def shutdown():
+    """等待剩余任务并关闭进程池"""
+    global _pool
+    wait()
+    with _state_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def dedupe_folder(folder, threshold=None, action=None):
+    """
+    批量对已有文件夹中的图片去重，按修改时间从旧到新处理，较早的文件视为原图
+
+    Returns:
+        (处理的图片数, 近似重复数)
+    """
+    if Image is None:
+        download_method.log_print("未安装Pillow库，无法计算感知哈希，请先执行 pip install Pillow")
+        return 0, 0
+    action = action or config.phash_action
+    phash_index = PHashIndex(config.phash_threshold if threshold is None else threshold)
+    files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    files.sort(key=os.path.getmtime)
+
+    duplicates = 0
+    with ProcessPoolExecutor(max_workers=config.phash_workers or None) as pool:
+        for file_path, value in pool.map(_hash_file, files, chunksize=16):
+            if value is None:
+                continue
+            original_path = phash_index.match_or_add(file_path, value)
+            if original_path:
+                duplicates += 1
+                _resolve_duplicate(file_path, original_path, action)
+    download_method.log_print(f"共检查 {len(files)} 张图片，发现 {duplicates} 张近似重复")
+    return len(files), duplicates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对已有结果文件夹中的图片按感知哈希去重")
+    parser.add_argument("folder", help="图片所在文件夹")
+    parser.add_argument("--threshold", type=int, default=None, help="判定为近似重复的最大汉明距离")
+    parser.add_argument("--action", choices=["link", "delete"], default=None, help="link替换为硬链接，delete直接删除")
+    args = parser.parse_args()
+    if not os.path.isdir(args.folder):
+        print(f"文件夹 {args.folder} 不存在")
+        sys.exit(1)
+    dedupe_folder(args.folder, args.threshold, args.action)
@@ -1,15 +1,23 @@
-def json_value_find(json_obj, key):
-    # 递归查找JSON对象中的指定键的值，返回一个列表
-    results = []
+from datetime import datetime
+
+
+def iter_json_values(json_obj, key):
+    # 递归查找JSON对象中的指定键的值，逐个返回，不在每一层创建和合并列表
     if isinstance(json_obj, dict):
         for k, v in json_obj.items():
             if k == key:
-                results.append(v)
-            results.extend(json_value_find(v, key))
+                yield v
+            if isinstance(v, (dict, list)):
+                yield from iter_json_values(v, key)
     elif isinstance(json_obj, list):
         for item in json_obj:
-            results.extend(json_value_find(item, key))
-    return results
+            if isinstance(item, (dict, list)):
+                yield from iter_json_values(item, key)
+
+
+def json_value_find(json_obj, key):
+    # 递归查找JSON对象中的指定键的值，返回一个列表
+    return list(iter_json_values(json_obj, key))
 
 
 def get_max_bitrate_url(variants):
@@ -22,3 +30,68 @@ def get_max_bitrate_url(variants):
             max_bitrate = variant["bitrate"]
             max_bitrate_url = variant["url"]
     return max_bitrate_url
+
+
+def iter_tweet_results(json_obj):
+    # 遍历GraphQL响应，逐个返回tweet_results中的推文对象，跳过推广内容
+    if isinstance(json_obj, dict):
+        if "tweet_results" in json_obj and "promotedMetadata" not in json_obj:
+            result = json_obj["tweet_results"].get("result")
+            if isinstance(result, dict):
+                # 受限可见的推文会多包一层tweet
+                yield result.get("tweet", result)
+        for k, v in json_obj.items():
+            if k != "tweet_results":
+                yield from iter_tweet_results(v)
+    elif isinstance(json_obj, list):
+        for item in json_obj:
+            yield from iter_tweet_results(item)
+
+
+def parse_created_at(created_at):
+    # 将GraphQL的created_at（如'Wed Jun 11 09:00:07 +0000 2025'）转换为ISO 8601格式
+    try:
+        return datetime.strptime(created_at, '%a %b %d %H:%M:%S %z %Y').isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_photo_url(media_url_https):
+    # 将media_url_https（如https://pbs.twimg.com/media/xxx.jpg）转换为原图下载链接
+    prefix, filename = media_url_https.rsplit('/', 1)
+    return f"{prefix}/{filename.split('.')[0]}?format=png&name=large"
+
+
+def parse_tweet(result):
+    # 从单个推文对象中提取推文ID、发布时间、图片、视频和互动数据，无法解析时返回None
+    legacy = result.get("legacy")
+    if not isinstance(legacy, dict) or "id_str" not in legacy:
+        return None
+
+    user = result.get("core", {}).get("user_results", {}).get("result", {})
+    screen_name = user.get("core", {}).get("screen_name") or user.get("legacy", {}).get("screen_name") or "i"
+
+    photos = []
+    videos = []
+    for media in legacy.get("extended_entities", {}).get("media", []):
+        if media.get("type") == "photo" and media.get("media_url_https"):
+            photos.append(get_photo_url(media["media_url_https"]))
+        elif media.get("type") in ("video", "animated_gif"):
+            videos.append({
+                "type": media["type"],
+                "variants": media.get("video_info", {}).get("variants", []),
+            })
+
+    return {
+        "tweet_id": legacy["id_str"],
+        "created_at": parse_created_at(legacy.get("created_at")),
+        "post_link": f"https://x.com/{screen_name}/status/{legacy['id_str']}",
+        "photos": photos,
+        "videos": videos,
+        "favorite_count": legacy.get("favorite_count", 0),
+        "retweet_count": legacy.get("retweet_count", 0),
+        "reply_count": legacy.get("reply_count", 0),
+        "quote_count": legacy.get("quote_count", 0),
+        "bookmark_count": legacy.get("bookmark_count", 0),
+        "view_count": int(result.get("views", {}).get("count", 0) or 0),
+    }
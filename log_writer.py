@@ -0,0 +1,106 @@
+import time
+import queue
+import atexit
+import threading
+import sys
+
+"""
+后台日志写入模块
+
+所有下载线程的日志行先放入队列，由单个后台线程按文件批量追加写入，避免每条日志都
+打开/关闭一次文件，也避免多线程同时写文件时内容交错。
+
+- 累计flush_lines行或距上次写入超过flush_interval秒时批量写入
+- flush()会阻塞到调用之前的所有日志都写入磁盘，读取或移动日志文件前需要调用
+- 程序退出时自动flush
+- 每批写入后关闭文件，不长期占用文件句柄，Windows下也可以正常移动日志文件
+
+主要函数:
+- write: 追加一行日志到指定文件
+- flush: 等待已提交的日志全部写入
+"""
+
+flush_lines = 256  # 累计多少行日志后立即写入
+flush_interval = 0.5  # 最长多少秒写入一次
+
+
+class LogWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+                    self.thread.start()
+
+    def write(self, path, text):
+        """将text追加到path，text需自带换行符"""
+        self._ensure_started()
+        self.queue.put((path, text))
+
+    def flush(self, timeout=10):
+        """等待调用前提交的日志全部写入文件，返回是否在超时前完成"""
+        if self.thread is None or not self.thread.is_alive():
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        buffers = {}
+        pending = 0
+        last_flush = time.time()
+        while True:
+            try:
+                item = self.queue.get(timeout=flush_interval)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, threading.Event):
+                self._write_buffers(buffers)
+                pending = 0
+                last_flush = time.time()
+                item.set()
+                continue
+            if item is not None:
+                path, text = item
+                buffers.setdefault(path, []).append(text)
+                pending += 1
+
+            if pending and (pending >= flush_lines or time.time() - last_flush >= flush_interval):
+                self._write_buffers(buffers)
+                pending = 0
+                last_flush = time.time()
+
+    @staticmethod
+    def _write_buffers(buffers):
+        for path, lines in buffers.items():
+            if not lines:
+                continue
+            try:
+                with open(path, "a", encoding="utf-8") as log_file:
+                    log_file.write("".join(lines))
+            except Exception as e:
+                sys.stderr.write(f"写入日志文件时发生错误: {str(e)}\n")
+                sys.stderr.flush()
+        buffers.clear()
+
+
+_writer = LogWriter()
+
+
+def write(path, text):
+    """追加一行日志到path（后台批量写入）"""
+    _writer.write(path, text)
+
+
+def flush(timeout=10):
+    """等待所有已提交的日志写入文件"""
+    return _writer.flush(timeout)
+
+
+atexit.register(flush)
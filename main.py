@@ -3,10 +3,16 @@ import time
 import shutil
 import threading
 import signal
-from datetime import datetime
+import argparse
+from datetime import datetime, timedelta
 from termcolor import cprint
 from config import tag
 import twitter_Crawler
+import browser_pool
+import manifest
+import crawl_state
+import checkpoint
+from search_query import build_search_url, date_range, parse_time, format_search_time
 from saveDZ_crawler import crawl_tag_images
 from save_image_urls import main as save_image_urls
 
@@ -27,8 +33,17 @@ def create_result_folder():
         os.makedirs(result_folder)
     return result_folder
 
-def run_twitter_crawler(result_folder):
-    """运行Twitter爬虫"""
+def run_twitter_crawler(result_folder, since=None, until=None, log_name="download_log.txt", checkpoint_path=None):
+    """
+    运行Twitter爬虫
+    
+    Args:
+        result_folder: 结果文件夹
+        since, until: 搜索的时间范围[since, until)，默认为config中start_time当天0点到end_time次日0点（UTC），
+                      按时间分片并行爬取时为分片的范围，多个分片写入同一个结果文件夹
+        log_name: 日志文件名，并行爬取的分片各自使用单独的日志文件
+        checkpoint_path: 断点文件路径，默认为结果文件夹中与日志文件对应的checkpoint.json，从断点继续时沿用原断点文件
+    """
     driver = None
     try:
         cprint("\n开始运行Twitter爬虫...", "blue")
@@ -39,23 +54,23 @@ def run_twitter_crawler(result_folder):
             
         cprint(f"\n将爬取 {twitter_Crawler.start_time} 到 {twitter_Crawler.end_time} 之间的帖子\n", "red")
 
-        driver = twitter_Crawler.initialize_driver()
-
+        # 从浏览器池获取已登录的浏览器，多次运行之间复用
         try:
-            driver.get('https://x.com/i/flow/login')
-        except twitter_Crawler.TimeoutException:
-            driver.execute_script('window.stop()')
-        driver.set_page_load_timeout(60)
-
-        try:
-            driver.get('https://x.com')
-            twitter_Crawler.cookies_web(driver, "X_cookie.json")
+            driver = browser_pool.acquire(
+                capture_network=twitter_Crawler.needs_network_capture(twitter_Crawler.user_choice))
         except Exception as e:
             print(f"访问失败，请检查网络连接: {str(e)}")
             return
 
+        # 使用since:/until:限定搜索时间范围，搜索结果直接从end_time开始，不再滚动浏览更新的帖子
+        if since is None or until is None:
+            since, until = date_range(twitter_Crawler.start_time, twitter_Crawler.end_time)
+        since, until = parse_time(since), parse_time(until)
+        start_filter = since.isoformat()
+        end_filter = (until - timedelta(microseconds=1)).isoformat()
+
         print("访问推特页面中.....")
-        target_url = f"https://x.com/search?q={tag}&src=typed_query&f=live"
+        target_url = build_search_url(tag, since, until)
         driver.get(target_url)
         print("准备获取数据中.....")
 
@@ -65,36 +80,52 @@ def run_twitter_crawler(result_folder):
 
         # 创建time_crawler_result文件夹
         folder = os.path.join(result_folder, "time_crawler_result")
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        os.makedirs(folder, exist_ok=True)  # 按时间分片并行爬取时多个进程共用该文件夹
 
         # 创建视频文件夹
         video_folder = os.path.join(folder, "video & gif")
         if "2" in twitter_Crawler.user_choice or "3" in twitter_Crawler.user_choice:
-            if not os.path.exists(video_folder):
-                os.makedirs(video_folder)
+            os.makedirs(video_folder, exist_ok=True)
 
         # 设置日志文件的目标文件夹和初始化日志文件
         from download_method import set_target_folder, move_log_file
-        set_target_folder(folder)
+        # 从断点继续时继续写入断点对应的下载清单
+        set_target_folder(folder, log_name, checkpoint.manifest_name_for(checkpoint_path) if checkpoint_path else None)
         
         # 创建并初始化日志文件
-        log_file_path = os.path.join(folder, "download_log.txt")
+        log_file_path = os.path.join(folder, log_name)
         with open(log_file_path, "w", encoding="utf-8") as f:
             f.write(f"下载日志创建时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"爬取标签: {tag}\n")
             f.write("-" * 50 + "\n")
             f.write(f"图片将保存在文件夹: {folder}\n")
-            f.write(f"时间范围: {twitter_Crawler.start_time} 到 {twitter_Crawler.end_time}\n")
+            f.write(f"时间范围: {format_search_time(since)} 到 {format_search_time(until)}（不含）\n")
             f.write(f"日志文件: {log_file_path}\n\n")
             f.write("开始爬取...\n")
 
         cprint(f"开始爬取数据...., url为：{target_url}", "yellow")
         
+        # 增量爬取：读取该搜索条件上次完整爬取时的高水位，到达后停止
+        state = crawl_state.get_state()
+        state_key = crawl_state.query_key(tag, format_search_time(since), twitter_Crawler.user_choice)
+        progress = crawl_state.CrawlProgress(state.high_water_id(state_key) if state else None)
+        if progress.stop_at_id:
+            cprint(f"增量爬取：将在到达上次爬取的位置（推文ID {progress.stop_at_id}）时停止", "yellow")
+
+        # 定期保存爬取断点，中断后可使用--resume继续
+        crawl_checkpoint = checkpoint.Checkpoint(
+            checkpoint_path or os.path.join(folder, checkpoint.checkpoint_name(log_name)),
+            {"tag": tag, "user_choice": twitter_Crawler.user_choice,
+             "since": since.isoformat(), "until": until.isoformat()},
+            progress).start()
+
         download_completed = False
         try:
-            twitter_Crawler.download_media(driver, folder, video_folder, twitter_Crawler.user_choice, is_media, twitter_Crawler.start_time, twitter_Crawler.end_time)
+            twitter_Crawler.download_media(driver, folder, video_folder, twitter_Crawler.user_choice, is_media,
+                                           start_filter, end_filter, progress=progress, checkpoint=crawl_checkpoint)
             download_completed = True
+            if state and state.commit(state_key, progress):
+                print(f"已更新增量爬取位置: 推文ID {progress.newest_id}")
             
         except KeyboardInterrupt:
             print("\n检测到用户中断，正在安全退出...")
@@ -102,11 +133,18 @@ def run_twitter_crawler(result_folder):
             print(f"发生错误: {str(e)}")
         finally:
             twitter_Crawler.running = False
+
+            # 没有找到任何帖子时也视为已完成
+            try:
+                crawl_checkpoint.close(download_completed and (progress.completed or progress.oldest_id is None))
+            except Exception as e:
+                print(f"保存爬取断点时出错: {str(e)}")
             
             try:
-                print(f'\n共下载 {len([f for f in os.listdir(folder) if f.endswith(".png")])} 张图片')
+                manifest_file = manifest.manifest_path
+                print(f'\n共下载 {manifest.count_downloaded(manifest_file, "image")} 张图片')
                 if "2" in twitter_Crawler.user_choice or "3" in twitter_Crawler.user_choice:
-                    print(f'共下载 {len(os.listdir(video_folder))} 个视频')
+                    print(f'共下载 {manifest.count_downloaded(manifest_file, "video")} 个视频')
             except Exception as e:
                 print(f"统计文件数量时发生错误: {str(e)}")
             
@@ -116,53 +154,13 @@ def run_twitter_crawler(result_folder):
         if download_completed:
             cprint(f"Twitter爬虫结果已保存到: {folder}", "green")
             # 保存图片链接
-            save_image_urls(os.path.join(folder, "download_log.txt"), folder)
+            save_image_urls(log_file_path, folder)
 
     except Exception as e:
         cprint(f"Twitter爬虫运行出错: {str(e)}", "red")
     finally:
-        # 确保浏览器实例被正确关闭
-        if driver:
-            try:
-                # 关闭所有相关的窗口
-                for handle in driver.window_handles:
-                    driver.switch_to.window(handle)
-                    driver.close()
-                driver.quit()
-                
-                # 确认浏览器真正关闭
-                print("浏览器正在关闭...")
-                time.sleep(1)  # 给予关闭时间
-                
-                # 尝试执行一个简单命令，如果失败说明浏览器已经关闭
-                try:
-                    driver.title
-                    print("浏览器未能正常关闭，尝试强制终止...")
-                    # 强制结束进程
-                    try:
-                        import psutil
-                        driver_process = psutil.Process(driver.service.process.pid)
-                        for proc in driver_process.children(recursive=True):
-                            proc.kill()
-                        driver_process.kill()
-                    except:
-                        pass
-                except:
-                    print("浏览器已成功关闭")
-                
-            except Exception as e:
-                print(f"关闭浏览器时发生错误: {str(e)}")
-                # 强制结束进程
-                try:
-                    import psutil
-                    process = psutil.Process(driver.service.process.pid)
-                    for proc in process.children(recursive=True):
-                        proc.terminate()
-                    process.terminate()
-                except:
-                    pass
-            finally:
-                driver = None  # 确保引用被清除
+        # 归还浏览器，供下一个爬虫任务复用
+        browser_pool.release(driver)
 
 def run_dz_crawler(result_folder):
     """运行点赞爬虫"""
@@ -180,61 +178,51 @@ def run_dz_crawler(result_folder):
         if folder:
             cprint(f"热度爬虫结果已保存到: {dz_folder}", "green")
             # 保存图片链接
-            save_image_urls(os.path.join(dz_folder, f"{tag}_dianzan_log.txt"), dz_folder)
+            save_image_urls(log_file, dz_folder)
             
     except Exception as e:
         cprint(f"热度爬虫运行出错: {str(e)}", "red")
 
-def clean_browser_resources():
-    """清理浏览器资源，确保不同爬虫之间不会互相影响"""
-    print("\n正在清理浏览器资源...")
-    
-    # 尝试结束所有Chrome相关进程
-    try:
-        import psutil
-        
-        # 查找并终止所有Chrome相关进程
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                if 'chrome' in proc.info['name'].lower() or 'chromedriver' in proc.info['name'].lower():
-                    print(f"尝试终止进程: {proc.info['name']} (PID: {proc.info['pid']})")
-                    proc.kill()
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-    except ImportError:
-        print("未安装psutil库，无法清理Chrome进程")
-    except Exception as e:
-        print(f"清理Chrome进程时出错: {str(e)}")
-    
-    # 等待一段时间，确保进程完全终止
-    time.sleep(3)
-    
-    # 清理临时文件
-    try:
-        import tempfile
-        import shutil
-        import glob
-        
-        # 尝试清理临时文件夹中的Chrome相关文件
-        temp_dir = tempfile.gettempdir()
-        chrome_temp_patterns = [
-            os.path.join(temp_dir, "scoped_dir*"),
-            os.path.join(temp_dir, "chrome_*"),
-        ]
-        
-        for pattern in chrome_temp_patterns:
-            for item in glob.glob(pattern):
-                try:
-                    if os.path.isdir(item):
-                        shutil.rmtree(item, ignore_errors=True)
-                    else:
-                        os.remove(item)
-                except:
-                    pass
-    except Exception as e:
-        print(f"清理临时文件时出错: {str(e)}")
-    
-    print("浏览器资源清理完成\n")
+def resume(path=None):
+    """
+    从断点继续中断的爬取：先下载未完成和失败的媒体，再用until:只搜索断点之前的帖子
+
+    Args:
+        path: 断点文件或结果文件夹，为空时使用当前标签最近的断点
+    """
+    global tag
+    checkpoint_path = checkpoint.find_checkpoint(path, tag)
+    data = checkpoint.load(checkpoint_path) if checkpoint_path else None
+    if data is None:
+        cprint("没有找到可以继续的爬取断点", "red")
+        return
+    cprint(f"从断点继续: {checkpoint_path}（更新于 {data['updated_at']}）", "yellow")
+
+    # 沿用断点中的搜索条件
+    tag = data["tag"]
+    twitter_Crawler.tag = tag
+    twitter_Crawler.user_choice = data["user_choice"]
+
+    folder = os.path.dirname(os.path.abspath(checkpoint_path))
+    result_folder = os.path.dirname(folder)
+    log_name = f"download_log_resume_{time.strftime('%Y%m%d_%H%M%S')}.txt"
+    checkpoint.drain_pending(data, folder, log_name, checkpoint.manifest_name_for(checkpoint_path))
+
+    if not data["crawl_completed"]:
+        until = checkpoint.resume_until(data)
+        cprint(f"继续爬取 {data['since']} 到 {until.isoformat()} 之间的帖子", "blue")
+        run_twitter_crawler(result_folder, data["since"], until, log_name, checkpoint_path)
+        return
+
+    # 时间范围已经爬取完，只需要重新下载失败的媒体
+    save_image_urls(None, folder)
+    crawl_checkpoint = checkpoint.Checkpoint(checkpoint_path, {k: data[k] for k in ("tag", "user_choice", "since", "until")},
+                                             crawl_state.CrawlProgress())
+    remaining = crawl_checkpoint.close(crawl_completed=True)
+    if remaining:
+        cprint(f"仍有 {len(remaining['failed']) + len(remaining['pending'])} 个媒体未能下载", "red")
+    else:
+        cprint("断点中的媒体已全部下载完成", "green")
 
 def main():
     """主函数"""
@@ -251,11 +239,7 @@ def main():
         cprint("\n开始执行全部爬取模式...", "blue")
         run_twitter_crawler(result_folder)
         
-        # 在两个爬虫之间清理资源
-        if running:
-            clean_browser_resources()
-        
-        # 如果用户没有中断，再运行点赞爬虫
+        # 如果用户没有中断，再运行点赞爬虫（复用浏览器池中已登录的浏览器）
         if running:
             run_dz_crawler(result_folder)
 
@@ -265,6 +249,20 @@ def main():
         cprint("\n检测到用户中断，正在安全退出...", "yellow")
     except Exception as e:
         cprint(f"运行出错: {str(e)}", "red")
+    finally:
+        browser_pool.shutdown()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="按时间和热度爬取标签下的图片和视频")
+    parser.add_argument("--resume", nargs="?", const="", default=None, metavar="PATH",
+                        help="从断点继续中断的爬取，PATH为断点文件或结果文件夹，不指定时使用当前标签最近的断点")
+    args = parser.parse_args()
+    if args.resume is not None:
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        try:
+            resume(args.resume or None)
+        finally:
+            browser_pool.shutdown()
+    else:
+        main() 
\ No newline at end of file
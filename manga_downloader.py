@@ -1,22 +1,31 @@
 import os
 import time
-import json
 import queue
 import signal
 import threading
 import sys
 import requests
-import subprocess
 from download_method import download_pic, download_video, print, cprint
 from selenium.common.exceptions import InvalidArgumentException, TimeoutException, WebDriverException
-from json_process import json_value_find, get_max_bitrate_url
+from json_process import get_max_bitrate_url
+from graphql_capture import GraphQLCapture
+from scroll_scheduler import ScrollScheduler
+from seen_set import SeenSet
+from search_query import parse_time
+from async_downloader import AsyncDownloadEngine
+from checkpoint import PendingQueue
+from session_recorder import SessionRecorder
+import image_dedup
+import metrics
+import tracing
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.remote.webelement import WebElement
 from tenacity import retry, stop_after_attempt, wait_exponential
 from termcolor import cprint as original_cprint
-from datetime import datetime
+from datetime import datetime, timedelta
+import config
 
 """
 漫画下载器
@@ -56,6 +65,10 @@ def signal_handler(signum, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+# 时间线末尾的最旧推文与start_time相差不超过该值时，才认为已爬取到start_time
+END_OF_FEED_MARGIN = timedelta(days=1)
+
+@tracing.traced(cat="browser")
 def safe_find_elements(driver, by, value, max_retries=3):
     """安全地查找元素，带有重试机制"""
     for attempt in range(max_retries):
@@ -66,6 +79,7 @@ def safe_find_elements(driver, by, value, max_retries=3):
             if attempt == max_retries - 1:
                 print(f"查找元素失败: {str(e)}")
                 return []
+            metrics.RETRIES.inc('find_elements')
             time.sleep(2 ** attempt)
     return []
 
@@ -84,18 +98,15 @@ def is_post_in_timerange(post_time: str, start_time: str, end_time: str) -> bool
     
     Args:
         post_time: 帖子时间，格式为 ISO 8601 (例如: '2025-06-10T09:00:07.000Z')
-        start_time: 开始时间，格式为 'YYYY-MM-DD'
-        end_time: 结束时间，格式为 'YYYY-MM-DD'
+        start_time: 开始时间，格式为 'YYYY-MM-DD' 或 ISO 8601（按时间分片爬取时）
+        end_time: 结束时间，格式为 'YYYY-MM-DD'（包含当天）或 ISO 8601
     
     Returns:
         bool: 是否在时间范围内
     """
     try:
-        post_datetime = datetime.fromisoformat(post_time.replace('Z', '+00:00'))
-        start_datetime = datetime.fromisoformat(f"{start_time}T00:00:00+00:00")
-        end_datetime = datetime.fromisoformat(f"{end_time}T23:59:59+00:00")
-        
-        return start_datetime <= post_datetime <= end_datetime
+        post_datetime = parse_time(post_time)
+        return parse_time(start_time) <= post_datetime <= parse_time(end_time, end=True)
     except:
         return False
     
@@ -105,19 +116,182 @@ def is_system_continue(post_time: str, start_time: str) -> bool:
     判断帖子时间是否在指定的时间范围内，用于判断是否需要继续爬取，如果在start_time之前，则结束程序
     Args:
         post_time: 帖子时间，格式为 ISO 8601 (例如: '2025-06-10T09:00:07.000Z')
+        start_time: 开始时间，格式为 'YYYY-MM-DD' 或 ISO 8601
     """
     try:
-        post_datetime = datetime.fromisoformat(post_time.replace('Z', '+00:00'))
-        start_datetime = datetime.fromisoformat(f"{start_time}T00:00:00+00:00")
-
-        return post_datetime <= start_datetime
+        return parse_time(post_time) < parse_time(start_time)
     except:
         return False
 
 
-def url_producer(driver, q, user_choice, is_media, start_time=None, end_time=None):
+# 单次execute_script批量提取所有未处理的推文单元，处理过的单元会打上data-crawled标记（值为推文ID）
+# 虚拟列表回收的节点显示了另一条推文时ID会变化，需要重新读取；还没有渲染出<time>的单元不标记，下一轮再读取
+CELL_EXTRACT_JS = r"""
+const cells = document.querySelectorAll("div[data-testid='cellInnerDiv']");
+const result = [];
+for (const cell of cells) {
+    const time = cell.querySelector('time');
+    if (!time) continue;
+    const href = time.parentElement ? time.parentElement.href || null : null;
+    const match = href ? href.match(/\/status\/(\d+)/) : null;
+    const mark = match ? match[1] : (href || time.getAttribute('datetime') || '');
+    if (cell.dataset.crawled === mark) continue;
+    cell.dataset.crawled = mark;
+    result.push({
+        tweet_id: match ? match[1] : null,
+        datetime: time ? time.getAttribute('datetime') : null,
+        href: href,
+        media_srcs: Array.from(cell.querySelectorAll('img'), img => img.src).filter(src => src)
+    });
+}
+return result;
+"""
+
+def parse_tweet_id(post_link):
+    """从帖子链接(.../status/<id>)中解析推文ID，解析失败返回None"""
+    if not post_link or "/status/" not in post_link:
+        return None
+    tweet_id = post_link.split("/status/")[1].split("/")[0].split("?")[0]
+    return tweet_id if tweet_id.isdigit() else None
+
+def batch_extract_cells(driver):
+    """
+    通过一次execute_script批量提取当前页面中新出现的推文单元
+    
+    Returns:
+        list: [{tweet_id, datetime, href, media_srcs}, ...]
+    """
+    try:
+        with tracing.span("batch_extract_cells", "browser") as span:
+            cells = driver.execute_script(CELL_EXTRACT_JS) or []
+            if span is not None:
+                span.args["cells"] = len(cells)
+            return cells
+    except WebDriverException as e:
+        print(f"批量提取推文失败: {str(e)}")
+        return []
+
+def element_extract_cells(driver, seen_elements):
+    """逐元素提取推文单元（旧模式，每个单元需要多次WebDriver往返），返回结构与batch_extract_cells一致"""
+    cells = []
+    for data in safe_find_elements(driver, By.CSS_SELECTOR, "div[data-testid='cellInnerDiv']"):
+        try:
+            # 跳过已读取过的元素，减少WebDriver往返；同一推文的新元素由url_producer按推文ID去重
+            if not seen_elements.add(data.id):
+                continue
+            cells.append(extract_element(data))
+        except Exception as element_error:
+            print(f"处理单个元素时发生错误: {str(element_error)}")
+            continue
+    return cells
+
+@tracing.traced("extract_cell", "browser")
+def extract_element(data):
+    """从单个cellInnerDiv元素中读取推文链接、时间和图片"""
+    # 获取帖子链接和时间
+    try:
+        time_element = data.find_element(By.CSS_SELECTOR, "time")
+        post_time = time_element.get_attribute("datetime")
+        post_link = time_element.find_element(By.XPATH, "..").get_attribute("href")
+    except:
+        post_time = None
+        post_link = None
+
+    srcs = [safe_get_attribute(img, 'src') for img in safe_find_elements(data, By.TAG_NAME, "img")]
+    return {
+        'tweet_id': parse_tweet_id(post_link),
+        'datetime': post_time,
+        'href': post_link,
+        'media_srcs': [src for src in srcs if src],
+    }
+
+def extract_cells(driver, seen_elements, mode=None):
+    """
+    按配置的提取模式获取新的推文单元
+    
+    Args:
+        driver: Selenium WebDriver实例
+        seen_elements: 已读取元素的SeenSet，仅element模式使用
+        mode: 'batch'为单次往返批量提取，'element'为逐元素提取，默认读取config.extract_mode
+    """
+    mode = mode or config.extract_mode
+    if mode == 'element':
+        return element_extract_cells(driver, seen_elements)
+    return batch_extract_cells(driver)
+
+def media_urls_from_srcs(srcs):
+    """过滤头像等非媒体图片，并将图片src转换为原图下载链接"""
+    media_urls = []
+    for src in srcs:
+        if src and "profile_images" not in src and 'media' in src:
+            media_urls.append(src.split('?')[0] + "?format=png&name=large")
+    return media_urls
+
+def queue_tweet_videos(tweet, q, user_choice, queued_videos):
+    """
+    将推文中按下载类型需要的视频/GIF（最高码率）加入下载队列
+    
+    queued_videos为已加入队列的视频链接(SeenSet)，转发和引用的推文中重复出现的视频只加入一次
+    """
+    for video in tweet['videos']:
+        if (video['type'] == 'video' and "2" in user_choice) or (video['type'] == 'animated_gif' and "3" in user_choice):
+            video_url = get_max_bitrate_url(video['variants'])
+            if video_url and queued_videos.add(video_url):
+                print(f"视频链接: {video_url}")
+                q.put((tweet['post_link'], video_url))
+                metrics.MEDIA_ENQUEUED.inc('time', 'video')
+
+def feed_completed(scheduler, progress, start_time=None, end_time=None):
+    """
+    连续多次滚动没有新内容时，判断是否真的爬取完了整个时间范围
+    
+    被限流或时间线出错时同样不再加载新内容，这时把高水位更新为已见到的最新推文，之后的增量爬取
+    会永远跳过没有爬到的部分。只有页面没有错误提示，并且已处理的最旧推文到达了上次爬取的高水位，
+    或与start_time相差不超过END_OF_FEED_MARGIN（时间范围较短时为范围的四分之一）时才算完整
+    """
+    if scheduler.timeline_error():
+        cprint("时间线显示加载出错（可能被限流），本次爬取不完整，不更新爬取位置", "red")
+        return False
+    if progress.stop_at_id is not None and progress.oldest_id is not None and progress.oldest_id <= progress.stop_at_id:
+        return True
+    try:
+        start = parse_time(start_time)
+        margin = END_OF_FEED_MARGIN
+        if end_time:
+            margin = min(margin, (parse_time(end_time, end=True) - start) / 4)
+        if parse_time(progress.oldest_time) - start <= margin:
+            return True
+    except (TypeError, ValueError):
+        pass
+    cprint(f"时间线没有新内容，但最旧的推文({progress.oldest_time})离start_time还很远，本次爬取不完整，不更新爬取位置", "red")
+    return False
+
+def stream_videos(capture, q, user_choice, queued_videos, start_time=None, end_time=None):
+    """
+    读取滚动期间新加载完成的时间线接口响应，将其中的视频/GIF加入下载队列
+    
+    每轮滚动调用一次，performance日志随时读取随时清空，不会在浏览器中积累整个会话的网络事件，
+    响应内容也在加载完成后立即获取，不会因为被浏览器回收而丢失
+    """
+    for tweet in capture.poll_tweets():
+        post_time = tweet['created_at']
+        if start_time and end_time and post_time and not is_post_in_timerange(post_time, start_time, end_time):
+            continue
+        queue_tweet_videos(tweet, q, user_choice, queued_videos)
+
+def url_producer(driver, q, user_choice, is_media, start_time=None, end_time=None, progress=None):
+    """
+    DOM模式的生产者：解析页面中的推文元素，将媒体链接加入下载队列
+    
+    progress为crawl_state.CrawlProgress时记录见到的最新推文，并在到达上次爬取的高水位时停止
+    """
     global running
     print("等待页面加载...")
+    seen = SeenSet()  # 按推文ID去重，虚拟列表回收后重新创建的节点不会被重复处理
+    # 选择下载视频/GIF时（开启了performance日志），滚动过程中同步从接口响应中获取视频
+    capture = GraphQLCapture(driver) if "2" in user_choice or "3" in user_choice else None
+    queued_videos = SeenSet()
+    reached_end = False  # 到达start_time或上次的高水位，停止后仍需读取最后一轮的接口响应
     
     try:
         # 使用显式等待，最多等待60秒直到元素出现
@@ -139,8 +313,8 @@ def url_producer(driver, q, user_choice, is_media, start_time=None, end_time=Non
             q.put(None)  # 确保在超时情况下也发送结束信号
             return
         
-        processed_elements = set()  # 用于跟踪已处理的元素
-        last_height = driver.execute_script("return document.body.scrollHeight")
+        seen_elements = SeenSet()  # 已读取的元素（仅element提取模式使用）
+        scheduler = ScrollScheduler(driver)
         
         while running:
             try:
@@ -151,83 +325,77 @@ def url_producer(driver, q, user_choice, is_media, start_time=None, end_time=Non
                     print("\n浏览器已关闭")
                     break
                 
-                # 获取当前可见的元素
-                elements = safe_find_elements(driver, By.CSS_SELECTOR, "div[data-testid='cellInnerDiv']")
-                if elements:
-                    # 处理新发现的元素
-                    for data in elements:
-                        if not running:
-                            break
-                            
-                        try:
-                            element_id = data.id
-                            if element_id in processed_elements:
+                # 获取当前新出现的帖子
+                for cell in extract_cells(driver, seen_elements):
+                    if not running:
+                        break
+                        
+                    try:
+                        post_time = cell.get('datetime') or "未知时间"
+                        post_link = cell.get('href') or "未知链接"
+                        
+                        if cell.get('tweet_id') and not seen.add(cell['tweet_id']):
+                            metrics.SKIPS.inc('duplicate_tweet')
+                            continue
+                        metrics.TWEETS_SCANNED.inc('time')
+                        
+                        # 增量爬取：到达上次完整爬取的位置后停止
+                        if progress is not None:
+                            if progress.reached_mark(cell.get('tweet_id')):
+                                cprint(f"已到达上次爬取的位置（推文ID {progress.stop_at_id}），停止获取新帖子\n", "red")
+                                progress.finish()
+                                running = False
+                                reached_end = True
+                                break
+                            progress.observe(cell.get('tweet_id'), post_time)
+                        
+                        # 检查帖子时间是否在指定范围内，因为是根据最新的页面进行爬取，所以如果遇到超过end_time的帖子，直接结束程序
+                        if start_time and end_time and post_time != "未知时间":
+                            # 先检查帖子时间是否在start_time之前，如果是，则结束程序
+                            if is_system_continue(post_time, start_time):
+                                cprint(f"获取到帖子时间为{post_time}，已经超出start_time，停止获取新帖子\n", "red")
+                                cprint("=" * 30 + "下载线程继续运行" + "=" * 30 + "\n", "blue")
+                                if progress is not None:
+                                    progress.finish()
+                                running = False  # 结束当前获取URL的线程，但不影响下载线程
+                                reached_end = True
+                                break
+
+                            # 调用is_post_in_timerange函数判断帖子时间是否在指定范围内
+                            if not is_post_in_timerange(post_time, start_time, end_time):
+                                metrics.SKIPS.inc('out_of_range')
+                                cprint(f"\n跳过时间范围外的帖子：{post_link}", "yellow")
+                                cprint(f"帖子时间：{post_time}", "yellow")
                                 continue
 
-                            # 获取帖子链接和时间
-                            try:
-                                time_element = data.find_element(By.CSS_SELECTOR, "time")
-                                post_time = time_element.get_attribute("datetime")
-                                post_link = time_element.find_element(By.XPATH, "..").get_attribute("href")
-                            except:
-                                post_time = "未知时间"
-                                post_link = "未知链接"
-                            
-                            # 检查帖子时间是否在指定范围内，因为是根据最新的页面进行爬取，所以如果遇到超过end_time的帖子，直接结束程序
-                            if start_time and end_time and post_time != "未知时间":
-                                # 先检查帖子时间是否在start_time之前，如果是，则结束程序
-                                if is_system_continue(post_time, start_time):
-                                    cprint(f"获取到帖子时间为{post_time}，已经超出start_time，停止获取新帖子\n", "red")
-                                    cprint("=" * 30 + "下载线程继续运行" + "=" * 30 + "\n", "blue")
-                                    processed_elements.add(element_id)
-                                    running = False  # 结束当前获取URL的线程
-                                    q.put(None)  # 确保在提前结束时也发送结束信号
-                                    return  # 直接返回，结束url_producer函数，但不影响下载线程
-
-                                # 调用is_post_in_timerange函数判断帖子时间是否在指定范围内
-                                if not is_post_in_timerange(post_time, start_time, end_time):
-                                    cprint(f"\n跳过时间范围外的帖子：{post_link}", "yellow")
-                                    cprint(f"帖子时间：{post_time}", "yellow")
-                                    processed_elements.add(element_id)
-                                    continue
-
-                            if "1" in user_choice:
-                                images = safe_find_elements(data, By.TAG_NAME, "img")
-                                if images:
-                                    cprint(f"\n当前帖子的url为：{post_link}", "green")
-                                    print(f"时间为：{post_time}，找到{len(images)}张图片")
-                                    # print(f"找到 {len(images)} 张图片")
-                                
-                                for img in images:
-                                    src = safe_get_attribute(img, 'src')
-                                    if src and "profile_images" not in src and 'media' in src:
-                                        media_url = src[:src.find('?')] + "?format=png&name=large"
-                                        print(f"媒体链接: {media_url}")
-                                        # 将帖子链接和媒体URL一起添加到队列，修改前为只添加media_url，打印到log文件中
-                                        q.put((post_link, media_url))
-                                        
-                            processed_elements.add(element_id)
+                        if "1" in user_choice:
+                            media_urls = media_urls_from_srcs(cell.get('media_srcs') or [])
+                            if media_urls:
+                                cprint(f"\n当前帖子的url为：{post_link}", "green")
+                                print(f"时间为：{post_time}，找到{len(media_urls)}张图片")
                             
-                        except Exception as element_error:
-                            print(f"处理单个元素时发生错误: {str(element_error)}")
-                            continue
+                            for media_url in media_urls:
+                                print(f"媒体链接: {media_url}")
+                                # 将帖子链接和媒体URL一起添加到队列，修改前为只添加media_url，打印到log文件中
+                                q.put((post_link, media_url))
+                                metrics.MEDIA_ENQUEUED.inc('time', 'image')
+                        
+                    except Exception as element_error:
+                        print(f"处理单个元素时发生错误: {str(element_error)}")
+                        continue
                 
                 if not running:
                     break
+                
+                if capture is not None:
+                    stream_videos(capture, q, user_choice, queued_videos, start_time, end_time)
                     
-                # 滚动页面
+                # 滚动页面，新推文出现后立即继续，连续多次没有新内容时认为到达时间线末尾
                 try:
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(3)  # 增加等待时间到3秒
-                    
-                    new_height = driver.execute_script("return document.body.scrollHeight")
-                    if new_height == last_height:
-                        # 如果高度没有变化，可能是加载完了或者需要等待更久
-                        time.sleep(5)  # 增加等待时间到5秒
-                        new_height = driver.execute_script("return document.body.scrollHeight")
-                        if new_height == last_height:
-                            print("页面暂时没有新内容，继续尝试...")
-                    last_height = new_height
+                    if not scheduler.scroll_and_wait() and scheduler.end_of_feed:
+                        if progress is not None and feed_completed(scheduler, progress, start_time, end_time):
+                            progress.finish()
+                        break
                 except WebDriverException:
                     print("\n浏览器已关闭")
                     break
@@ -242,23 +410,123 @@ def url_producer(driver, q, user_choice, is_media, start_time=None, end_time=Non
     except Exception as e:
         print(f"发生错误：{str(e)}")
     
-    # 程序结束前的清理工作
+    # 读取最后一轮滚动加载的接口响应，到达start_time或高水位时这一批中仍在时间范围内的视频也要加入队列
     try:
-        if running:  # 如果不是用户手动停止的，尝试处理视频内容
-            media_video(driver, q, user_choice, is_media)
+        if (running or reached_end) and capture is not None:
+            stream_videos(capture, q, user_choice, queued_videos, start_time, end_time)
     except Exception as video_error:
         print(f"处理视频内容时发生错误: {str(video_error)}")
     
     q.put(None)  # 发送结束信号
-    print("\n爬取结束，正在等待下载完成...")
+    print(f"\n爬取结束，共跳过 {seen.suppressed} 次重复出现的推文，正在等待下载完成...")
 
-def url_consumer(q, folder, video_folder, active_threads):
+def graphql_url_producer(driver, q, user_choice, start_time=None, end_time=None, progress=None):
+    """
+    GraphQL拦截模式的生产者：直接从SearchTimeline等接口响应中获取推文和媒体链接，
+    不解析页面DOM，视频和GIF在滚动过程中同步加入下载队列
+    
+    progress为crawl_state.CrawlProgress时记录见到的最新推文，并在到达上次爬取的高水位时停止
+    """
+    global running
+    print("等待时间线接口响应...")
+
+    capture = GraphQLCapture(driver)
+    queued_videos = SeenSet()
+    scheduler = ScrollScheduler(driver)
+    poll_interval = 0.5
+    first_response = True
+
+    try:
+        while running:
+            tweets = capture.poll_tweets()
+            if not tweets and first_response:
+                # 页面打开后时间线接口会自动请求第一页，最多等待60秒
+                deadline = time.time() + 60
+                while running and not tweets and time.time() < deadline:
+                    time.sleep(poll_interval)
+                    tweets = capture.poll_tweets()
+                if not tweets:
+                    print("\n等待超时：1分钟内未能捕获任何时间线接口响应，正在退出程序...")
+                    break
+            elif not tweets:
+                # 滚动页面触发下一页请求，新推文渲染后立即读取接口响应
+                try:
+                    scheduler.scroll_and_wait()
+                except WebDriverException:
+                    print("\n浏览器已关闭")
+                    break
+                tweets = capture.poll_tweets()
+                if not tweets:
+                    if scheduler.end_of_feed:
+                        if progress is not None and feed_completed(scheduler, progress, start_time, end_time):
+                            progress.finish()
+                        break
+                    continue
+
+            first_response = False
+            for tweet in tweets:
+                if not running:
+                    break
+
+                post_time = tweet['created_at'] or "未知时间"
+                post_link = tweet['post_link']
+                metrics.TWEETS_SCANNED.inc('time')
+
+                # 增量爬取：到达上次完整爬取的位置后停止
+                if progress is not None:
+                    if progress.reached_mark(tweet['tweet_id']):
+                        cprint(f"已到达上次爬取的位置（推文ID {progress.stop_at_id}），停止获取新帖子\n", "red")
+                        progress.finish()
+                        running = False
+                        break
+                    progress.observe(tweet['tweet_id'], post_time)
+
+                if start_time and end_time and post_time != "未知时间":
+                    if is_system_continue(post_time, start_time):
+                        cprint(f"获取到帖子时间为{post_time}，已经超出start_time，停止获取新帖子\n", "red")
+                        cprint("=" * 30 + "下载线程继续运行" + "=" * 30 + "\n", "blue")
+                        if progress is not None:
+                            progress.finish()
+                        running = False
+                        break
+
+                    if not is_post_in_timerange(post_time, start_time, end_time):
+                        metrics.SKIPS.inc('out_of_range')
+                        cprint(f"\n跳过时间范围外的帖子：{post_link}", "yellow")
+                        cprint(f"帖子时间：{post_time}", "yellow")
+                        continue
+
+                if "1" in user_choice and tweet['photos']:
+                    cprint(f"\n当前帖子的url为：{post_link}", "green")
+                    print(f"时间为：{post_time}，找到{len(tweet['photos'])}张图片，"
+                          f"点赞{tweet['favorite_count']}，转发{tweet['retweet_count']}")
+                    for media_url in tweet['photos']:
+                        print(f"媒体链接: {media_url}")
+                        q.put((post_link, media_url))
+                        metrics.MEDIA_ENQUEUED.inc('time', 'image')
+
+                queue_tweet_videos(tweet, q, user_choice, queued_videos)
+
+    except Exception as e:
+        print(f"发生错误：{str(e)}")
+
+    running = False
+    q.put(None)  # 发送结束信号
+    print(f"\n爬取结束，共跳过 {capture.seen.suppressed} 次重复出现的推文，正在等待下载完成...")
+
+def url_consumer(q, folder, video_folder, active_threads, engine=None):
+    """
+    消费者：从队列中取出媒体链接并下载
+    
+    engine为AsyncDownloadEngine时，任务直接提交到异步下载引擎，不再为每个文件创建线程
+    """
     empty_count = 0  # 记录队列连续为空的次数
     max_empty_count = 10  # 最大允许的连续空队列次数，可以根据需要调整
     while True:
         try:
             try:
-                item = q.get(timeout=5)
+                with tracing.span("queue_get", "queue"):
+                    item = q.get(timeout=5)
                 empty_count = 0  # 重置空队列计数
             except queue.Empty:
                 # 清理已完成的线程
@@ -280,19 +548,29 @@ def url_consumer(q, folder, video_folder, active_threads):
             else:
                 post_link, src = None, item
 
+            # 使用异步下载引擎时直接提交，并发数由引擎控制
+            if engine is not None:
+                with tracing.span("queue_handoff", "queue", url=src):
+                    if "mp4" not in src:
+                        engine.submit(post_link, src, folder, 'image')
+                    else:
+                        engine.submit(post_link, src, video_folder, 'video')
+                q.task_done()
+                continue
+
             # 清理已完成的线程
             active_threads[:] = [t for t in active_threads if t.is_alive()]
 
-            # 如果活跃线程太多，等待一些完成
-            while len(active_threads) > 5:
-                time.sleep(0.5)
-                active_threads[:] = [t for t in active_threads if t.is_alive()]
+            # 如果活跃线程太多，等待一些完成；创建新的下载线程，如果src为视频，则创建视频下载线程，否则创建图片下载线程
+            with tracing.span("queue_handoff", "queue", url=src):
+                while len(active_threads) > 5:
+                    time.sleep(0.5)
+                    active_threads[:] = [t for t in active_threads if t.is_alive()]
 
-            # 创建新的下载线程，如果src为视频，则创建视频下载线程，否则创建图片下载线程
-            if "mp4" not in src:
-                thread = download_thread_png(post_link, src, folder)
-            else:
-                thread = download_thread_video(src, video_folder)
+                if "mp4" not in src:
+                    thread = download_thread_png(post_link, src, folder)
+                else:
+                    thread = download_thread_video(src, video_folder, post_link)
 
             active_threads.append(thread)
             q.task_done()
@@ -308,53 +586,14 @@ def download_thread_png(post_link, src, folder):
 
     return thread
 
-def download_thread_video(src, video_folder):
+def download_thread_video(src, video_folder, post_link=None):
     # 创建线程下载视频
-    thread = threading.Thread(target=download_video, args=(src, video_folder), daemon=True)
+    thread = threading.Thread(target=download_video, args=(src, video_folder, post_link), daemon=True)
     thread.start()
     return thread
 
-def media_video(driver, q, user_choice, is_media):
-    # 从浏览器日志network中提取视频URL
-    logs_raw = driver.get_log("performance")
-    logs = [json.loads(lr["message"])["message"] for lr in logs_raw]
-    # print(logs)
-    def log_filter(log_):
-        # if (log_["method"] == "Network.responseReceived" and "json" in log_["params"]["response"]["mimeType"]
-        #         and 'UserMedia' in log_["params"]["response"]["url"]):
-        #     print(log_["params"]["response"])
-        url_keyword = 'UserMedia' if is_media else 'Usertwitters'
-        return (
-            log_["method"] == "Network.responseReceived"
-            and "json" in log_["params"]["response"]["mimeType"]
-            and url_keyword in log_["params"]["response"]["url"]
-        )
-
-    variants_lists = []
-    for log in filter(log_filter, logs):
-        request_id = log["params"]["requestId"]
-        resp_url = log["params"]["response"]["url"]
-        # print(f"Caught {resp_url}")
-        res = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})['body']
-        res = json.loads(res)
-        # print(res)
-
-        all_variants = json_value_find(res, "variants")
-        # print(all_variants)
-        for variants in all_variants:
-            if variants not in variants_lists:
-                variants_lists.append(variants)
-                temp = get_max_bitrate_url(variants)
-                if "2" in user_choice:
-                    if not any(isinstance(item, tuple) and item[1] == temp or item == temp for item in list(q.queue)) and 'pu' in temp:
-                        # print(temp)
-                        q.put((None, temp))
-                if "3" in user_choice:
-                    if not any(isinstance(item, tuple) and item[1] == temp or item == temp for item in list(q.queue)) and 'pu' not in temp:
-                        # print(temp)
-                        q.put((None, temp))
-
-def download_media(driver, folder, video_folder, user_choice, is_media, start_time=None, end_time=None):
+def download_media(driver, folder, video_folder, user_choice, is_media, start_time=None, end_time=None, backend=None, progress=None,
+                   checkpoint=None, session=None):
     """
     下载媒体文件的主函数
     
@@ -366,17 +605,54 @@ def download_media(driver, folder, video_folder, user_choice, is_media, start_ti
         is_media: 是否是媒体页面
         start_time: 开始日期（YYYY-MM-DD格式）
         end_time: 结束日期（YYYY-MM-DD格式）
+        backend: 获取推文的方式，'dom'为解析页面元素，'graphql'为拦截接口响应，默认读取config.crawl_backend
+        progress: crawl_state.CrawlProgress，增量爬取时记录最新推文并在到达上次的高水位时停止
+        checkpoint: checkpoint.Checkpoint，记录加入下载队列的媒体，中断后可从断点继续
+        session: session_recorder.SessionReplayer，回放录制的会话时使用；为None且设置了config.record_session时录制本次会话
     """
+    backend = backend or config.crawl_backend
+    metrics.start_server()
+    recorder = None
+    if session is None and config.record_session:
+        session = recorder = SessionRecorder(config.record_session, {
+            "user_choice": user_choice, "is_media": is_media,
+            "start_time": start_time, "end_time": end_time, "backend": backend,
+        })
+    try:
+        _download_media(driver, folder, video_folder, user_choice, is_media, start_time, end_time, backend,
+                        progress, checkpoint, session)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        tracing.save()
+
+def _download_media(driver, folder, video_folder, user_choice, is_media, start_time, end_time, backend,
+                    progress, checkpoint, session):
+    if session is not None:
+        # 录制时包装真实的浏览器，回放时使用按录制内容响应的ReplayDriver
+        driver = session.wrap_driver(driver)
     # 重置全局状态和浏览器状态
     reset_browser_state(driver)
     
-    q = queue.Queue()
+    if session is not None:
+        q = session.new_queue(checkpoint)  # 统计队列等待时间，有断点时同时记录断点
+    elif checkpoint is not None:
+        q = PendingQueue(checkpoint)
+    else:
+        q = queue.Queue()
+    metrics.QUEUE_DEPTH.set_function(q.qsize, 'time')
     
     # 创建活跃线程列表，用于跟踪所有下载线程
     active_threads = []
     
+    # 使用异步下载引擎时，所有下载在同一个事件循环中进行
+    engine = AsyncDownloadEngine().start() if config.download_engine == 'async' else None
+    
     # 创建并启动生产者线程
-    producer = threading.Thread(target=url_producer, args=(driver, q, user_choice, is_media, start_time, end_time), daemon=True)
+    if backend == 'graphql':
+        producer = threading.Thread(target=graphql_url_producer, args=(driver, q, user_choice, start_time, end_time, progress), daemon=True)
+    else:
+        producer = threading.Thread(target=url_producer, args=(driver, q, user_choice, is_media, start_time, end_time, progress), daemon=True)
     producer.start()
 
     # 给页面足够的加载时间
@@ -390,10 +666,12 @@ def download_media(driver, folder, video_folder, user_choice, is_media, start_ti
         
     if q.empty():
         cprint("没有找到需要下载的媒体文件，结束程序", "yellow")
+        if engine is not None:
+            engine.stop()
         return
     
     # 创建并启动消费者线程
-    consumer = threading.Thread(target=url_consumer, args=(q, folder, video_folder, active_threads), daemon=True)
+    consumer = threading.Thread(target=url_consumer, args=(q, folder, video_folder, active_threads, engine), daemon=True)
     consumer.start()
     
     # 等待生产者线程完成
@@ -417,32 +695,22 @@ def download_media(driver, folder, video_folder, user_choice, is_media, start_ti
         if t.is_alive():
             t.join(timeout=5)
     
-    # 下载完成后，调用save_image_urls.py脚本保存媒体链接
+    # 等待异步下载引擎中的任务完成
+    if engine is not None:
+        if not engine.join(timeout=300):
+            cprint(f"仍有 {engine.in_flight} 个下载未完成，程序将继续执行", "red")
+        engine.stop()
+    
+    # 等待近似重复图片检测完成
+    image_dedup.wait()
+    
+    # 下载完成后，根据下载清单(manifest.jsonl)生成image.txt
     try:
-        cprint("\n正在从日志中提取媒体链接...", "blue")
-        # 检查save_image_urls.py是否存在
-        if os.path.exists("save_image_urls.py"):
-            # 方法1: 直接在当前进程中运行脚本
-            try:
-                from save_image_urls import extract_media_urls, save_urls_to_file
-                
-                # 提取媒体链接
-                media_urls = extract_media_urls("download_log.txt")
-                
-                # 将链接保存到图片文件夹中的image.txt
-                image_txt_path = os.path.join(folder, "image.txt")
-                if media_urls and save_urls_to_file(media_urls, image_txt_path):
-                    cprint(f"已将 {len(media_urls)} 个媒体链接保存到 {image_txt_path}", "green")
-                else:
-                    print(f"未找到媒体链接或保存失败")
-            except Exception as e:
-                cprint(f"提取媒体链接时发生错误: {str(e)}", "red")
-                # 如果方法1失败，尝试方法2
-                subprocess.run([sys.executable, "save_image_urls.py"], check=False)
-        else:
-            cprint("未找到save_image_urls.py脚本，跳过提取媒体链接", "yellow")
+        cprint("\n正在根据下载清单保存媒体链接...", "blue")
+        from save_image_urls import main as save_image_urls
+        save_image_urls(os.path.join(folder, "download_log.txt"), folder)
     except Exception as e:
-        cprint(f"调用save_image_urls.py脚本时出错: {str(e)}", "red")
+        cprint(f"保存媒体链接时出错: {str(e)}", "red")
             
     cprint("所有下载任务已完成", "green")
 
@@ -463,6 +731,13 @@ def reset_browser_state(driver):
         driver.execute_script("window.localStorage.clear();")
         driver.execute_script("window.sessionStorage.clear();")
         
+        # 清除性能日志以避免前一次运行的日志影响，需在刷新前清除，避免丢失刷新后首屏的接口响应
+        # 未开启performance日志（精简模式只下载图片）时跳过
+        try:
+            driver.get_log("performance")
+        except WebDriverException:
+            pass
+        
         # 刷新页面以确保获取最新内容
         driver.refresh()
         time.sleep(2)
@@ -470,9 +745,6 @@ def reset_browser_state(driver):
         # 尝试滚动到页面顶部
         driver.execute_script("window.scrollTo(0, 0);")
         
-        # 清除性能日志以避免前一次运行的日志影响
-        driver.get_log("performance")
-        
         print("浏览器状态已重置")
     except Exception as e:
         print(f"重置浏览器状态时出错: {str(e)}")
@@ -0,0 +1,166 @@
+import os
+import glob
+import json
+import time
+import tempfile
+import log_writer
+import metrics
+
+"""
+下载清单模块
+
+每个媒体下载结束后（无论成功与否）向结果文件夹中的manifest.jsonl追加一条JSON记录，
+包括帖子链接、媒体链接、本地文件、字节数、状态和耗时。image.txt和最终的下载统计直接由清单
+一次线性扫描生成，不再用正则表达式反复解析人类可读的日志。
+
+按时间分片并行爬取时，多个进程同时追加同一个文件会使记录交错（Windows上多进程追加不是原子的），
+因此每个分片与日志文件一样写入单独的清单(manifest_<分片>.jsonl)，全部分片完成后由merge合并为manifest.jsonl。
+
+记录状态:
+- downloaded: 本次下载成功
+- exists: 文件已存在，跳过下载
+- reused: 从跨运行媒体索引复用本地文件
+- failed: 下载失败（状态码不为200或发生错误）
+- timeout: 下载超时
+
+主要函数:
+- manifest_name: 与日志文件对应的清单文件名
+- set_folder: 设置清单所在的结果文件夹
+- merge: 将各分片的清单合并为manifest.jsonl
+- record: 追加一条下载记录（由后台日志线程批量写入）
+- read_manifest: 逐条读取清单记录
+- summarize: 按媒体链接汇总每个媒体的最终状态
+"""
+
+MANIFEST_NAME = "manifest.jsonl"
+SUCCESS_STATUSES = ('downloaded', 'exists', 'reused')
+
+manifest_path = None
+
+
+def manifest_name(log_name="download_log.txt"):
+    """清单文件名，按时间分片并行爬取时与日志文件一样每个分片单独一个文件"""
+    return os.path.splitext(log_name.replace("download_log", "manifest", 1))[0] + ".jsonl"
+
+
+def set_folder(folder, name=MANIFEST_NAME):
+    """设置清单所在的结果文件夹，之后的记录都写入该文件夹下的name（默认manifest.jsonl）"""
+    global manifest_path
+    manifest_path = os.path.join(folder, name)
+
+
+def shard_manifests(folder):
+    """文件夹中各分片的清单，按文件名排序"""
+    return sorted(glob.glob(os.path.join(glob.escape(folder), "manifest_*.jsonl")))
+
+
+def merge(folder):
+    """
+    将各分片的清单按文件名顺序合并为manifest.jsonl，分片清单保留（断点继续时仍需要）
+
+    写入临时文件后原子替换，多个进程同时合并时不会留下写了一半的manifest.jsonl
+
+    Returns:
+        合并后的清单路径，没有分片清单时返回None
+    """
+    shards = shard_manifests(folder)
+    if not shards:
+        return None
+    log_writer.flush()
+    target = os.path.join(folder, MANIFEST_NAME)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".manifest.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for path in shards:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # 分片进程中断时最后一行可能只写了一半，补上换行，读取时会跳过该行
+                if data and not data.endswith(b"\n"):
+                    data += b"\n"
+                out.write(data)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target
+
+
+def record(tweet_link, media_url, file_path, status, size=None, started=None, kind='image'):
+    """
+    追加一条下载记录
+
+    Args:
+        tweet_link: 帖子链接，可为None
+        media_url: 媒体链接
+        file_path: 本地文件路径，失败时只用于确定清单位置，可为None
+        status: 下载状态，见模块说明
+        size: 文件字节数
+        started: 开始处理的时间戳(time.time())，用于计算耗时
+        kind: 'image'或'video'
+    """
+    duration = time.time() - started if started else 0
+    metrics.DOWNLOAD_SECONDS.observe(duration, kind, status)
+    if status in ('exists', 'reused'):
+        metrics.SKIPS.inc(status)
+    path = manifest_path
+    if path is None:
+        if file_path is None:
+            return
+        # 未设置结果文件夹时写到媒体文件所在的文件夹
+        path = os.path.join(os.path.dirname(os.path.abspath(file_path)), MANIFEST_NAME)
+    entry = {
+        "tweet_link": tweet_link,
+        "media_url": media_url,
+        "file": os.path.basename(file_path) if file_path and status in SUCCESS_STATUSES else None,
+        "kind": kind,
+        "bytes": size,
+        "status": status,
+        "duration": round(duration, 3),
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    log_writer.write(path, json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def read_manifest(path):
+    """逐条读取清单记录，跳过损坏的行（如程序中断时写了一半的最后一行）"""
+    log_writer.flush()
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def summarize(path, kind=None):
+    """
+    按媒体链接汇总清单，同一媒体有多条记录时以最后一条为准，但成功的记录不会被之后的失败覆盖
+
+    Args:
+        path: 清单文件路径
+        kind: 只汇总指定类型('image'/'video')，None表示全部
+
+    Returns:
+        按首次出现顺序排列的{media_url: 记录}字典
+    """
+    entries = {}
+    for entry in read_manifest(path):
+        if kind is not None and entry.get("kind", "image") != kind:
+            continue
+        url = entry.get("media_url")
+        previous = entries.get(url)
+        if previous is not None and previous["status"] in SUCCESS_STATUSES and entry["status"] not in SUCCESS_STATUSES:
+            continue
+        entries[url] = entry
+    return entries
+
+
+def count_downloaded(path, kind=None):
+    """统计清单中成功获得本地文件的媒体数量"""
+    return sum(1 for entry in summarize(path, kind).values() if entry["status"] in SUCCESS_STATUSES)
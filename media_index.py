@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import config
+from save_image_urls import get_media_id
+
+"""
+跨运行的媒体索引模块
+
+使用SQLite记录已经下载过的媒体，键为规范化的媒体ID(pbs.twimg.com/media/<id>或视频ID)，
+同时记录文件路径、大小、SHA-256和来源推文。下载前先查询索引，已下载过且文件仍存在、大小和
+SHA-256与记录一致时直接硬链接（或复制）到本次的结果文件夹，不再发起HTTP请求。图片的感知哈希
+也保存在同一数据库中。默认不启用，设置config.media_index后生效。
+
+主要函数:
+- canonical_media_id: 从媒体URL中提取规范化的媒体ID
+- get_index: 获取全局索引实例，config.media_index为空时返回None
+- link_or_copy: 硬链接文件，跨磁盘等无法链接时复制
+"""
+
+# 视频URL中的媒体ID，如ext_tw_video/1820996061462458371、tweet_video/GUaFj4zWMAAbRNh
+_VIDEO_ID_PATTERN = re.compile(r'(ext_tw_video|amplify_video|tweet_video)/([A-Za-z0-9_\-]+)')
+
+
+def canonical_media_id(url):
+    """从媒体URL中提取规范化的媒体ID，同一媒体的不同尺寸/格式/码率得到相同的ID"""
+    video_match = _VIDEO_ID_PATTERN.search(url)
+    if video_match:
+        return f"{video_match.group(1)}/{video_match.group(2)}"
+    return get_media_id(url)
+
+
+def file_sha256(filepath):
+    """计算文件的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """将已有文件硬链接到dst，无法硬链接时复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class MediaIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        # 多个下载线程共用一个连接，由self.lock串行化；多进程同时访问时依赖WAL和busy timeout
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    media_id TEXT PRIMARY KEY,
+                    url TEXT,
+                    file_path TEXT NOT NULL,
+                    size INTEGER,
+                    sha256 TEXT,
+                    tweet_link TEXT,
+                    downloaded_at REAL
+                )
+            """)
+            # 感知哈希(dHash)，用于image_dedup检测近似重复图片
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS phash (
+                    file_path TEXT PRIMARY KEY,
+                    hash INTEGER NOT NULL
+                )
+            """)
+            self.conn.commit()
+
+    def lookup(self, media_id):
+        """查询媒体记录，返回sqlite3.Row或None"""
+        with self.lock:
+            return self.conn.execute("SELECT * FROM media WHERE media_id = ?", (media_id,)).fetchone()
+
+    def find_existing(self, url):
+        """
+        查询该媒体已下载且文件仍然完好的路径，没有时返回None
+
+        文件的大小和SHA-256与下载时记录的不一致（被截断或修改过）时不复用，重新下载后会更新记录
+        """
+        media_id = canonical_media_id(url)
+        if not media_id:
+            return None
+        row = self.lookup(media_id)
+        if row is None:
+            return None
+        file_path = row['file_path']
+        try:
+            if row['size'] is not None and os.path.getsize(file_path) != row['size']:
+                return None
+            if row['sha256'] and file_sha256(file_path) != row['sha256']:
+                return None
+        except OSError:
+            return None
+        return file_path
+
+    def record(self, url, file_path, size, sha256=None, tweet_link=None):
+        """记录一次成功的下载"""
+        media_id = canonical_media_id(url)
+        if not media_id:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media (media_id, url, file_path, size, sha256, tweet_link, downloaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (media_id, url, os.path.abspath(file_path), size, sha256, tweet_link, time.time()),
+            )
+            self.conn.commit()
+
+    def record_phash(self, file_path, value):
+        """记录图片的64位感知哈希，SQLite整数为有符号64位，超出范围时转换为负数保存"""
+        signed = value - (1 << 64) if value >= (1 << 63) else value
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO phash (file_path, hash) VALUES (?, ?)",
+                              (os.path.abspath(file_path), signed))
+            self.conn.commit()
+
+    def all_phashes(self):
+        """返回所有已记录的(file_path, 无符号64位哈希)"""
+        with self.lock:
+            rows = self.conn.execute("SELECT file_path, hash FROM phash").fetchall()
+        return [(row['file_path'], row['hash'] & ((1 << 64) - 1)) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """获取全局媒体索引，config.media_index为空时表示不启用，返回None"""
+    global _index
+    if not config.media_index:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = MediaIndex(config.media_index)
+    return _index
@@ -0,0 +1,316 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import config
+
+"""
+运行指标模块
+
+进程内的指标注册表，记录下载队列深度、正在下载的数量、扫描的推文数、加入下载队列的媒体数、
+每个下载的耗时分布、下载字节数、重试次数、跳过次数和浏览器命令耗时，时间爬虫和点赞爬虫共用。
+设置config.metrics_port后在该端口提供Prometheus文本格式的/metrics接口，长时间爬取时可以
+用Prometheus/Grafana或直接用浏览器查看；每秒速率（推文/秒、字节/秒等）由计数器的rate()计算。
+
+所有指标名以twitter_crawler_开头，计数器以_total结尾，耗时以秒为单位。
+
+主要类:
+- Counter: 只增不减的计数器
+- Gauge: 可增可减的当前值，可以由函数在读取时计算（如队列长度）
+- Histogram: 按区间统计的分布（如下载耗时）
+
+主要函数:
+- render: 生成Prometheus文本格式的全部指标
+- start_server: 在后台线程中启动指标接口，config.metrics_port为0时不启动
+- instrument_driver: 统计浏览器每个WebDriver命令的耗时
+"""
+
+PREFIX = "twitter_crawler_"
+DOWNLOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COMMAND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics = []  # 注册表，按定义顺序输出
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Args:
+            name: 指标名（不含前缀）
+            documentation: 说明，输出为# HELP
+            labelnames: 标签名，记录时按相同顺序传入标签值
+        """
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}需要标签{self.labelnames}，传入了{labels}")
+        return tuple(str(label) for label in labels)
+
+    def get(self, *labels):
+        """返回指定标签的当前值，测试和打印统计时使用"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, value in self._samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, func, *labels):
+        """读取时调用func()得到当前值（如队列的qsize），func为None时取消"""
+        key = self._key(labels)
+        with self._lock:
+            if func is None:
+                self._functions.pop(key, None)
+            else:
+                self._functions[key] = func
+
+    @contextmanager
+    def track(self, *labels):
+        """进入时加1，退出时减1，用于统计正在进行的操作数量"""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def get(self, *labels):
+        key = self._key(labels)
+        with self._lock:
+            func = self._functions.get(key)
+            if func is None:
+                return self._values.get(key, 0)
+        return func()
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, func in functions.items():
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return sorted(values.items())
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DOWNLOAD_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各区间的计数（最后一个为+Inf）, 总和, 总数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """统计with块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def get(self, *labels):
+        """返回指定标签的(总数, 总和)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def _samples(self):
+        with self._lock:
+            return sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, (counts, total, count) in self._samples():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# crawler标签: time为按时间爬取(download_media)，hashtag为点赞爬虫(saveDZ_crawler)
+START_TIME = Gauge("start_time_seconds", "进程启动时间(Unix时间戳)")
+QUEUE_DEPTH = Gauge("queue_depth", "等待下载的媒体数量", ["crawler"])
+ACTIVE_DOWNLOADS = Gauge("active_downloads", "正在传输的下载数量", ["kind"])
+TWEETS_SCANNED = Counter("tweets_scanned_total", "扫描的推文数（已去除重复出现的推文）", ["crawler"])
+MEDIA_ENQUEUED = Counter("media_enqueued_total", "加入下载队列的媒体数", ["crawler", "kind"])
+DOWNLOAD_SECONDS = Histogram("download_seconds", "每个媒体从开始处理到结束的耗时，按最终状态区分",
+                             ["kind", "status"], DOWNLOAD_BUCKETS)
+DOWNLOADED_BYTES = Counter("downloaded_bytes_total", "下载的字节数（传输过程中实时累加）", ["kind"])
+RETRIES = Counter("retries_total", "重试次数", ["operation"])
+SKIPS = Counter("skips_total", "跳过的推文或媒体数", ["reason"])
+BROWSER_COMMAND_SECONDS = Histogram("browser_command_seconds", "WebDriver命令的往返耗时",
+                                    ["command"], COMMAND_BUCKETS)
+
+START_TIME.set(round(time.time(), 3))
+
+
+def render():
+    """生成Prometheus文本格式的全部指标"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def instrument_driver(driver):
+    """
+    统计浏览器每个WebDriver命令的耗时
+
+    所有WebDriver命令（包括WebElement上的操作）都经过driver.execute，在实例上包装该方法，
+    按命令名(如executeScript、findElements)记录到BROWSER_COMMAND_SECONDS
+    """
+    execute = driver.execute
+    if getattr(execute, 'instrumented', False):
+        return driver
+
+    def timed_execute(driver_command, params=None):
+        started = time.perf_counter()
+        try:
+            return execute(driver_command, params)
+        finally:
+            BROWSER_COMMAND_SECONDS.observe(time.perf_counter() - started, driver_command)
+
+    timed_execute.instrumented = True
+    driver.execute = timed_execute
+    return driver
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不在爬虫的控制台输出访问日志
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port=None, host="127.0.0.1"):
+    """
+    在后台线程中启动指标接口，重复调用时返回已启动的服务器
+
+    Args:
+        port: 端口，默认config.metrics_port，为0时不启动
+
+    Returns:
+        ThreadingHTTPServer实例，未启动时返回None
+    """
+    global _server
+    port = config.metrics_port if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                print(f"指标接口启动失败（端口{port}）: {str(e)}")
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+            _server = server
+            print(f"运行指标: http://{host}:{server.server_address[1]}/metrics")
+    return _server
+
+
+def stop_server():
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+            _server = None
@@ -0,0 +1,389 @@
+import re
+import json
+import time
+import zlib
+import struct
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+"""
+本地模拟X服务器
+
+在本机模拟X的搜索页、标签页、时间线GraphQL接口和图片/视频服务器，用于在不访问真实X
+（不会被限流）的情况下测试爬虫端到端的吞吐量。将config.x_base_url设置为本服务器的地址后，
+download_media、crawl_tag_images和main.main都会访问本服务器。
+
+模拟内容:
+- /search、/hashtag/<标签>: 包含cellInnerDiv时间线的页面，滚动到底部时请求下一页，
+  只保留最近的若干个节点（模拟虚拟列表回收节点）
+- /i/api/graphql/<id>/SearchTimeline: 与X结构相同的时间线JSON，支持since:/until:运算符，
+  推文ID按发布时间生成（与真实的snowflake ID一致）
+- /media/<id>: 图片（有效的PNG，每张图片内容不同，填充到指定大小）
+- /ext_tw_video/<id>/pu/vid/<码率>/<文件名>.mp4: 视频，支持Range请求
+- /__stats: 服务器统计（推文数、请求数、发送字节数和每秒速率）
+
+延迟、文件大小、错误率、每页推文数和总页数均可通过命令行参数设置。
+
+主要类:
+- MockXServer: 模拟服务器
+
+主要函数:
+- start_server: 在后台线程中启动模拟服务器
+
+命令行用法:
+    python mock_x_server.py [--port 8080] [--latency 0.05] [--media-size 200000] [--error-rate 0.01] [--pages 50]
+    然后在config.py中设置 x_base_url = "http://127.0.0.1:8080"
+"""
+
+TWITTER_EPOCH_MS = 1288834974657
+SEARCH_TIME_FORMAT = '%Y-%m-%d_%H:%M:%S_UTC'
+VIDEO_BITRATES = (256000, 832000, 2176000)
+
+TIMELINE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Mock X</title></head>
+<body>
+<div id="timeline"></div>
+<script>
+const QUERY = __QUERY__;
+const MAX_CELLS = __MAX_CELLS__;
+const timeline = document.getElementById("timeline");
+let cursor = null, loading = false, finished = false;
+
+function renderTweet(tweet) {
+    const legacy = tweet.legacy;
+    const cell = document.createElement("div");
+    cell.dataset.testid = "cellInnerDiv";
+    cell.style.minHeight = "320px";
+    let html = '<article><a href="/' + tweet.core.user_results.result.legacy.screen_name + '/status/' + legacy.id_str + '">'
+        + '<time datetime="' + new Date(legacy.created_at).toISOString() + '">' + legacy.created_at + '</time></a>'
+        + '<div>' + legacy.full_text + '</div>';
+    for (const media of (legacy.extended_entities || {}).media || []) {
+        if (media.type === "photo") html += '<img src="' + media.media_url_https.replace(/\\.jpg$/, "") + '?format=jpg&name=small">';
+        else html += '<video poster="' + media.media_url_https + '"></video>';
+    }
+    cell.innerHTML = html + '</article>';
+    timeline.appendChild(cell);
+}
+
+async function loadMore() {
+    if (loading || finished) return;
+    loading = true;
+    try {
+        const variables = encodeURIComponent(JSON.stringify({rawQuery: QUERY, count: 20, cursor: cursor}));
+        const response = await fetch("/i/api/graphql/mock/SearchTimeline?variables=" + variables);
+        if (!response.ok) return;  // 出错时等待下一次滚动重试
+        const data = await response.json();
+        let added = 0;
+        for (const instruction of data.data.search_by_raw_query.search_timeline.timeline.instructions) {
+            for (const entry of instruction.entries || []) {
+                if (entry.entryId.startsWith("tweet-")) {
+                    renderTweet(entry.content.itemContent.tweet_results.result);
+                    added++;
+                } else if (entry.entryId.startsWith("cursor-bottom")) {
+                    cursor = entry.content.value;
+                }
+            }
+        }
+        if (!added) finished = true;
+        // 模拟虚拟列表：只保留最近的MAX_CELLS个节点
+        while (timeline.children.length > MAX_CELLS) timeline.removeChild(timeline.firstChild);
+    } finally {
+        loading = false;
+    }
+}
+
+window.addEventListener("scroll", () => {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 1000) loadMore();
+});
+loadMore();
+</script>
+</body></html>
+"""
+
+SIMPLE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Mock X</title></head><body>__BODY__</body></html>
+"""
+
+
+def snowflake(dt, sequence=0):
+    """按发布时间生成推文ID"""
+    return ((int(dt.timestamp() * 1000) - TWITTER_EPOCH_MS) << 22) | (sequence & 0x3FFFFF)
+
+
+def parse_search_time(query, operator):
+    match = re.search(operator + r':(\S+)', query)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), SEARCH_TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def png_bytes(seed, size, width=32, height=32):
+    """生成内容由seed决定的随机像素PNG，末尾填充到size字节（解码时会忽略IEND之后的数据）"""
+    rng = random.Random(seed)
+    raw = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    png = (b"\x89PNG\r\n\x1a\n"
+           + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+           + chunk(b"IDAT", zlib.compress(raw))
+           + chunk(b"IEND", b""))
+    return png + b"\x00" * max(0, size - len(png))
+
+
+class MockXServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, media_size=200_000, video_size=2_000_000, error_rate=0.0,
+                 page_size=20, pages=50, photos=4, video_ratio=0.2, interval=600, max_cells=40, seed=0):
+        """
+        Args:
+            address: (主机, 端口)
+            latency: 每个请求的延迟(秒)
+            media_size: 每张图片的字节数
+            video_size: 每个视频的字节数
+            error_rate: 接口和媒体请求返回503的概率
+            page_size: 每页推文数
+            pages: 时间线的总页数，之后为时间线末尾
+            photos: 每条推文最多的图片数
+            video_ratio: 带视频的推文比例
+            interval: 相邻推文的发布时间间隔(秒)
+            max_cells: 页面中最多保留的推文节点数
+            seed: 随机种子，相同的种子生成相同的时间线
+        """
+        super().__init__(address, MockXHandler)
+        self.latency = latency
+        self.media_size = media_size
+        self.video_size = video_size
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.pages = pages
+        self.photos = photos
+        self.video_ratio = video_ratio
+        self.interval = interval
+        self.max_cells = max_cells
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "tweets": 0, "media": 0, "bytes": 0}
+        self.started = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, **values):
+        with self.lock:
+            if self.started is None:
+                self.started = time.time()
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            elapsed = time.time() - self.started if self.started else 0
+        stats["elapsed"] = round(elapsed, 3)
+        stats["tweets_per_sec"] = round(stats["tweets"] / elapsed, 2) if elapsed else 0
+        stats["mb_per_sec"] = round(stats["bytes"] / 1024 / 1024 / elapsed, 3) if elapsed else 0
+        return stats
+
+    def make_tweet(self, index, created):
+        """生成时间线中第index条（从最新开始）推文的tweet_results.result"""
+        rng = random.Random(self.seed * 1_000_003 + index)
+        tweet_id = str(snowflake(created, index))
+        screen_name = f"user{rng.randrange(1000)}"
+        media = []
+        for j in range(rng.randint(0, self.photos)):
+            media.append({
+                "type": "photo",
+                "media_url_https": f"{self.base_url}/media/M{tweet_id}_{j}.jpg",
+            })
+        if rng.random() < self.video_ratio:
+            kind = "animated_gif" if rng.random() < 0.3 else "video"
+            bitrates = (0,) if kind == "animated_gif" else VIDEO_BITRATES
+            media.append({
+                "type": kind,
+                "media_url_https": f"{self.base_url}/ext_tw_video_thumb/{tweet_id}/pu/img/thumb.jpg",
+                "video_info": {"variants": [
+                    {"content_type": "application/x-mpegURL",
+                     "url": f"{self.base_url}/ext_tw_video/{tweet_id}/pu/pl/playlist.m3u8"},
+                ] + [
+                    {"bitrate": bitrate, "content_type": "video/mp4",
+                     "url": f"{self.base_url}/ext_tw_video/{tweet_id}/pu/vid/{bitrate}/{tweet_id}.mp4"}
+                    for bitrate in bitrates
+                ]},
+            })
+        legacy = {
+            "id_str": tweet_id,
+            "created_at": created.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+            "full_text": f"模拟推文 {index}",
+            "favorite_count": rng.randrange(5000),
+            "retweet_count": rng.randrange(500),
+            "reply_count": rng.randrange(100),
+            "quote_count": rng.randrange(50),
+            "bookmark_count": rng.randrange(100),
+        }
+        if media:
+            legacy["extended_entities"] = {"media": media}
+        return {
+            "__typename": "Tweet",
+            "rest_id": tweet_id,
+            "core": {"user_results": {"result": {"legacy": {"screen_name": screen_name}}}},
+            "legacy": legacy,
+            "views": {"count": str(rng.randrange(100000))},
+        }
+
+    def timeline(self, query, cursor):
+        """返回时间线的一页，cursor为下一页第一条推文的序号"""
+        until = parse_search_time(query, "until") or datetime.now(timezone.utc).replace(microsecond=0)
+        since = parse_search_time(query, "since")
+        start = int(cursor or 0)
+        entries = []
+        for index in range(start, min(start + self.page_size, self.page_size * self.pages)):
+            created = until - timedelta(seconds=self.interval * (index + 1))
+            if since is not None and created < since:
+                break
+            entries.append({
+                "entryId": f"tweet-{index}",
+                "content": {"itemContent": {"tweet_results": {"result": self.make_tweet(index, created)}}},
+            })
+        if entries:
+            entries.append({"entryId": f"cursor-bottom-{start}",
+                            "content": {"value": str(start + len(entries))}})
+        return {"data": {"search_by_raw_query": {"search_timeline": {"timeline": {
+            "instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}}}}, len(entries) - bool(entries)
+
+
+class MockXHandler(BaseHTTPRequestHandler):
+    server_version = "MockX/1.0"
+
+    def log_message(self, format, *args):
+        pass  # 不输出每个请求的访问日志
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path == "/__stats":
+            return self.send_body(json.dumps(server.snapshot()).encode(), "application/json", count=False)
+
+        server.count(requests=1)
+        api = "/i/api/graphql/" in url.path
+        media = url.path.startswith(("/media/", "/ext_tw_video/", "/ext_tw_video_thumb/"))
+        if (api or media) and random.random() < server.error_rate:
+            server.count(errors=1)
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if url.path == "/search" or url.path.startswith("/hashtag/"):
+            query = params.get("q", [""])[0] if url.path == "/search" else "#" + url.path.split("/", 2)[2]
+            page = (TIMELINE_PAGE.replace("__QUERY__", json.dumps(query))
+                    .replace("__MAX_CELLS__", str(server.max_cells)))
+            return self.send_body(page.encode(), "text/html; charset=utf-8")
+        if api and url.path.endswith("/SearchTimeline"):
+            variables = json.loads(params.get("variables", ["{}"])[0])
+            payload, tweets = server.timeline(variables.get("rawQuery", ""), variables.get("cursor"))
+            server.count(tweets=tweets)
+            return self.send_body(json.dumps(payload).encode(), "application/json")
+        if url.path.startswith("/media/") or url.path.startswith("/ext_tw_video_thumb/"):
+            server.count(media=1)
+            # 页面中显示的缩略图(name=small)不填充，只有下载的原图为指定大小
+            size = server.media_size if params.get("name", ["large"])[0] != "small" else 0
+            return self.send_body(png_bytes(url.path, size), "image/png")
+        if url.path.startswith("/ext_tw_video/") and url.path.endswith(".mp4"):
+            server.count(media=1)
+            return self.send_body(b"\x00" * server.video_size, "video/mp4")
+        if url.path in ("/", "/home", "/i/flow/login"):
+            return self.send_body(SIMPLE_PAGE.replace("__BODY__", "Mock X").encode(), "text/html; charset=utf-8")
+
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, body, content_type, count=True):
+        """发送响应，支持单个Range（视频分段下载和断点续传）"""
+        status = 200
+        total = len(body)
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else total - 1, total - 1)
+            else:
+                start, end = max(0, total - int(match.group(2))), total - 1
+            if start >= total:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{total}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = body[start:end + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            self.server.count(bytes=len(body))
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """
+    在后台线程中启动模拟服务器
+
+    Args:
+        port: 端口，0为随机空闲端口
+        options: 见MockXServer
+
+    Returns:
+        MockXServer实例，base_url为服务器地址，使用shutdown()停止
+    """
+    server = MockXServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="MockXServer", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟X服务器，用于端到端吞吐量测试")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟(秒)")
+    parser.add_argument("--media-size", type=int, default=200_000, help="每张图片的字节数")
+    parser.add_argument("--video-size", type=int, default=2_000_000, help="每个视频的字节数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="接口和媒体请求返回503的概率")
+    parser.add_argument("--page-size", type=int, default=20, help="每页推文数")
+    parser.add_argument("--pages", type=int, default=50, help="时间线的总页数")
+    parser.add_argument("--photos", type=int, default=4, help="每条推文最多的图片数")
+    parser.add_argument("--video-ratio", type=float, default=0.2, help="带视频的推文比例")
+    parser.add_argument("--interval", type=int, default=600, help="相邻推文的发布时间间隔(秒)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    mock = MockXServer((args.host, args.port), latency=args.latency, media_size=args.media_size,
+                       video_size=args.video_size, error_rate=args.error_rate, page_size=args.page_size,
+                       pages=args.pages, photos=args.photos, video_ratio=args.video_ratio,
+                       interval=args.interval, seed=args.seed)
+    print(f"模拟X服务器已启动: {mock.base_url}")
+    print(f"在config.py中设置 x_base_url = \"{mock.base_url}\"，统计信息: {mock.base_url}/__stats")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(mock.snapshot(), ensure_ascii=False))
+        mock.server_close()
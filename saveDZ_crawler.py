@@ -3,12 +3,20 @@ import time
 import signal
 import threading
 import sys
-from selenium.common.exceptions import TimeoutException
-from manga_downloader import safe_find_elements, safe_get_attribute
-from driver_init import initialize_driver, cookies_web
+from manga_downloader import extract_cells, media_urls_from_srcs
+import browser_pool
 import config  # 改为导入整个模块
 from termcolor import cprint as original_cprint
-from download_method import download_pic
+from download_method import download_pic, img_sema, stream_to_file, reuse_indexed, new_hasher, index_download
+from async_downloader import AsyncDownloadEngine
+from scroll_scheduler import ScrollScheduler
+from seen_set import SeenSet
+import image_dedup
+import http_client
+import log_writer
+import manifest
+import metrics
+import tracing
 from save_image_urls import main
 
 """
@@ -18,21 +26,17 @@ from save_image_urls import main
 
 # 全局变量用于控制程序运行
 running = True
-driver = None
 download_count = 0  # 用于记录已下载的帖子数量
 log_file_path = None  # 日志文件路径
 download_threads = []  # 保存所有下载线程
+download_engine = None  # 使用异步下载引擎时的引擎实例
 
 def signal_handler(signum, frame):
-    global running, driver
+    global running
     log_print("\n正在安全退出程序...")
     running = False
-    # 安全关闭浏览器
-    if driver:
-        try:
-            driver.quit()
-        except:
-            pass
+    # 安全关闭浏览器池中的浏览器（只结束本程序启动的浏览器）
+    browser_pool.shutdown()
     # 使用sys.exit强制结束程序
     sys.exit(0)
 
@@ -41,18 +45,19 @@ original_print = print
 
 # 自定义日志函数
 def log_print(text):
-    """将文本同时输出到控制台和日志文件"""
+    """将文本同时输出到控制台和日志文件（后台线程批量写入）"""
     print(text)
     if hasattr(log_print, 'log_file'):
-        with open(log_print.log_file, 'a', encoding='utf-8') as f:
-            f.write(str(text) + "\n")
+        log_writer.write(log_print.log_file, str(text) + "\n")
 
 def log_cprint(text, color):
     """将彩色文本同时输出到控制台和日志文件"""
-    original_cprint(text, color)
+    if config.console_color:
+        original_cprint(text, color)
+    else:
+        print(text)
     if hasattr(log_print, 'log_file'):
-        with open(log_print.log_file, 'a', encoding='utf-8') as f:
-            f.write(str(text) + "\n")
+        log_writer.write(log_print.log_file, str(text) + "\n")
 
 # 生产者函数：获取图片URL
 def url_producer(driver, q, folder):
@@ -60,97 +65,86 @@ def url_producer(driver, q, folder):
     global running, download_count
     log_print("等待页面加载...")
     
-    processed_elements = set()  # 用于跟踪已处理的元素
-    last_height = driver.execute_script("return document.body.scrollHeight")
+    seen = SeenSet()  # 按推文ID去重，重复出现的帖子不会被重复下载和计数
+    seen_elements = SeenSet()  # 已读取的元素（仅element提取模式使用）
+    scheduler = ScrollScheduler(driver, log_print=log_print)
     
     while running and download_count < config.urls_num:
         try:
-            # 获取当前可见的帖子元素
-            elements = safe_find_elements(driver, "css selector", "div[data-testid='cellInnerDiv']")
-            if elements:
-                # 处理新发现的元素
-                for data in elements:
-                    if not running or download_count >= config.urls_num:
-                        break
-                        
-                    try:
-                        element_id = data.id
-                        if element_id in processed_elements:
-                            continue
-
-                        # 获取帖子链接和时间
-                        try:
-                            time_element = data.find_element("css selector", "time")
-                            post_time = time_element.get_attribute("datetime")
-                            post_link = time_element.find_element("xpath", "..").get_attribute("href")
-                        except:
-                            post_time = "未知时间"
-                            post_link = "未知链接"
-                        
-                        # 查找图片
-                        images = safe_find_elements(data, "tag name", "img")
-                        has_images = False
-                        media_urls = []
-                        
-                        for img in images:
-                            src = safe_get_attribute(img, 'src')
-                            if src and "profile_images" not in src and 'media' in src:
-                                has_images = True
-                                media_url = src[:src.find('?')] + "?format=png&name=large"
-                                media_urls.append(media_url)
-                        
-                        # 如果有图片，增加帖子计数并下载
-                        if has_images:
-                            with threading.Lock():
-                                download_count += 1
-                                log_print(f"找到第 {download_count}/{config.urls_num} 条带图片的帖子")
-                            
-                            log_print(f"帖子链接: {post_link}")
-                            log_print(f"发布时间: {post_time}")
-                            log_print(f"找到 {len(media_urls)} 张图片")
-                            
-                            # 创建线程下载该帖子的所有图片
-                            for media_url in media_urls:
-                                log_print(f"媒体链接: {media_url}")
-                                download_thread = threading.Thread(target=download_image, args=(post_link, media_url, folder))
-                                download_threads.append(download_thread)  # 将线程添加到列表中
-                                download_thread.start()
-                        else:
-                            # 如果没有图片，跳过并且不计数
-                            log_print(f"帖子 {post_link} 没有图片，跳过")
+            # 获取当前新出现的帖子
+            for cell in extract_cells(driver, seen_elements):
+                if not running or download_count >= config.urls_num:
+                    break
+                    
+                try:
+                    post_time = cell.get('datetime') or "未知时间"
+                    post_link = cell.get('href') or "未知链接"
+                    
+                    if cell.get('tweet_id') and not seen.add(cell['tweet_id']):
+                        metrics.SKIPS.inc('duplicate_tweet')
+                        continue
+                    metrics.TWEETS_SCANNED.inc('hashtag')
+                    
+                    # 查找图片
+                    media_urls = media_urls_from_srcs(cell.get('media_srcs') or [])
+                    
+                    # 如果有图片，增加帖子计数并下载
+                    if media_urls:
+                        with threading.Lock():
+                            download_count += 1
+                            log_print(f"找到第 {download_count}/{config.urls_num} 条带图片的帖子")
                         
-                        processed_elements.add(element_id)
+                        log_print(f"帖子链接: {post_link}")
+                        log_print(f"发布时间: {post_time}")
+                        log_print(f"找到 {len(media_urls)} 张图片")
                         
-                    except Exception as element_error:
-                        log_print(f"处理单个元素时发生错误: {str(element_error)}")
-                        continue
+                        # 下载该帖子的所有图片，使用异步下载引擎时直接提交，否则每张图片创建一个线程
+                        for media_url in media_urls:
+                            log_print(f"媒体链接: {media_url}")
+                            metrics.MEDIA_ENQUEUED.inc('hashtag', 'image')
+                            if download_engine is not None:
+                                download_engine.submit(post_link, media_url, folder, 'image')
+                                continue
+                            download_thread = threading.Thread(target=download_image, args=(post_link, media_url, folder))
+                            download_threads.append(download_thread)  # 将线程添加到列表中
+                            download_thread.start()
+                    else:
+                        # 如果没有图片，跳过并且不计数
+                        metrics.SKIPS.inc('no_media')
+                        log_print(f"帖子 {post_link} 没有图片，跳过")
+                    
+                except Exception as element_error:
+                    log_print(f"处理单个元素时发生错误: {str(element_error)}")
+                    continue
             
             if not running or download_count >= config.urls_num:
                 break
                 
-            # 滚动页面
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
-            
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                # 如果高度没有变化，可能是加载完了或者需要等待更久
-                time.sleep(5)
-                new_height = driver.execute_script("return document.body.scrollHeight")
-                if new_height == last_height:
-                    log_print("页面暂时没有新内容，继续尝试...")
-            last_height = new_height
+            # 滚动页面，新推文出现后立即继续，连续多次没有新内容时认为到达时间线末尾
+            if not scheduler.scroll_and_wait() and scheduler.end_of_feed:
+                break
                 
         except Exception as scroll_error:
             log_print(f"滚动过程中发生错误: {str(scroll_error)}")
             time.sleep(3)
             continue
     
-    log_print("\n爬取结束，达到目标帖子数量或被手动停止")
+    log_print("\n爬取结束，达到目标帖子数量、时间线末尾或被手动停止")
+    log_print(f"共跳过 {seen.suppressed} 次重复出现的帖子")
+
+def pending_downloads():
+    """已提交但还没有开始传输的图片数量（等待img_sema或异步引擎并发名额）"""
+    if download_engine is not None:
+        submitted = download_engine.in_flight
+    else:
+        submitted = sum(1 for thread in download_threads if thread.is_alive())
+    return max(0, submitted - metrics.ACTIVE_DOWNLOADS.get('image'))
 
 # 下载图片（不计数）
 def download_image(post_link, url, folder):
     """下载图片（不计数）"""
+    started = time.time()
+    filepath = None
     try:
         # 从URL中提取文件名
         filename = url.split('/')[-1].split('?')[0] + '.png'
@@ -158,24 +152,39 @@ def download_image(post_link, url, folder):
         
         # 检查文件是否已存在
         if os.path.exists(filepath):
+            manifest.record(post_link, url, filepath, 'exists', os.path.getsize(filepath), started)
+            return
+        
+        # 之前的运行中已下载过，直接复用本地文件
+        if reuse_indexed(url, filepath):
+            log_print(f"{filename} 已在之前的爬取中下载，复用本地文件")
+            manifest.record(post_link, url, filepath, 'reused', os.path.getsize(filepath), started)
             return
             
         # 打印下载URL
         log_cprint(f"开始下载: {url}", "yellow")
         
-        # 设置较短的超时时间
-        import requests
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+        # 设置较短的超时时间，使用共享连接池复用keep-alive连接，同时下载数受img_sema限制
+        hasher = new_hasher()
+        with img_sema, tracing.span("http_download", "download", url=url):
+            size = stream_to_file(url, filepath, timeout=10, hasher=hasher)
+        if size is not None:
+            index_download(url, filepath, size, hasher, post_link)
+            manifest.record(post_link, url, filepath, 'downloaded', size, started)
             log_cprint(f"{filename} 下载完成", "green")
+            image_dedup.schedule(filepath)
             
             # 添加下载间隔
             time.sleep(0.5)
+        else:
+            manifest.record(post_link, url, filepath, 'failed', started=started)
             
+    except http_client.TIMEOUT_ERRORS:
+        log_print(f"下载超时: {url}")
+        manifest.record(post_link, url, filepath, 'timeout', started=started)
     except Exception as e:
         log_print(f"下载图片时发生错误: {str(e)}")
+        manifest.record(post_link, url, filepath, 'failed', started=started)
 
 
 def crawl_tag_images(custom_tag=None, save_folder=None):
@@ -187,10 +196,11 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
         save_folder: 保存目录，如果为None则创建新目录
     """
     try:
-        global running, download_count, download_threads
+        global running, download_count, download_threads, download_engine
         running = True
         download_count = 0
         download_threads = []
+        download_engine = None
         
         # 使用自定义标签或配置中的标签
         tag_to_use = custom_tag if custom_tag is not None else config.tag  # 使用config.tag
@@ -207,8 +217,9 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
         # 设置日志文件路径
         log_file_path = os.path.join(save_folder, f"@{tag_to_use}_dianzan_log.txt")
         
-        # 设置全局日志文件路径
+        # 设置全局日志文件路径和下载清单所在文件夹
         log_print.log_file = log_file_path
+        manifest.set_folder(save_folder)
         
         # 创建并初始化日志文件
         with open(log_file_path, "w", encoding="utf-8") as f:
@@ -224,25 +235,16 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
         log_print(f"目标爬取帖子数量: {config.urls_num}")  # 使用config.urls_num
         log_print(f"日志文件: {log_file_path}")
 
-        driver = initialize_driver()
-        
-        try:
-            driver.get('https://x.com/i/flow/login')
-        except TimeoutException:
-            driver.execute_script('window.stop()')
-        driver.set_page_load_timeout(60)
-
+        # 从浏览器池获取已登录的浏览器，点赞爬虫只下载图片，不需要拦截网络请求
         try:
-            driver.get('https://x.com')  # 先访问一次目标域名
-            cookies_web(driver, "X_cookie.json")
+            driver = browser_pool.acquire(capture_network=False)
         except Exception as e:
             log_print(f"访问失败，请检查网络连接: {str(e)}")
-            driver.quit()
             return None, None
 
         # 访问标签页面
         log_print("访问推特页面中.....")
-        target_url = f"https://x.com/hashtag/{tag_to_use}?src=hashtag_click"
+        target_url = f"{config.x_base_url}/hashtag/{tag_to_use}?src=hashtag_click"
         driver.get(target_url)
         log_print("准备获取数据中.....")
 
@@ -252,6 +254,11 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
         log_print(f"开始爬取数据...., url为：{target_url}")
 
         try:
+            metrics.start_server()
+            if config.download_engine == 'async':
+                download_engine = AsyncDownloadEngine(log_print=log_print, log_cprint=log_cprint).start()
+            metrics.QUEUE_DEPTH.set_function(pending_downloads, 'hashtag')
+            
             # 创建并启动生产者线程
             producer_thread = threading.Thread(target=url_producer, args=(driver, None, save_folder))
             producer_thread.start()
@@ -265,11 +272,15 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
                 log_print("\n等待所有图片下载完成...")
                 for thread in download_threads:
                     thread.join()
+                if download_engine is not None:
+                    download_engine.join()
+                image_dedup.wait()
                 log_cprint("\n所有图片下载完成！", "green")
                 
-                image_count = len([f for f in os.listdir(save_folder) if f.endswith(".png")])
+                image_count = manifest.count_downloaded(os.path.join(save_folder, manifest.MANIFEST_NAME), 'image')
                 
-                # 更新日志文件
+                # 更新日志文件，先写入缓冲中的日志，保证统计信息在末尾
+                log_writer.flush()
                 with open(log_file_path, "a", encoding="utf-8") as f:
                     f.write("\n" + "-" * 50 + "\n")
                     f.write(f"爬取完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -292,11 +303,11 @@ def crawl_tag_images(custom_tag=None, save_folder=None):
         except Exception as e:
             log_print(f"发生错误: {str(e)}")
         finally:
-            if driver:
-                try:
-                    driver.quit()
-                except:
-                    pass
+            if download_engine is not None:
+                download_engine.stop()
+            # 归还浏览器，供下一个爬虫任务复用
+            browser_pool.release(driver)
+            tracing.save()
             log_print("程序已安全退出。")
             
         return save_folder, log_file_path
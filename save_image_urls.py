@@ -3,15 +3,22 @@ import re
 import sys
 import glob
 from termcolor import cprint
+import log_writer
+import manifest
 
 """
 此模块用于保存和处理Twitter图片URL
-主要功能包括从日志文件中提取媒体链接、从URL中获取文件名以及检查文件是否存在
+主要功能包括从下载清单(manifest.jsonl)或日志文件中提取媒体链接、从URL中获取文件名以及检查文件是否存在
+
+结果文件夹中存在下载清单时直接按清单生成image.txt，无需检查文件；
+旧的结果文件夹没有清单时退回到用正则表达式解析日志文件
 """
 
 
 def extract_media_urls(log_file_path):
     """从日志文件中提取所有媒体链接"""
+    # 日志由后台线程批量写入，读取前先写入所有缓冲的日志
+    log_writer.flush()
     if not os.path.exists(log_file_path):
         print(f"日志文件 {log_file_path} 不存在")
         return []
@@ -23,8 +30,8 @@ def extract_media_urls(log_file_path):
         re.compile(r'(https://pbs\.twimg\.com/media/[^\s]+)') # 匹配任何Twitter媒体链接
     ]
     
-    # 存储提取的媒体链接
-    media_urls = []
+    # 存储提取的媒体链接，dict保持插入顺序并用于去重
+    media_urls = {}
     
     # 读取日志文件并提取链接
     with open(log_file_path, 'r', encoding='utf-8') as f:
@@ -33,21 +40,23 @@ def extract_media_urls(log_file_path):
                 match = pattern.search(line)
                 if match:
                     media_url = match.group(1)
-                    if media_url not in media_urls:  # 避免重复
-                        media_urls.append(media_url)
+                    media_urls[media_url] = None  # 重复的链接不会改变顺序
                     break  # 一行只匹配一次
             
-    return media_urls
+    return list(media_urls)
+
+def get_media_id(url):
+    """从URL中提取media ID（pbs.twimg.com/media/<id>），无法提取时返回None"""
+    media_id_match = re.search(r'media/([A-Za-z0-9_\-]+)', url)
+    return media_id_match.group(1) if media_id_match else None
 
 def get_filename_from_url(url):
     """从URL中提取文件名和格式"""
     # 使用正则表达式从URL中提取media ID
-    media_id_match = re.search(r'media/([A-Za-z0-9_\-]+)', url)
-    if not media_id_match:
+    media_id = get_media_id(url)
+    if not media_id:
         return "未知文件名.png"
     
-    media_id = media_id_match.group(1)
-    
     # 从URL中提取格式
     format_match = re.search(r'format=([a-zA-Z0-9]+)', url)
     file_format = format_match.group(1) if format_match else "png"
@@ -71,8 +80,9 @@ def is_file_exists(filename, search_dirs=None):
 def save_urls_to_file(urls, output_file):
     """将URLs和对应的文件名保存到文件，并检查文件是否存在"""
     try:
-        # 获取输出文件所在的目录作为搜索目录
-        search_dirs = [os.path.dirname(os.path.abspath(output_file))]
+        # 获取输出文件所在的目录作为搜索目录，一次列出目录中的文件，避免每个链接都访问一次磁盘
+        search_dir = os.path.dirname(os.path.abspath(output_file))
+        existing_files = set(os.listdir(search_dir)) if os.path.isdir(search_dir) else set()
         
         # 统计找到的文件和丢失的文件
         found_count = 0
@@ -89,7 +99,7 @@ def save_urls_to_file(urls, output_file):
                 f.write(f"{url}\n")
                 
                 # 检查文件是否存在
-                if is_file_exists(filename, search_dirs):
+                if filename in existing_files:
                     f.write(f"{filename}\n")
                     found_count += 1
                 else:
@@ -110,6 +120,45 @@ def save_urls_to_file(urls, output_file):
         print(f"保存URLs时出错: {str(e)}")
         return False
 
+def save_manifest_to_file(entries, output_file):
+    """
+    按下载清单的汇总结果保存image.txt，文件状态直接取自清单记录
+
+    Args:
+        entries: manifest.summarize返回的{media_url: 记录}字典
+        output_file: 输出文件路径
+    """
+    try:
+        found_count = 0
+        missing_count = 0
+        total_bytes = 0
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for url, entry in entries.items():
+                f.write(f"{url}\n")
+                if entry["status"] in manifest.SUCCESS_STATUSES:
+                    f.write(f"{entry['file']}\n")
+                    found_count += 1
+                    total_bytes += entry.get("bytes") or 0
+                else:
+                    f.write("下载失败\n")
+                    missing_count += 1
+            
+            # 在文件末尾添加总结信息
+            f.write("\n" + "=" * 50 + "\n")
+            if missing_count == 0 and found_count > 0:
+                f.write("所有图片均已成功下载！\n")
+                f.write(f"共下载 {found_count} 张图片\n")
+            else:
+                f.write(f"下载统计：成功 {found_count} 张，失败 {missing_count} 张\n")
+            f.write(f"总大小：{total_bytes / 1024 / 1024:.2f} MB\n")
+        
+        print(f"下载清单统计: 成功 {found_count} 个文件, 失败 {missing_count} 个文件")
+        return True
+    except Exception as e:
+        print(f"保存URLs时出错: {str(e)}")
+        return False
+
 def main(log_file_path, folder):
     # 日志文件路径
     # log_file_path = "download_log.txt"
@@ -117,6 +166,26 @@ def main(log_file_path, folder):
     # 输出文件路径，支持命令行参数
     output_file = os.path.join(folder, "image.txt")
     
+    # 优先使用下载清单，清单由后台线程批量写入，先写入所有缓冲的记录；按时间分片爬取时先合并各分片的清单
+    log_writer.flush()
+    try:
+        manifest.merge(folder)
+    except OSError as e:
+        # Windows上其他进程正在读取manifest.jsonl时无法替换，全部分片完成后会再次合并
+        print(f"合并分片下载清单失败: {str(e)}")
+    manifest_file = os.path.join(folder, manifest.MANIFEST_NAME)
+    if os.path.exists(manifest_file):
+        print("正在从下载清单中提取媒体链接...")
+        entries = manifest.summarize(manifest_file, kind='image')
+        if not entries:
+            print("未找到任何媒体链接")
+            return
+        if save_manifest_to_file(entries, output_file):
+            cprint(f"已将 {len(entries)} 个媒体链接及其文件状态保存到 {output_file}", "green")
+        else:
+            print(f"保存链接失败")
+        return
+    
     # 提取媒体链接
     print("正在从日志文件中提取媒体链接...")
     media_urls = extract_media_urls(log_file_path)
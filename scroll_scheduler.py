@@ -0,0 +1,169 @@
+import config
+import tracing
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from download_method import print
+
+"""
+事件驱动的页面滚动调度模块
+
+在页面中注入MutationObserver监听新插入的推文节点(cellInnerDiv)，滚动到底部后立即等待
+新节点出现，一出现就返回，不再固定等待3秒/5秒。等待时间的上限为config.late_time，
+连续没有新内容时按指数退避延长等待时间，连续config.max_scroll_stalls次都没有新内容时
+认为已经到达时间线末尾，不再无限重试。被限流或时间线加载出错时页面同样不再出现新内容，
+可以用timeline_error检查页面上是否显示了错误提示和重试按钮。
+
+主要类:
+- ScrollScheduler: 滚动页面并等待新推文加载
+"""
+
+# 注入MutationObserver（页面跳转后window被重置时会重新注入），按需滚动，然后等待新的cellInnerDiv节点
+# arguments: [since, timeout_ms, settle_ms, scroll_mode, callback]
+# scroll_mode: 0不滚动，1滚动到底部，2先向上滚动一屏再回到底部（重新触发时间线加载）
+WAIT_FOR_CELLS_JS = """
+let since = arguments[0];
+const timeoutMs = arguments[1], settleMs = arguments[2], scrollMode = arguments[3];
+const done = arguments[arguments.length - 1];
+if (!window.__crawlerObserver) {
+    window.__crawlerNewCells = 0;
+    window.__crawlerWaiters = [];
+    const selector = "div[data-testid='cellInnerDiv']";
+    window.__crawlerObserver = new MutationObserver(mutations => {
+        let added = 0;
+        for (const mutation of mutations) {
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== 1) continue;
+                if (node.matches(selector)) added++;
+                else added += node.querySelectorAll(selector).length;
+            }
+        }
+        if (!added) return;
+        window.__crawlerNewCells += added;
+        const waiters = window.__crawlerWaiters;
+        window.__crawlerWaiters = [];
+        waiters.forEach(wake => wake());
+    });
+    window.__crawlerObserver.observe(document.body, {childList: true, subtree: true});
+}
+if (scrollMode) {
+    // 先注入再滚动，避免漏掉滚动后立即插入的节点
+    since = window.__crawlerNewCells;
+    if (scrollMode === 2) window.scrollBy(0, -window.innerHeight);
+    window.scrollTo(0, document.body.scrollHeight);
+}
+if (window.__crawlerNewCells > since) {
+    done(window.__crawlerNewCells);
+    return;
+}
+let finished = false;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    clearTimeout(timer);
+    done(window.__crawlerNewCells);
+};
+const timer = setTimeout(finish, timeoutMs);
+// 监听整个body而不是时间线容器，时间线在页面切换时会被重新挂载
+// 第一个新节点出现后再等待settleMs，让同一页的推文尽量一次渲染完
+window.__crawlerWaiters.push(() => setTimeout(finish, settleMs));
+"""
+
+# 时间线加载失败（包括被限流）时显示"Something went wrong. Try reloading."和重试按钮
+TIMELINE_ERROR_JS = r"""
+const column = document.querySelector("[data-testid='primaryColumn']") || document.body;
+return Array.from(column.querySelectorAll("button, [role='button']"))
+    .some(button => /^(Retry|重试|重新加载)$/.test((button.innerText || '').trim()));
+"""
+
+
+class ScrollScheduler:
+    def __init__(self, driver, timeout=None, max_stalls=None, settle=0.3, max_timeout=60, log_print=print):
+        """
+        Args:
+            driver: Selenium WebDriver实例
+            timeout: 每次滚动后等待新推文的时间上限(秒)，默认config.late_time
+            max_stalls: 连续多少次没有新内容时认为到达时间线末尾，默认config.max_scroll_stalls
+            settle: 出现新推文后再等待的时间(秒)，让同一批推文渲染完
+            max_timeout: 指数退避后等待时间的最大值(秒)
+        """
+        self.driver = driver
+        self.timeout = timeout or config.late_time
+        self.max_stalls = max_stalls or config.max_scroll_stalls
+        self.settle = settle
+        self.max_timeout = max(max_timeout, self.timeout)
+        self.log_print = log_print
+        self.stalls = 0
+        self.seen_cells = 0  # 已观察到的新节点总数
+        # 等待时临时修改驱动的脚本超时，结束后恢复，不影响同一浏览器上之后的任务（浏览器池会复用浏览器）
+        self.script_timeout = self._read_script_timeout()
+
+    @property
+    def end_of_feed(self):
+        """连续没有新内容的次数达到上限"""
+        return self.stalls >= self.max_stalls
+
+    def _read_script_timeout(self):
+        """驱动当前的脚本超时(秒)，读取失败时返回None"""
+        try:
+            return self.driver.timeouts.script
+        except (AttributeError, TypeError, WebDriverException):
+            return None
+
+    def wait_for_cells(self, timeout, scroll_mode=0):
+        """
+        等待页面出现新的推文节点，最多等待timeout秒
+
+        Returns:
+            本次新出现的节点数，超时为0
+        """
+        with tracing.span("scroll_wait", "browser", timeout=timeout, scroll_mode=scroll_mode) as span:
+            try:
+                self.driver.set_script_timeout(timeout + 5)
+                total = self.driver.execute_async_script(
+                    WAIT_FOR_CELLS_JS, self.seen_cells, int(timeout * 1000), int(self.settle * 1000), scroll_mode)
+            except TimeoutException:
+                return 0
+            finally:
+                if self.script_timeout is not None:
+                    self.driver.set_script_timeout(self.script_timeout)
+            total = int(total or 0)
+            if total < self.seen_cells:
+                # 页面跳转后计数被重置
+                self.seen_cells = 0
+            added = total - self.seen_cells
+            self.seen_cells = total
+            if span is not None:
+                span.args["added"] = added
+            return added
+
+    def scroll_and_wait(self):
+        """
+        滚动到页面底部并等待新推文加载
+
+        Returns:
+            是否加载出了新内容；返回False且end_of_feed为True时应停止滚动
+        """
+        # 连续没有新内容时等待时间按指数增长
+        timeout = min(self.timeout * (2 ** self.stalls), self.max_timeout)
+        # 没有新内容时先向上滚动一屏再回到底部，重新触发时间线的加载
+        if self.wait_for_cells(timeout, scroll_mode=2 if self.stalls else 1):
+            self.stalls = 0
+            return True
+
+        self.stalls += 1
+        if self.end_of_feed:
+            self.log_print(f"连续{self.stalls}次未加载出新内容，已到达时间线末尾")
+        else:
+            self.log_print(f"页面暂时没有新内容，继续尝试...({self.stalls}/{self.max_stalls})")
+        return False
+
+    def timeline_error(self):
+        """页面上是否显示了时间线加载出错的重试按钮，此时没有新内容不代表到达了时间线末尾"""
+        try:
+            return bool(self.driver.execute_script(TIMELINE_ERROR_JS))
+        except WebDriverException:
+            return False
+
+    def reset(self):
+        """重新开始计数（如页面跳转后）"""
+        self.stalls = 0
+        self.seen_cells = 0
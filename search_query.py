@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+import config
+
+"""
+搜索语句构造和时间范围分片模块
+
+使用X搜索的since:/until:运算符限定时间范围，搜索结果直接从end_time开始，
+不再需要先滚动浏览end_time之后的所有新帖子。长时间范围可以按天或按小时切分成多个分片，
+由多个进程并行爬取（见batch_runner.py的--shard参数）。
+
+时间统一按UTC处理，与帖子的datetime属性(ISO 8601, UTC)一致。
+since包含该时刻，until不包含该时刻。
+
+主要函数:
+- parse_time: 解析'YYYY-MM-DD'或ISO 8601时间
+- build_search_query: 构造带since:/until:的搜索语句
+- build_search_url: 构造最新帖子的搜索页面链接
+- date_range: 将start_time..end_time（包含end_time当天）转换为[since, until)
+- shard_time_range: 将时间范围切分为按天或按小时的分片
+"""
+
+SHARD_UNITS = {'day': timedelta(days=1), 'hour': timedelta(hours=1)}
+
+
+def parse_time(value, end=False):
+    """
+    解析时间，返回UTC时区的datetime
+
+    Args:
+        value: 'YYYY-MM-DD'、ISO 8601字符串或datetime
+        end: value为日期时是否取当天的结束时刻（次日0点前）
+    """
+    if isinstance(value, datetime):
+        dt = value
+    elif len(value) == 10:
+        dt = datetime.strptime(value, '%Y-%m-%d')
+        if end:
+            dt += timedelta(days=1) - timedelta(microseconds=1)
+    else:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def format_search_time(dt):
+    """转换为搜索运算符的时间格式，如2025-06-05_00:00:00_UTC"""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%d_%H:%M:%S_UTC')
+
+
+def build_search_query(tag, since=None, until=None):
+    """构造搜索语句，since/until为datetime或时间字符串，为None时不限制"""
+    parts = [tag]
+    if since is not None:
+        parts.append(f"since:{format_search_time(parse_time(since))}")
+    if until is not None:
+        parts.append(f"until:{format_search_time(parse_time(until))}")
+    return " ".join(parts)
+
+
+def build_search_url(tag, since=None, until=None, base_url=None):
+    """构造按时间排序（最新）的搜索页面链接，base_url默认config.x_base_url"""
+    base_url = base_url or config.x_base_url
+    return f"{base_url}/search?q={quote(build_search_query(tag, since, until))}&src=typed_query&f=live"
+
+
+def date_range(start_time, end_time):
+    """将'YYYY-MM-DD'格式的start_time..end_time（包含end_time当天）转换为[since, until)"""
+    since = parse_time(start_time)
+    until = parse_time(end_time) + timedelta(days=1)
+    return since, until
+
+
+def shard_time_range(since, until, unit='day'):
+    """
+    将[since, until)切分为按天或按小时的分片，最新的分片在前
+
+    Returns:
+        [(分片since, 分片until)]
+    """
+    step = SHARD_UNITS[unit]
+    since, until = parse_time(since), parse_time(until)
+    shards = []
+    shard_until = until
+    while shard_until > since:
+        shard_since = max(shard_until - step, since)
+        shards.append((shard_since, shard_until))
+        shard_until = shard_since
+    return shards
@@ -0,0 +1,62 @@
+import config
+
+"""
+已处理推文去重模块
+
+X的时间线是虚拟列表，滚动时会回收并重新创建推文节点，同一条推文会以新的DOM元素再次出现，
+按WebElement或节点标记去重时会被重复处理。这里按推文ID（snowflake，整数）去重，
+并使用两代轮换的集合限制内存：当前一代写满容量的一半时，旧的一代被丢弃，当前一代变为旧的一代。
+时间线按时间排序，重复出现的推文总是最近见过的，丢弃最早的一代不影响去重效果。
+
+主要类:
+- SeenSet: 容量有限的已见集合，统计被过滤的重复次数
+"""
+
+
+class SeenSet:
+    def __init__(self, capacity=None):
+        """
+        Args:
+            capacity: 最多保留的键数量，默认config.seen_set_capacity
+        """
+        self.capacity = max(2, capacity or config.seen_set_capacity)
+        self.current = set()
+        self.previous = set()
+        self.suppressed = 0  # 被过滤的重复次数
+
+    @staticmethod
+    def _key(key):
+        # 推文ID以整数保存，比字符串占用的内存更少
+        if isinstance(key, str) and key.isdigit():
+            return int(key)
+        return key
+
+    def __contains__(self, key):
+        key = self._key(key)
+        return key in self.current or key in self.previous
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+    def add(self, key):
+        """
+        记录一个键
+
+        Returns:
+            是否为第一次出现；重复出现时计入suppressed并返回False
+        """
+        key = self._key(key)
+        if key in self.current:
+            self.suppressed += 1
+            return False
+        if key in self.previous:
+            # 仍在出现的键移到当前一代，避免轮换时被丢弃
+            self.previous.discard(key)
+            self.current.add(key)
+            self.suppressed += 1
+            return False
+        self.current.add(key)
+        if len(self.current) >= self.capacity // 2:
+            self.previous = self.current
+            self.current = set()
+        return True
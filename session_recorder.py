@@ -0,0 +1,437 @@
+import os
+import gzip
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from requests.structures import CaseInsensitiveDict
+from selenium.common import exceptions as selenium_exceptions
+import config
+import http_client
+from download_method import print, cprint
+from checkpoint import PendingQueue
+
+"""
+爬取会话录制与回放模块
+
+录制: config.record_session设置为归档文件路径（如session.jsonl.gz）后，download_media会记录
+浏览器返回给爬虫的所有数据（每次提取的推文单元、滚动等待的结果、performance日志中的时间线接口事件、
+GraphQL响应内容）以及每个媒体请求的状态码、响应头和大小（不保存媒体内容），写入gzip压缩的JSON Lines归档。
+
+回放: ReplayDriver按录制的顺序返回浏览器数据，http_client的回放钩子按录制的响应头返回同样大小的内容，
+同一份输入离线地再次经过生产者/消费者流程，不需要浏览器和网络，可以比较不同版本的
+CPU时间、队列等待时间和下载调度。
+
+录制和回放期间异步下载引擎使用线程池执行下载，所有请求都经过http_client。
+回放时只支持batch提取模式(config.extract_mode)，element模式的WebElement无法录制。
+
+主要类:
+- SessionRecorder: 录制会话
+- SessionReplayer: 回放会话
+- ReplayDriver: 按录制内容响应的WebDriver替身
+- TimedQueue: 统计队列等待时间的下载队列
+- TimedPendingQueue: 同时记录断点的TimedQueue
+
+主要函数:
+- replay: 回放归档并输出统计
+
+命令行用法:
+    python session_recorder.py 归档.jsonl.gz [--output 回放结果文件夹] [--speed 1]
+"""
+
+ARCHIVE_VERSION = 1
+RECORDED_HEADERS = ('Content-Length', 'Content-Type', 'Content-Range', 'Content-Encoding', 'Accept-Ranges')
+# 需要记录的接口响应，与graphql_capture.TIMELINE_KEYWORDS一致
+TIMELINE_KEYWORDS = ('SearchTimeline', 'UserMedia', 'UserTweets')
+
+
+def script_key(script):
+    """脚本内容的短哈希，用作录制记录的键"""
+    return hashlib.sha1(script.encode('utf-8')).hexdigest()[:12]
+
+
+def _jsonable(value):
+    """WebElement等无法序列化的返回值记录为None"""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return None
+
+
+class TimedQueue(queue.Queue):
+    """下载队列，统计每个任务从加入队列到被取出的等待时间"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = []
+        self.put_count = 0
+
+    def _put(self, item):
+        self.put_count += 1
+        super()._put((time.perf_counter(), item))
+
+    def _get(self):
+        queued_at, item = super()._get()
+        self.waits.append(time.perf_counter() - queued_at)
+        return item
+
+    def stats(self):
+        waits = sorted(self.waits)
+        if not waits:
+            return {"queued": self.put_count, "wait_mean_ms": 0, "wait_p95_ms": 0, "wait_max_ms": 0}
+        return {
+            "queued": self.put_count,
+            "wait_mean_ms": round(sum(waits) / len(waits) * 1000, 3),
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3),
+            "wait_max_ms": round(waits[-1] * 1000, 3),
+        }
+
+
+class TimedPendingQueue(TimedQueue, PendingQueue):
+    """同时记录断点pending的TimedQueue，通过main.run_twitter_crawler录制时下载队列总是带断点"""
+
+
+class _Session:
+    """录制和回放共用的统计：墙钟时间、进程CPU时间和队列等待时间"""
+
+    def __init__(self):
+        self.queue = None
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def new_queue(self, checkpoint=None):
+        """创建统计等待时间的下载队列，checkpoint不为None时同时记录断点的pending"""
+        self.queue = TimedQueue() if checkpoint is None else TimedPendingQueue(checkpoint)
+        return self.queue
+
+    def report(self):
+        stats = {
+            "wall_sec": round(time.perf_counter() - self.started, 3),
+            "cpu_sec": round(time.process_time() - self.cpu_started, 3),
+        }
+        if self.queue is not None:
+            stats.update(self.queue.stats())
+        return stats
+
+
+class SessionRecorder(_Session):
+    def __init__(self, path, params):
+        """
+        Args:
+            path: 归档文件路径
+            params: download_media的参数（user_choice、is_media、start_time、end_time、backend），回放时使用
+        """
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.timeline_requests = set()  # 已记录的时间线接口请求ID
+        self._write({"type": "header", "version": ARCHIVE_VERSION, "params": params,
+                     "created": time.strftime('%Y-%m-%d %H:%M:%S')})
+        http_client.set_hook(self)
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line)
+
+    def record_call(self, method, key, func, *args):
+        """调用浏览器方法并记录返回值或异常"""
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self._write({"type": "driver", "method": method, "key": key, "error": type(e).__name__,
+                         "message": str(e)[:200], "duration": round(time.perf_counter() - started, 4)})
+            raise
+        self._write({"type": "driver", "method": method, "key": key, "result": self._filter(method, result),
+                     "duration": round(time.perf_counter() - started, 4)})
+        return result
+
+    def _filter(self, method, result):
+        if method == "find_elements":
+            return len(result)
+        if method != "get_log":
+            return _jsonable(result)
+        # performance日志只保留时间线接口的响应事件，其余网络事件不需要回放
+        kept = []
+        for entry in result:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            params = message.get("params", {})
+            if message.get("method") == "Network.responseReceived":
+                response = params.get("response", {})
+                if "json" in response.get("mimeType", "") and any(k in response.get("url", "") for k in TIMELINE_KEYWORDS):
+                    self.timeline_requests.add(params.get("requestId"))
+                    kept.append(entry)
+            elif (message.get("method") in ("Network.loadingFinished", "Network.loadingFailed")
+                  and params.get("requestId") in self.timeline_requests):
+                # 请求结束（完成或失败）后不再需要记住该请求
+                self.timeline_requests.discard(params.get("requestId"))
+                kept.append(entry)
+        return kept
+
+    def wrap_driver(self, driver):
+        return RecordingDriver(driver, self)
+
+    def _record_response(self, url, headers, response, size, started):
+        self._write({
+            "type": "http",
+            "url": url,
+            "range": (headers or {}).get('Range'),
+            "status": response.status_code,
+            "headers": {k: response.headers[k] for k in RECORDED_HEADERS if k in response.headers},
+            "size": size,
+            "duration": round(time.perf_counter() - started, 4),
+        })
+
+    def get(self, send, url, **kwargs):
+        started = time.perf_counter()
+        response = send(url, **kwargs)
+        self._record_response(url, kwargs.get('headers'), response, len(response.content), started)
+        return response
+
+    @contextmanager
+    def stream(self, send, url, timeout=10, headers=None):
+        started = time.perf_counter()
+        with send(url, timeout=timeout, headers=headers) as response:
+            counted = _CountingStream(response)
+            try:
+                yield counted
+            finally:
+                self._record_response(url, headers, response, counted.size, started)
+
+    def close(self):
+        http_client.set_hook(None)
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        stats = self.report()
+        cprint(f"会话已录制到: {self.path}，{json.dumps(stats, ensure_ascii=False)}", "green")
+        return stats
+
+
+class _CountingStream:
+    """统计流式读取的字节数"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.response = response
+        self.size = 0
+
+    def iter_chunks(self, chunk_size):
+        for chunk in self.response.iter_chunks(chunk_size):
+            self.size += len(chunk)
+            yield chunk
+
+
+class RecordingDriver:
+    """包装真实的WebDriver，记录爬虫读取的浏览器数据，其他属性和方法直接转发"""
+
+    def __init__(self, driver, recorder):
+        self._driver = driver
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def execute_script(self, script, *args):
+        return self._recorder.record_call("execute_script", script_key(script), self._driver.execute_script, script, *args)
+
+    def execute_async_script(self, script, *args):
+        return self._recorder.record_call("execute_async_script", script_key(script),
+                                          self._driver.execute_async_script, script, *args)
+
+    def get_log(self, log_type):
+        return self._recorder.record_call("get_log", log_type, self._driver.get_log, log_type)
+
+    def execute_cdp_cmd(self, cmd, params):
+        key = f"{cmd}:{params.get('requestId', '')}"
+        return self._recorder.record_call("execute_cdp_cmd", key, self._driver.execute_cdp_cmd, cmd, params)
+
+    def find_elements(self, by, value):
+        return self._recorder.record_call("find_elements", f"{by}:{value}", self._driver.find_elements, by, value)
+
+
+class _ReplayResponse:
+    """按录制的状态码和响应头返回同样大小的内容（全零字节）"""
+
+    def __init__(self, record):
+        self.status_code = record["status"]
+        self.headers = CaseInsensitiveDict(record["headers"])
+        self.size = record["size"]
+
+    @property
+    def content(self):
+        return bytes(self.size)
+
+    def iter_chunks(self, chunk_size):
+        remaining = self.size
+        while remaining > 0:
+            n = min(remaining, chunk_size)
+            remaining -= n
+            yield bytes(n)
+
+
+class SessionReplayer(_Session):
+    def __init__(self, path, speed=0):
+        """
+        Args:
+            path: 归档文件路径
+            speed: 按录制时的耗时回放浏览器等待和媒体请求，1为原速，2为两倍速，0为不等待
+        """
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.params = {}
+        self.driver_records = defaultdict(deque)  # (方法, 键) -> 按顺序的记录
+        self.http_records = defaultdict(deque)  # (链接, Range) -> 按顺序的记录
+        self.lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "header":
+                    if record["version"] != ARCHIVE_VERSION:
+                        raise ValueError(f"不支持的归档版本: {record['version']}")
+                    self.params = record["params"]
+                elif record["type"] == "driver":
+                    self.driver_records[(record["method"], record["key"])].append(record)
+                elif record["type"] == "http":
+                    self.http_records[(record["url"], record["range"])].append(record)
+        http_client.set_hook(self)
+
+    def _wait(self, record):
+        if self.speed and record.get("duration"):
+            time.sleep(record["duration"] / self.speed)
+
+    def next_driver_result(self, method, key):
+        """返回该调用的下一条录制结果，录制中没有（或已用完）时返回None"""
+        with self.lock:
+            records = self.driver_records.get((method, key))
+            record = records.popleft() if records else None
+        if record is None:
+            return None
+        self._wait(record)
+        if "error" in record:
+            error_class = getattr(selenium_exceptions, record["error"], selenium_exceptions.WebDriverException)
+            raise error_class(record.get("message"))
+        return record["result"]
+
+    def wrap_driver(self, driver=None):
+        return ReplayDriver(self)
+
+    def _next_response(self, url, headers):
+        key = (url, (headers or {}).get('Range'))
+        with self.lock:
+            records = self.http_records.get(key)
+            if not records:
+                return _ReplayResponse({"status": 404, "headers": {"Content-Length": "0"}, "size": 0})
+            # 同一请求有多条记录时按顺序返回，最后一条重复使用
+            record = records.popleft() if len(records) > 1 else records[0]
+        self._wait(record)
+        return _ReplayResponse(record)
+
+    def get(self, send, url, **kwargs):
+        return self._next_response(url, kwargs.get('headers'))
+
+    @contextmanager
+    def stream(self, send, url, timeout=10, headers=None):
+        yield self._next_response(url, headers)
+
+    def close(self):
+        http_client.set_hook(None)
+        return self.report()
+
+
+class ReplayDriver:
+    """WebDriver替身：爬虫读取的浏览器数据按录制的顺序返回，页面操作不做任何事"""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.current_url = "about:blank"
+        self.window_handles = ["replay"]
+
+    def execute_script(self, script, *args):
+        return self.replayer.next_driver_result("execute_script", script_key(script))
+
+    def execute_async_script(self, script, *args):
+        return self.replayer.next_driver_result("execute_async_script", script_key(script))
+
+    def get_log(self, log_type):
+        return self.replayer.next_driver_result("get_log", log_type) or []
+
+    def execute_cdp_cmd(self, cmd, params):
+        return self.replayer.next_driver_result("execute_cdp_cmd", f"{cmd}:{params.get('requestId', '')}") or {}
+
+    def find_elements(self, by, value):
+        return [None] * (self.replayer.next_driver_result("find_elements", f"{by}:{value}") or 0)
+
+    def get(self, url):
+        self.current_url = url
+
+    def refresh(self):
+        pass
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+    def quit(self):
+        pass
+
+
+def replay(path, output_folder=None, speed=0):
+    """
+    离线回放录制的会话，媒体写入output_folder
+
+    Returns:
+        统计信息：墙钟时间、CPU时间、队列任务数和等待时间、下载结果
+    """
+    import manifest
+    from manga_downloader import download_media
+    from download_method import set_target_folder
+
+    replayer = SessionReplayer(path, speed)
+    params = replayer.params
+    output_folder = output_folder or f"replay_{time.strftime('%Y%m%d_%H%M%S')}"
+    video_folder = os.path.join(output_folder, "video & gif")
+    os.makedirs(video_folder, exist_ok=True)
+    set_target_folder(output_folder)
+
+    # 跨运行媒体索引会复用之前下载的文件，回放时不使用，保证每次回放的输入相同
+    media_index_path, config.media_index = config.media_index, ""
+    try:
+        download_media(None, output_folder, video_folder, params["user_choice"], params["is_media"],
+                       params.get("start_time"), params.get("end_time"), params.get("backend"), session=replayer)
+    finally:
+        config.media_index = media_index_path
+        stats = replayer.close()
+
+    summary = manifest.summarize(os.path.join(output_folder, manifest.MANIFEST_NAME))
+    stats["downloads"] = {}
+    for entry in summary.values():
+        stats["downloads"][entry["status"]] = stats["downloads"].get(entry["status"], 0) + 1
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线回放录制的爬取会话")
+    parser.add_argument("archive", help="录制的归档文件(.jsonl.gz)")
+    parser.add_argument("--output", default=None, help="回放结果文件夹，默认replay_时间")
+    parser.add_argument("--speed", type=float, default=0, help="按录制时的耗时回放，1为原速，0为不等待")
+    args = parser.parse_args()
+
+    result = replay(args.archive, args.output, args.speed)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -8,6 +8,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
+import config
 
 # 资源路径处理函数
 def get_resource_path(relative_path):
@@ -41,7 +42,7 @@ def init_browser():
 browser = init_browser()
 
 try:
-    browser.get("https://x.com/i/flow/login")
+    browser.get(f"{config.x_base_url}/i/flow/login")
     print("\033[93m请在浏览器中登录X账号,登录完成后可手动关闭浏览器或等待90秒自动关闭\033[0m")
     
     # 等待90秒或直到浏览器关闭
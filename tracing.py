@@ -0,0 +1,258 @@
+import os
+import glob
+import json
+import time
+import atexit
+import tempfile
+import itertools
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from functools import wraps
+import config
+
+"""
+爬取阶段的耗时追踪模块
+
+设置config.trace_path后，记录浏览器启动、注入cookie、查找元素、提取推文单元、滚动等待、
+下载队列交接和每个HTTP下载的开始和结束时间，保存为Chrome trace event格式的JSON，
+可以在Perfetto(https://ui.perfetto.dev)或chrome://tracing中打开，按线程查看生产者、
+消费者和下载线程的时间花在了哪里。
+
+未设置config.trace_path时span()返回空的上下文管理器，几乎没有额外开销。
+
+批量爬取(batch_runner.py)的工作进程各自写入trace.<进程号>.json，不会互相覆盖，全部任务结束后由
+merge合并为config.trace_path。时间戳使用Unix时间（微秒），不同进程的事件可以直接合并到同一时间轴。
+
+事件格式:
+- 同步阶段为完整事件(ph=X)，按线程显示，同一线程中的事件按调用关系嵌套
+- 异步下载引擎中在同一个事件循环里交错进行的下载为异步事件(ph=b/e)，各自显示为一条轨道
+
+主要函数:
+- span: 记录with块的耗时
+- async_span: 记录可能与同一线程中其他操作交错的耗时（协程中使用）
+- traced: 记录函数每次调用耗时的装饰器
+- save: 将已记录的事件写入config.trace_path（程序退出时也会自动保存）
+- process_path: 当前进程的trace文件路径（工作进程加上进程号）
+- merge: 合并各工作进程的trace文件
+"""
+
+MAX_EVENTS = 1_000_000  # 最多保留的事件数，超出后丢弃新事件，限制长时间爬取的内存占用
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self, path):
+        """
+        Args:
+            path: trace JSON文件路径
+        """
+        self.path = path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+        self.origin_us = time.time() * 1e6  # perf_counter的起点对应的Unix时间
+        self.events = []
+        self.dropped = 0
+        self.thread_ids = set()  # 已记录名称的线程
+        self.async_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.events.append({"ph": "M", "name": "process_name", "pid": self.pid, "tid": 0,
+                            "args": {"name": "twitter_crawler"}})
+
+    def now(self):
+        """当前的Unix时间（微秒），由perf_counter计算，不受系统时间调整影响"""
+        return self.origin_us + (time.perf_counter_ns() - self.origin) / 1000
+
+    def add(self, event):
+        tid = threading.get_ident()
+        event["pid"] = self.pid
+        event["tid"] = tid
+        with self.lock:
+            if len(self.events) >= MAX_EVENTS:
+                self.dropped += 1
+                return
+            if tid not in self.thread_ids:
+                self.thread_ids.add(tid)
+                self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid,
+                                    "args": {"name": threading.current_thread().name}})
+            self.events.append(event)
+
+    def save(self, path=None):
+        """写入临时文件后原子替换，追踪过程中可以多次保存"""
+        path = path or self.path
+        with self.lock:
+            events = list(self.events)
+            dropped = self.dropped
+        _write_trace(path, events, dropped)
+        return path
+
+
+def _write_trace(path, events, dropped=0):
+    data = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"dropped_events": dropped}}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event = {"ph": "X", "name": self.name, "cat": self.cat, "ts": self.start,
+                 "dur": self.tracer.now() - self.start}
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        if self.args:
+            event["args"] = self.args
+        self.tracer.add(event)
+        return False
+
+
+class _AsyncSpan(_Span):
+    __slots__ = ("id",)
+
+    def __enter__(self):
+        self.id = next(self.tracer.async_ids)
+        self.tracer.add({"ph": "b", "name": self.name, "cat": self.cat, "id": self.id,
+                         "ts": self.tracer.now(), "args": self.args})
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event = {"ph": "e", "name": self.name, "cat": self.cat, "id": self.id, "ts": self.tracer.now()}
+        if exc_type is not None:
+            event["args"] = {"error": exc_type.__name__}
+        self.tracer.add(event)
+        return False
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def process_path(path, pid=None):
+    """
+    当前进程的trace文件路径：主进程为path本身，multiprocessing的工作进程为path加上进程号
+    （如trace.json -> trace.1234.json），多个进程不会写同一个文件
+    """
+    if pid is None:
+        if multiprocessing.parent_process() is None:
+            return path
+        pid = os.getpid()
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pid}{ext}"
+
+
+def merge(path=None, remove=True):
+    """
+    将各工作进程的trace文件合并到path（默认config.trace_path），覆盖之前运行留下的path
+
+    Args:
+        remove: 合并后是否删除各进程的文件
+
+    Returns:
+        合并后的文件路径，没有需要合并的文件时返回None
+    """
+    path = path or config.trace_path
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    parts = sorted(glob.glob(glob.escape(root) + ".[0-9]*" + glob.escape(ext)))
+    if not parts:
+        return None
+    events = []
+    dropped = 0
+    for part in parts:
+        try:
+            with open(part, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取追踪文件失败: {part} {str(e)}")
+            continue
+        events.extend(data.get("traceEvents", []))
+        dropped += data.get("otherData", {}).get("dropped_events", 0)
+    _write_trace(path, events, dropped)
+    if remove:
+        for part in parts:
+            os.remove(part)
+    return path
+
+
+def get_tracer():
+    """获取全局追踪器，未设置config.trace_path时返回None"""
+    global _tracer
+    if _tracer is None and config.trace_path:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(process_path(config.trace_path))
+                atexit.register(save)
+    return _tracer
+
+
+def span(name, cat="crawl", **args):
+    """
+    记录with块的耗时
+
+    Args:
+        name: 阶段名称
+        cat: 分类，可在Perfetto中按分类筛选
+        args: 附加信息（如url、数量），显示在事件详情中
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, cat, args)
+
+
+def async_span(name, cat="crawl", **args):
+    """与span相同，但记录为异步事件，用于同一线程中交错进行的操作（如事件循环中的多个下载）"""
+    tracer = get_tracer()
+    if tracer is None:
+        return _NULL_SPAN
+    return _AsyncSpan(tracer, name, cat, args)
+
+
+def traced(name=None, cat="crawl"):
+    """记录函数每次调用耗时的装饰器，name默认为函数名"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = get_tracer()
+            if tracer is None:
+                return func(*args, **kwargs)
+            with _Span(tracer, span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def save():
+    """将已记录的事件写入trace文件，未开启追踪时不做任何事"""
+    if _tracer is None:
+        return None
+    try:
+        path = _tracer.save()
+    except OSError as e:
+        print(f"保存追踪文件失败: {str(e)}")
+        return None
+    print(f"追踪文件已保存: {path}（可在https://ui.perfetto.dev中打开）")
+    return path
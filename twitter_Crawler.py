@@ -5,11 +5,15 @@ import threading
 import sys
 from selenium.common.exceptions import TimeoutException
 from manga_downloader import download_media
-from driver_init import initialize_driver, cookies_web
+from driver_init import initialize_driver, cookies_web, needs_network_capture
+import browser_pool
+from search_query import build_search_url, date_range, format_search_time
 from config import tag, user_choice, start_time, end_time
 from termcolor import cprint as original_cprint
 from datetime import datetime
 from download_method import print, cprint  # 导入日志打印函数
+import manifest
+import crawl_state
 
 """
 Twitter爬虫工具 1.0版本
@@ -47,23 +51,9 @@ class TwitterCrawlerState:
         """清理所有资源"""
         self.running = False
         if self.driver:
-            try:
-                # 关闭所有窗口
-                for handle in self.driver.window_handles:
-                    self.driver.switch_to.window(handle)
-                    self.driver.close()
-                self.driver.quit()
-            except Exception as e:
-                print(f"关闭浏览器时发生错误: {str(e)}")
-                # 强制结束进程
-                try:
-                    import psutil
-                    process = psutil.Process(self.driver.service.process.pid)
-                    process.terminate()
-                except:
-                    pass
-            finally:
-                self.driver = None
+            # 归还浏览器池，程序退出时由浏览器池统一关闭
+            browser_pool.release(self.driver)
+            self.driver = None
         
         # 等待所有下载线程结束
         for thread in self.download_threads:
@@ -103,18 +93,9 @@ if __name__ == "__main__":
             
         cprint(f"\n将爬取 {start_time} 到 {end_time} 之间的帖子\n", "red")
 
-        crawler_state.driver = initialize_driver()
-
-        # 尝试访问X/Twitter登录页面
+        # 从浏览器池获取已登录的浏览器
         try:
-            crawler_state.driver.get('https://x.com/i/flow/login')
-        except TimeoutException:
-            crawler_state.driver.execute_script('window.stop()')
-        crawler_state.driver.set_page_load_timeout(60)
-
-        try:
-            crawler_state.driver.get('https://x.com')  # 先访问一次目标域名
-            cookies_web(crawler_state.driver, "X_cookie.json")
+            crawler_state.driver = browser_pool.acquire(capture_network=needs_network_capture(user_choice))
         except Exception as e:
             print(f"访问失败，请检查网络连接: {str(e)}")
             crawler_state.cleanup()
@@ -122,7 +103,7 @@ if __name__ == "__main__":
             
         # 访问特定的Twitter页面
         print("访问推特页面中.....")
-        target_url = f"https://x.com/search?q={tag}&src=typed_query&f=live" # 最新页面进行爬取
+        target_url = build_search_url(tag, *date_range(start_time, end_time)) # 最新页面进行爬取，使用since:/until:限定时间范围
         crawler_state.driver.get(target_url)
         print("准备获取数据中.....")
 
@@ -148,8 +129,16 @@ if __name__ == "__main__":
         # 下载图片和视频
         cprint(f"开始爬取数据...., url为：{target_url}", "yellow")
         
+        # 增量爬取：读取该搜索条件上次完整爬取时的高水位，到达后停止
+        state = crawl_state.get_state()
+        state_key = crawl_state.query_key(tag, format_search_time(date_range(start_time, end_time)[0]), user_choice)
+        progress = crawl_state.CrawlProgress(state.high_water_id(state_key) if state else None)
+
         try:
-            download_media(crawler_state.driver, folder, video_folder, user_choice, is_media, start_time, end_time)
+            download_media(crawler_state.driver, folder, video_folder, user_choice, is_media, start_time, end_time,
+                           progress=progress)
+            if state and state.commit(state_key, progress):
+                print(f"已更新增量爬取位置: 推文ID {progress.newest_id}")
             
         except KeyboardInterrupt:
             print("\n检测到用户中断，正在安全退出...")
@@ -160,9 +149,10 @@ if __name__ == "__main__":
             
             # 显示下载统计
             try:
-                print(f'\n共下载 {len([f for f in os.listdir(folder) if f.endswith(".png")])} 张图片')
+                manifest_file = os.path.join(folder, manifest.MANIFEST_NAME)
+                print(f'\n共下载 {manifest.count_downloaded(manifest_file, "image")} 张图片')
                 if "2" in user_choice or "3" in user_choice:
-                    print(f'共下载 {len(os.listdir(video_folder))} 个视频')
+                    print(f'共下载 {manifest.count_downloaded(manifest_file, "video")} 个视频')
             except Exception as e:
                 print(f"统计文件数量时发生错误: {str(e)}")
             
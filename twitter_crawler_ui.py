@@ -11,12 +11,14 @@ import sys
 from contextlib import redirect_stdout
 import twitter_Crawler
 import main as crawler_main
+import browser_pool
 import config
 import signal
 import json
 import importlib
 import time
 import logging
+import multiprocessing
 from pathlib import Path
 
 # 导入工具模块
@@ -562,6 +564,14 @@ class TwitterCrawlerUI(QMainWindow):
             self.output_text.append("\n正在停止爬虫...")
             self.stop_button.setEnabled(False)
 
+    def closeEvent(self, event):
+        # 窗口关闭时停止爬虫并关闭浏览器池中保持登录的浏览器
+        if self.crawler_thread and self.crawler_thread.isRunning():
+            self.crawler_thread.stop()
+            self.crawler_thread.wait(10000)
+        browser_pool.shutdown()
+        event.accept()
+
     def update_output(self, text):
         # 移除文本中的额外换行符
         text = text.rstrip('\n')
@@ -627,7 +637,7 @@ class TwitterCrawlerUI(QMainWindow):
 
 tag = "{config.tag}" # 需要爬取的tag
 user_choice = '{config.user_choice}' # 设置下载选项，1为图片，2为视频，3为GIF动图，123为全部，目前暂时只支持图片
-late_time = {config.late_time} # 设置延迟时间，每隔4s向下滑动，为保险可设置10-5之间最佳，建议默认
+late_time = {config.late_time} # 每次滚动后等待新推文加载的最长时间(秒)，新推文出现后立即继续滚动，建议默认
 
 date_flag = {str(config.date_flag)} # 设置是否根据日期进行爬取，true为获取全部，false为到指定时间
 
@@ -637,6 +647,58 @@ end_time = '{config.end_time}' # 设置结束的获取日期，格式为2023-10-
 
 # 按热度（点赞数）爬取时设置，爬取多少条带图片的推文
 urls_num = {config.urls_num}
+
+# 推文提取模式，batch为每次滚动只执行一次execute_script批量提取，element为逐元素提取（旧模式，较慢）
+extract_mode = "{config.extract_mode}"
+
+# 获取推文的方式，dom为解析页面元素，graphql为拦截SearchTimeline等接口响应（可获取已被页面回收的推文及视频）
+crawl_backend = "{config.crawl_backend}"
+
+# 下载连接池设置，http_pool_size为每个主机保持的keep-alive连接数，建议不小于图片和视频下载线程数之和
+http_pool_size = {config.http_pool_size}
+http2 = {str(config.http2)} # 是否启用HTTP/2多路复用，需要先安装httpx[http2]
+
+# 下载引擎，thread为每个文件一个线程，async为单个事件循环的异步下载引擎（建议安装aiohttp和aiofiles）
+download_engine = "{config.download_engine}"
+async_concurrency = {config.async_concurrency} # 异步下载引擎同时进行的最大下载数
+
+# 跨运行的媒体索引（SQLite）文件路径（如"media_index.db"），已下载过的媒体硬链接到新的结果文件夹，不再重复下载，为空时不启用
+media_index = "{config.media_index}"
+
+# 感知哈希去重（需要安装Pillow），图片下载后检测与已有图片近似重复的转发图
+phash_dedup = {str(config.phash_dedup)}
+phash_threshold = {config.phash_threshold} # 判定为近似重复的最大汉明距离（64位dHash）
+phash_action = "{config.phash_action}" # link为替换为已有图片的硬链接，delete为直接删除
+phash_workers = {config.phash_workers} # 计算哈希的进程数，0为CPU核心数
+
+# 控制台输出设置
+console_color = {str(config.console_color)} # 控制台是否输出彩色文字，False时输出纯文本（日志文件始终不含颜色信息）
+
+# 页面滚动设置，每次滚动的等待时间见late_time
+max_scroll_stalls = {config.max_scroll_stalls} # 连续多少次滚动都没有新内容时认为已到达时间线末尾，等待时间按指数退避
+
+# 浏览器设置
+lean_crawl = {str(config.lean_crawl)} # 精简模式：无头浏览器、屏蔽图片/视频/字体加载、较小窗口，调试时可设为False显示浏览器窗口
+browser_pool_size = {config.browser_pool_size} # 浏览器池中最多保持的已登录浏览器数量，多次爬取之间复用
+
+# 批量爬取设置(batch_runner.py)，多个标签或时间分片由多个工作进程并行爬取
+tags = {config.tags!r} # 批量爬取(batch_runner.py)的标签列表，如["标签1", "标签2"]，为空时只爬取tag
+batch_workers = {config.batch_workers} # 批量爬取时的工作进程数，每个进程启动一个浏览器
+shard_unit = "{config.shard_unit}" # 批量爬取时按时间切分的单位，day为按天，hour为按小时，为空时不切分；分片使用since:/until:搜索并行爬取
+
+# 增量爬取和断点续爬设置
+incremental = {str(config.incremental)} # 增量爬取：记录每个标签上次完整爬取时的最新推文，下次爬取到达该位置时停止，不再重复滚动旧内容
+crawl_state_path = "{config.crawl_state_path}" # 增量爬取的高水位记录文件
+checkpoint_interval = {config.checkpoint_interval} # 按时间爬取时保存爬取断点的间隔(秒)，中断后可使用python main.py --resume继续
+
+# 推文去重设置
+seen_set_capacity = {config.seen_set_capacity} # 按推文ID去重时最多记住的推文数量，超出后丢弃最早的一半，限制长时间爬取的内存占用
+
+# 测试和性能分析设置
+x_base_url = "{config.x_base_url}" # X的网址，使用本地模拟服务器(mock_x_server.py)测试时改为如"http://127.0.0.1:8080"
+record_session = "{config.record_session}" # 录制爬取会话的归档文件路径（如"session.jsonl.gz"），为空时不录制；使用python session_recorder.py 归档文件 离线回放
+metrics_port = {config.metrics_port} # 运行指标(Prometheus格式)接口的端口，如9100，爬取时可访问http://127.0.0.1:端口/metrics查看；为0时不启动
+trace_path = "{config.trace_path}" # 阶段耗时追踪文件路径（如"trace.json"），为空时不追踪；生成的Chrome trace JSON可在https://ui.perfetto.dev中打开
 '''
             # 写入文件
             config_path = 'config.py'
@@ -655,6 +717,9 @@ urls_num = {config.urls_num}
             QMessageBox.critical(self, '错误', error_msg)
 
 def main():
+    # 打包为exe后，感知哈希去重使用的进程池需要freeze_support
+    multiprocessing.freeze_support()
+    
     # 在主线程中设置信号处理
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     signal.signal(signal.SIGTERM, signal.SIG_DFL)